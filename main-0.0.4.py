@@ -1,15 +1,34 @@
+import collections
+import concurrent.futures
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import hashlib
+import heapq
+import mmap
+import multiprocessing
 import os
+import queue
+import re
+import select
 import shutil
+import sqlite3
+import stat
+import struct
 import sys
+import threading
 import time
 
-from PyQt6.QtCore import QDir, QSize, pyqtSignal, Qt, QFileInfo, QFile, QMimeData, \
-    QItemSelectionModel, QPoint, QUrl, QStorageInfo
+from PyQt6.QtCore import QObject, QDir, QSize, pyqtSignal, Qt, QFileInfo, QFile, QMimeData, \
+    QItemSelectionModel, QPoint, QUrl, QStandardPaths, QThread, QAbstractListModel, QModelIndex, \
+    QTimer, QRectF, QMimeDatabase
 from PyQt6.QtGui import QFileSystemModel, QIcon, QPixmap, QAction, QCursor, QGuiApplication, QFontDatabase, \
-    QFont, QFontMetrics, QDesktopServices, QStandardItemModel, QStandardItem
+    QFont, QFontMetrics, QDesktopServices, QPainter, QColor
 from PyQt6.QtWidgets import QMainWindow, QApplication, QListView, QHBoxLayout, QWidget, QLabel, QVBoxLayout, QFrame, \
     QToolBar, QScrollArea, QSizePolicy, QMenu, QLineEdit, QInputDialog, QMessageBox, QPushButton, QDialog, \
-    QAbstractItemView, QDialogButtonBox, QGridLayout
+    QAbstractItemView, QDialogButtonBox, QGridLayout, QCheckBox, QComboBox, QTableWidget, QTableWidgetItem, \
+    QHeaderView, QToolTip, QTabWidget, QProgressBar, QProgressDialog
 
 style_sheet = """
 QFrame#sbFrame{
@@ -20,6 +39,1549 @@ QFrame#tbFrame{
     border-radius: 2px;}    
 """
 
+# How much of a file is read to tell text from binary
+CONTENT_SNIFF_SIZE = 8192
+# Shown name -> hashlib name of the checksums offered in Properties
+CHECKSUM_ALGORITHMS = {"MD5": "md5", "SHA-1": "sha1", "SHA-256": "sha256", "BLAKE2b": "blake2b"}
+
+# Pseudo filesystems that are never worth walking when searching from "/"
+SKIP_DIRS = {"/proc", "/sys", "/dev"}
+PSEUDO_FS_TYPES = {"proc", "sysfs", "devtmpfs", "devpts", "cgroup", "cgroup2", "securityfs", "debugfs",
+                   "tracefs", "pstore", "bpf", "configfs", "fusectl", "mqueue", "hugetlbfs", "autofs", "binfmt_misc",
+                   "efivarfs", "rpc_pipefs", "nsfs", "selinuxfs"}
+
+
+def cacheDirectory():
+    # Per-user cache folder (e.g. ~/.cache/tanzanite) for the search index and other caches
+    base = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericCacheLocation)
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "tanzanite")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def unescapeMountPath(path):
+    # /proc/self/mounts writes spaces, tabs and newlines in mount points as octal escapes (\040)
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), path)
+
+
+def pseudoMountPoints():
+    # Mount points that a walk must never descend into, e.g. /proc, /sys and /dev wherever they are mounted
+    points = set(SKIP_DIRS)
+    try:
+        with open("/proc/self/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) >= 3 and fields[2] in PSEUDO_FS_TYPES:
+                    points.add(unescapeMountPath(fields[1]))
+    except OSError:
+        pass
+    points.discard("/")
+    return points
+
+
+Mount = collections.namedtuple("Mount", "mount_point device fs_type source options")
+
+
+class MountTable:
+    """ The mounted filesystems from /proc/self/mountinfo, parsed again when the kernel flags a change """
+    MOUNTINFO = "/proc/self/mountinfo"
+    STATVFS_TTL = 2.0
+
+    def __init__(self):
+        self.mounts = {}
+        self.space = {}
+        self.lock = threading.Lock()
+        try:
+            fd = os.open(self.MOUNTINFO, os.O_RDONLY)
+        except OSError:
+            return
+        self.mounts = self.readMountInfo(fd)
+        threading.Thread(target=self.watch, args=(fd,), daemon=True).start()
+
+    @staticmethod
+    def readMountInfo(fd):
+        # id parent major:minor root mount_point options [optional fields...] - fs_type source super_options
+        chunks = []
+        offset = 0
+        while True:
+            chunk = os.pread(fd, 65536, offset)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+        mounts = {}
+        for line in b"".join(chunks).decode("utf-8", "surrogateescape").splitlines():
+            fields = line.split()
+            try:
+                separator = fields.index("-", 6)
+            except ValueError:
+                continue
+            mount_point = unescapeMountPath(fields[4])
+            # Mounts are listed in mount order, so a later mount on the same point hides the earlier one
+            mounts[mount_point] = Mount(mount_point, fields[2], fields[separator + 1],
+                                        unescapeMountPath(fields[separator + 2]), fields[5])
+        return mounts
+
+    def watch(self, fd):
+        poller = select.poll()
+        poller.register(fd, select.POLLPRI | select.POLLERR)
+        while True:
+            try:
+                poller.poll()
+                mounts = self.readMountInfo(fd)
+            except OSError:
+                return
+            with self.lock:
+                self.mounts = mounts
+                self.space = {}
+
+    def lookup(self, path):
+        """ Returns the Mount that holds path (symlinks resolved) or None """
+        path = os.path.realpath(path)
+        mounts = self.mounts
+        while True:
+            if path in mounts:
+                return mounts[path]
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    def freeSpace(self, path):
+        """ Returns (total, free, available) bytes of the filesystem that holds path, None if unknown """
+        mount = self.lookup(path)
+        mount_point = mount.mount_point if mount is not None else "/"
+        now = time.monotonic()
+        with self.lock:
+            cached = self.space.get(mount_point)
+        if cached is not None and now - cached[0] < self.STATVFS_TTL:
+            return cached[1]
+        try:
+            info = os.statvfs(mount_point)
+        except OSError:
+            return None
+        space = (info.f_blocks * info.f_frsize, info.f_bfree * info.f_frsize, info.f_bavail * info.f_frsize)
+        with self.lock:
+            self.space[mount_point] = (now, space)
+        return space
+
+
+class ParallelWalker:
+    """ Multi-threaded os.scandir walker, yields (directory, mtime, entries) per folder """
+    QUEUE_SIZE = 512
+
+    def __init__(self, root, workers=None, should_stop=None, skip=None, stat_dirs=False, stat_entries=False,
+                 on_error=None, on_enter=None):
+        self.root = root
+        self.on_error = on_error
+        # Called from the worker threads with each folder right before it is listed
+        self.on_enter = on_enter
+        self.stat_dirs = stat_dirs
+        # entries are (path, name, is_dir) with is_dir from d_type, stat_entries appends the lstat result (or None),
+        # the mtime of the folder is only taken with stat_dirs
+        self.stat_entries = stat_entries
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 2)
+        self.should_stop = should_stop
+        self.skip = pseudoMountPoints() if skip is None else skip
+        self.deques = [collections.deque() for _ in range(self.workers)]
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.pending = 0
+        self.stopped = False
+        self.results = queue.Queue(self.QUEUE_SIZE)
+
+    def __iter__(self):
+        return self.walk()
+
+    def walk(self):
+        self.deques[0].append(self.root)
+        self.pending = 1
+        threads = [threading.Thread(target=self.worker, args=(i,), daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        finished = 0
+        try:
+            while finished < self.workers:
+                batch = self.results.get()
+                if batch is None:
+                    finished += 1
+                elif self.should_stop and self.should_stop():
+                    break
+                else:
+                    yield batch
+        finally:
+            self.stop()
+            # Drain the queue so that no worker stays blocked on a full results queue
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    self.results.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self.work_available.notify_all()
+
+    def takeWork(self, i):
+        # Own work from the right (depth first), stolen work from the left, where the biggest subtrees wait
+        try:
+            return self.deques[i].pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.workers):
+            try:
+                return self.deques[(i + offset) % self.workers].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def worker(self, i):
+        own = self.deques[i]
+        while True:
+            directory = self.takeWork(i)
+            if directory is None:
+                with self.lock:
+                    # Nothing to steal, sleep until someone pushes work or the walk is over
+                    while not self.stopped and self.pending and not any(self.deques):
+                        self.work_available.wait()
+                    if self.stopped or not self.pending:
+                        break
+                continue
+
+            batch = []
+            subdirs = 0
+            mtime = None
+            if self.on_enter:
+                self.on_enter(directory)
+            try:
+                if self.stat_dirs:
+                    # Taken before listing, so a change during the scan shows up as a newer mtime later
+                    mtime = os.stat(directory).st_mtime
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            is_dir = False
+                        if is_dir and entry.path not in self.skip:
+                            own.append(entry.path)
+                            subdirs += 1
+                        if self.stat_entries:
+                            try:
+                                info = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                info = None
+                            batch.append((entry.path, entry.name, is_dir, info))
+                        else:
+                            batch.append((entry.path, entry.name, is_dir))
+            except OSError as e:
+                if self.on_error:
+                    self.on_error(directory, e)
+
+            with self.lock:
+                self.pending += subdirs - 1
+                if subdirs or not self.pending:
+                    self.work_available.notify_all()
+            if (batch or mtime is not None) and not self.put((directory, mtime, batch)):
+                break
+            if self.should_stop and self.should_stop():
+                self.stop()
+        self.results.put(None)
+
+    def put(self, batch):
+        while not self.stopped:
+            try:
+                self.results.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def walkTree(root, should_stop=None, workers=None):
+    # Flattened (path, name, is_dir) stream of a ParallelWalker
+    for directory, mtime, entries in ParallelWalker(root, workers, should_stop):
+        yield from entries
+
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2, "g": 1024 ** 3,
+              "gb": 1024 ** 3, "t": 1024 ** 4, "tb": 1024 ** 4}
+AGE_UNITS = {"s": 1, "min": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "y": 365 * 86400}
+# Younger than an age means a later modification time
+AGE_COMPARISONS = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
+SEARCH_FILTER = re.compile(r"^(ext|size|mtime|type|path|depth):(.+)$", re.IGNORECASE)
+FILTER_VALUE = re.compile(r"^(>=|<=|>|<|=)?(.+)$")
+FILTER_AMOUNT = re.compile(r"^(\d+(?:\.\d+)?)([a-z]*)$", re.IGNORECASE)
+
+
+def parseSearchQuery(text, now=None):
+    """ Splits a query such as "report ext:pdf,docx size:>10M mtime:<7d" into its name part
+    and SQL predicates over the index columns, so filters never need a stat per file.
+
+    ext:log,txt     extension (no dot), any of a comma separated list
+    size:>100M      size with >, <, >=, <= or = (default >=), units K, M, G, T
+    mtime:<7d       modified less than 7 days ago (> for older), units s, min, h, d, w, y,
+                    or a date: mtime:>2024-01-31
+    type:dir        dir/folder or file
+    path:/srv       anywhere below /srv, a relative value matches anywhere in the path
+    depth:<4        number of path components
+
+    Returns (name query, clauses, params) and raises ValueError for a malformed filter.
+    """
+    now = now or time.time()
+    terms = []
+    clauses = []
+    params = []
+    for word in text.split():
+        match = SEARCH_FILTER.match(word)
+        if match is None:
+            terms.append(word)
+            continue
+        key, value = match.group(1).lower(), match.group(2)
+        if key == "ext":
+            exts = [ext.lower().lstrip(".") for ext in value.split(",") if ext]
+            clauses.append(f"ext IN ({','.join('?' * len(exts))})")
+            params.extend(exts)
+        elif key == "type":
+            if value.lower() in ("dir", "folder", "d"):
+                clauses.append("is_dir = 1")
+            elif value.lower() in ("file", "f"):
+                clauses.append("is_dir = 0")
+            else:
+                raise ValueError(f"Unknown type '{value}', use type:dir or type:file")
+        elif key == "path":
+            if value.startswith("/"):
+                clauses.append("path >= ? AND path < ?")
+                params.extend(FileIndex.subtreeRange(value))
+            else:
+                clauses.append("instr(path, ?) > 0")
+                params.append(value)
+        else:
+            op, amount = FILTER_VALUE.match(value).groups()
+            if key == "depth":
+                if not amount.isdigit():
+                    raise ValueError(f"Invalid depth '{amount}'")
+                clauses.append(f"depth {op or '='} ?")
+                params.append(int(amount))
+            elif key == "size":
+                number = FILTER_AMOUNT.match(amount)
+                if number is None or number.group(2).lower() not in SIZE_UNITS:
+                    raise ValueError(f"Invalid size '{amount}', e.g. size:>100M")
+                clauses.append(f"size {op or '>='} ?")
+                params.append(int(float(number.group(1)) * SIZE_UNITS[number.group(2).lower()]))
+            else:
+                clauses.append(mtimeClause(op or "<", amount, now, params))
+    return " ".join(terms), clauses, params
+
+
+def mtimeClause(op, amount, now, params):
+    number = FILTER_AMOUNT.match(amount)
+    if number is not None and number.group(2).lower() in AGE_UNITS:
+        # An age: "less than 7 days old" means a modification time after now - 7 days
+        if op == "=":
+            raise ValueError("Use < or > with an age, e.g. mtime:<7d")
+        params.append(now - float(number.group(1)) * AGE_UNITS[number.group(2).lower()])
+        return f"mtime {AGE_COMPARISONS[op]} ?"
+    try:
+        day = time.mktime(time.strptime(amount, "%Y-%m-%d"))
+    except ValueError:
+        raise ValueError(f"Invalid mtime '{amount}', e.g. mtime:<7d or mtime:>2024-01-31")
+    if op == "=":
+        params.extend([day, day + 86400])
+        return "mtime >= ? AND mtime < ?"
+    params.append(day)
+    return f"mtime {op} ?"
+
+
+class FileIndex:
+    """ Persistent filename index stored in SQLite, searched through name trigrams """
+    SCHEMA_VERSION = 5
+    BATCH_SIZE = 5000
+    RECONCILE_CHUNK = 1000
+    FUZZY_CANDIDATES = 2000
+    PREFIX_CANDIDATES = 1000
+    # Posting list entries a fuzzy search looks at, per pass
+    SCAN_BUDGET = 20000
+    TYPO_POSTINGS = 5000
+    MMAP_SIZE = 1024 * 1024 * 1024
+    # Indexes that are dropped for a rebuild and created again after the bulk insert
+    BULK_INDEXES = {
+        "trigrams_tri": "trigrams (tri, entry_id)",
+        "entries_ext": "entries (ext)",
+        "entries_name": "entries (name COLLATE NOCASE)",
+        "entries_size": "entries (size)",
+        "entries_mtime": "entries (mtime)",
+    }
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(cacheDirectory(), "index.db")
+        self.local = threading.local()
+        self.createTables()
+
+    def connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread gets its own
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Searches jump around the entries and posting lists, mapped pages save a read() per page
+            conn.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+            self.local.conn = conn
+        return conn
+
+    def createTables(self):
+        conn = self.connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is not None and int(row[0]) != self.SCHEMA_VERSION:
+            # Old layout, throw it away and let the next build recreate everything
+            conn.execute("DROP TABLE IF EXISTS entries")
+            conn.execute("DROP TABLE IF EXISTS trigrams")
+            conn.execute("DROP TABLE IF EXISTS dirs")
+            conn.execute("DROP TABLE IF EXISTS trigram_stats")
+            conn.execute("DELETE FROM meta")
+        conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                            id INTEGER PRIMARY KEY,
+                            path TEXT UNIQUE NOT NULL,
+                            parent TEXT NOT NULL,
+                            name TEXT NOT NULL,
+                            is_dir INTEGER NOT NULL,
+                            depth INTEGER NOT NULL,
+                            mtime REAL,
+                            size INTEGER,
+                            ext TEXT NOT NULL DEFAULT '')""")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)")
+        conn.execute("CREATE TABLE IF NOT EXISTS trigrams (tri TEXT NOT NULL, entry_id INTEGER NOT NULL)")
+        for name, target in self.BULK_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL)")
+        # Posting list lengths, refreshed on every build, let fuzzy queries start from the rarest trigrams
+        conn.execute("CREATE TABLE IF NOT EXISTS trigram_stats (tri TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (str(self.SCHEMA_VERSION),))
+        conn.commit()
+
+    @staticmethod
+    def trigrams(text):
+        text = text.lower()
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    @staticmethod
+    def subtreeRange(path):
+        # Every path below `path` sorts between "path/" and "path0" ("0" follows "/" in ASCII)
+        path = path.rstrip("/")
+        return path + "/", path + "0"
+
+    def isBuilt(self):
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        return row is not None
+
+    def builtAt(self):
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        return float(row[0]) if row else None
+
+    def root(self):
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        return row[0] if row else None
+
+    def build(self, root="/", progress=None, should_stop=None):
+        conn = self.connection()
+        # The whole rebuild is one transaction, so readers keep seeing the old index until commit
+        conn.execute("BEGIN")
+        for name in self.BULK_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM trigrams")
+        conn.execute("DELETE FROM dirs")
+        conn.execute("DELETE FROM meta WHERE key = 'built'")
+
+        self.indexTree(root, progress, should_stop)
+        if should_stop and should_stop():
+            conn.rollback()
+            return False
+
+        # Building the indexes after the bulk insert is much faster than maintaining them row by row
+        for name, target in self.BULK_INDEXES.items():
+            conn.execute(f"CREATE INDEX {name} ON {target}")
+        conn.execute("DELETE FROM trigram_stats")
+        conn.execute("INSERT INTO trigram_stats SELECT tri, COUNT(*) FROM trigrams GROUP BY tri")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('built', ?)", (str(time.time()),))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (root,))
+        conn.commit()
+        return True
+
+    def indexTree(self, root, progress=None, should_stop=None, on_enter=None):
+        # Adds everything below root (not root itself) and returns the folders that were indexed.
+        # on_enter gets each folder before it is listed, see ParallelWalker
+        conn = self.connection()
+        count = 0
+        entries = []
+        dirs = []
+        for directory, mtime, batch in ParallelWalker(root, should_stop=should_stop, stat_dirs=True,
+                                                      stat_entries=True, on_enter=on_enter):
+            entries.extend(batch)
+            if mtime is not None:
+                dirs.append((directory, mtime))
+            if len(entries) >= self.BATCH_SIZE:
+                count += self.insertEntries(entries)
+                entries = []
+                if progress:
+                    progress(count)
+        count += self.insertEntries(entries)
+        conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?)", dirs)
+        if progress:
+            progress(count)
+        return [directory for directory, mtime in dirs]
+
+    def insertEntries(self, entries):
+        # entries are (path, name, is_dir, lstat result or None)
+        conn = self.connection()
+        for path, name, is_dir, info in entries:
+            size = info.st_size if info and not is_dir else None
+            ext = "" if is_dir else os.path.splitext(name)[1][1:].lower()
+            cur = conn.execute("""INSERT OR IGNORE INTO entries (path, parent, name, is_dir, depth, mtime, size, ext)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                               (path, os.path.dirname(path), name, int(is_dir), path.count("/"),
+                                info.st_mtime if info else None, size, ext))
+            if cur.rowcount:
+                entry_id = cur.lastrowid
+                conn.executemany("INSERT INTO trigrams VALUES (?, ?)",
+                                 ((tri, entry_id) for tri in self.trigrams(name)))
+        return len(entries)
+
+    def removeEntry(self, path):
+        # Drops an entry together with everything that was indexed below it
+        conn = self.connection()
+        low, high = self.subtreeRange(path)
+        rows = conn.execute("SELECT id, name FROM entries WHERE path = ? OR (path >= ? AND path < ?)",
+                            (path, low, high)).fetchall()
+        for entry_id, name in rows:
+            conn.executemany("DELETE FROM trigrams WHERE tri = ? AND entry_id = ?",
+                             ((tri, entry_id) for tri in self.trigrams(name)))
+        conn.execute("DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+        conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+        return len(rows)
+
+    def moveEntry(self, old_path, new_path):
+        # A rename only changes the trigrams of the moved entry itself, children just get a new path prefix
+        conn = self.connection()
+        row = conn.execute("SELECT id, name, is_dir FROM entries WHERE path = ?", (old_path,)).fetchone()
+        if row is None:
+            return False
+        self.removeEntry(new_path)
+        entry_id, old_name, is_dir = row
+        new_name = os.path.basename(new_path)
+        ext = "" if is_dir else os.path.splitext(new_name)[1][1:].lower()
+        conn.executemany("DELETE FROM trigrams WHERE tri = ? AND entry_id = ?",
+                         ((tri, entry_id) for tri in self.trigrams(old_name)))
+        conn.executemany("INSERT INTO trigrams VALUES (?, ?)",
+                         ((tri, entry_id) for tri in self.trigrams(new_name)))
+        conn.execute("UPDATE entries SET path = ?, parent = ?, name = ?, ext = ?, depth = ? WHERE id = ?",
+                     (new_path, os.path.dirname(new_path), new_name, ext, new_path.count("/"), entry_id))
+
+        low, high = self.subtreeRange(old_path)
+        cut = len(old_path.rstrip("/")) + 1
+        # Everything below moves up or down by as many levels as the entry itself did
+        shift = new_path.count("/") - old_path.count("/")
+        conn.execute("""UPDATE entries SET path = ? || substr(path, ?), parent = ? || substr(parent, ?),
+                        depth = depth + ? WHERE path >= ? AND path < ?""",
+                     (new_path, cut, new_path, cut, shift, low, high))
+        conn.execute("UPDATE dirs SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?",
+                     (new_path, cut, low, high))
+        conn.execute("UPDATE dirs SET path = ? WHERE path = ?", (new_path, old_path))
+        return True
+
+    def syncPath(self, path, on_enter=None):
+        # Makes the index agree with what is on disk for one path, returns the folders that got indexed
+        conn = self.connection()
+        try:
+            is_dir = os.path.isdir(path) and not os.path.islink(path)
+            exists = os.path.lexists(path)
+        except OSError:
+            exists = False
+        row = conn.execute("SELECT is_dir, size, mtime FROM entries WHERE path = ?", (path,)).fetchone()
+        if not exists:
+            if row is not None:
+                self.removeEntry(path)
+            return []
+        if row is not None and bool(row[0]) == is_dir:
+            # Same entry, it may still have been written to or touched
+            try:
+                info = os.lstat(path)
+            except OSError:
+                return []
+            self.refreshEntry(path, is_dir, info, row[1], row[2])
+            return []
+        if row is not None:
+            self.removeEntry(path)
+        try:
+            info = os.lstat(path)
+        except OSError:
+            info = None
+        self.insertEntries([(path, os.path.basename(path), is_dir, info)])
+        if is_dir:
+            return self.indexTree(path, on_enter=on_enter)
+        return []
+
+    def refreshEntry(self, path, is_dir, info, size, mtime):
+        # Stores a new size and mtime for an entry that is already indexed, if they changed
+        new_size = None if is_dir else info.st_size
+        if (size, mtime) != (new_size, info.st_mtime):
+            self.connection().execute("UPDATE entries SET size = ?, mtime = ? WHERE path = ?",
+                                      (new_size, info.st_mtime, path))
+
+    def rescanDirectory(self, path, on_enter=None):
+        # Lists one folder again and applies the difference, returns the folders that got indexed
+        conn = self.connection()
+        listing = {}
+        # Entries that couldn't be looked at keep whatever the index knows about them
+        skipped = set()
+        try:
+            mtime = os.stat(path).st_mtime
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        skipped.add(entry.path)
+                        continue
+                    try:
+                        info = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        info = None
+                    listing[entry.path] = (is_dir, info)
+        except OSError as e:
+            # Only a folder that is gone takes its subtree along, an unreadable or half read one stays as it was
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                self.removeEntry(path)
+            return []
+        indexed = {child: (bool(is_dir), size, child_mtime) for child, is_dir, size, child_mtime in
+                   conn.execute("SELECT path, is_dir, size, mtime FROM entries WHERE parent = ?", (path,))}
+        new_dirs = []
+        for child, (is_dir, size, child_mtime) in indexed.items():
+            if child in skipped:
+                continue
+            if child not in listing or listing[child][0] != is_dir:
+                self.removeEntry(child)
+        for child, (is_dir, info) in listing.items():
+            if child not in indexed or indexed[child][0] != is_dir:
+                new_dirs.extend(self.syncPath(child, on_enter))
+            elif info is not None:
+                self.refreshEntry(child, is_dir, info, indexed[child][1], indexed[child][2])
+        conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (path, mtime))
+        return new_dirs
+
+    def updateDirMtimes(self, paths):
+        conn = self.connection()
+        for path in paths:
+            try:
+                conn.execute("UPDATE dirs SET mtime = ? WHERE path = ?", (os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+
+    def directories(self):
+        return [row[0] for row in self.connection().execute("SELECT path FROM dirs")]
+
+    @staticmethod
+    def staleDirectories(rows):
+        # Of (path, stored mtime) pairs, the folders that gained, lost or renamed children since (or vanished)
+        changed = []
+        for path, mtime in rows:
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    changed.append(path)
+            except OSError:
+                changed.append(path)
+        return changed
+
+    def changedDirectories(self, paths=None):
+        rows = self.connection().execute("SELECT path, mtime FROM dirs").fetchall()
+        if paths is not None:
+            wanted = set(paths)
+            rows = [row for row in rows if row[0] in wanted]
+        return self.staleDirectories(rows)
+
+    def reconcile(self, progress=None, should_stop=None, on_enter=None):
+        """ Returns (folders skipped, folders rescanned, folders newly indexed) """
+        rows = self.connection().execute("SELECT path, mtime FROM dirs").fetchall()
+        chunks = [rows[i:i + self.RECONCILE_CHUNK] for i in range(0, len(rows), self.RECONCILE_CHUNK)]
+        changed = []
+        checked = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1) * 4)) as pool:
+            for chunk, stale in zip(chunks, pool.map(self.staleDirectories, chunks)):
+                changed.extend(stale)
+                checked += len(chunk)
+                if progress:
+                    progress(checked, len(rows))
+                if should_stop and should_stop():
+                    pool.shutdown(cancel_futures=True)
+                    return checked - len(changed), 0, []
+
+        # Parents first, so a removed folder takes its whole subtree with it before children are looked at
+        changed.sort()
+        rescanned = 0
+        new_dirs = []
+        for i in range(0, len(changed), self.RECONCILE_CHUNK):
+            if should_stop and should_stop():
+                break
+            batch = changed[i:i + self.RECONCILE_CHUNK]
+            new_dirs.extend(self.applyChanges(rescan=batch, on_enter=on_enter))
+            rescanned += len(batch)
+        return len(rows) - len(changed), rescanned, new_dirs
+
+    def applyChanges(self, moves=(), paths=(), rescan=(), on_enter=None):
+        # Applies a coalesced batch of changes in one transaction, returns the folders that got indexed.
+        # on_enter gets every new folder before it is listed, so a watch on it can't miss what comes next
+        conn = self.connection()
+        new_dirs = []
+        conn.execute("BEGIN")
+        try:
+            for old_path, new_path in moves:
+                if not self.moveEntry(old_path, new_path):
+                    new_dirs.extend(self.syncPath(new_path, on_enter))
+            for path in paths:
+                new_dirs.extend(self.syncPath(path, on_enter))
+            for path in rescan:
+                new_dirs.extend(self.rescanDirectory(path, on_enter))
+            # The parents saw these changes already, keep their stored mtimes current
+            self.updateDirMtimes({os.path.dirname(path) for path in paths} |
+                                 {os.path.dirname(path) for move in moves for path in move})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return new_dirs
+
+    def candidates(self, query, clauses=(), params=()):
+        # Rows of (name, path, is_dir) that contain every trigram of the query, still to be checked by the caller.
+        # clauses/params are extra predicates on the entries columns, see parseSearchQuery
+        grams = self.trigrams(query)
+        conn = self.connection()
+        where = "".join(f" AND {clause}" for clause in clauses)
+        if grams:
+            placeholders = ",".join("?" * len(grams))
+            return conn.execute(f"""SELECT name, path, is_dir FROM entries WHERE id IN (
+                                        SELECT entry_id FROM trigrams WHERE tri IN ({placeholders})
+                                        GROUP BY entry_id HAVING COUNT(*) = ?){where}""",
+                                (*grams, len(grams), *params))
+        # Too short to form a trigram, fall back to scanning the name column (or the filtered columns)
+        return conn.execute(f"SELECT name, path, is_dir FROM entries WHERE 1{where}", params)
+
+    def search(self, query, limit=None, clauses=(), params=()):
+        # Returns a list of (path, is_dir) whose name contains the query, case-insensitively
+        needle = query.lower()
+        results = []
+        for name, path, is_dir in self.candidates(needle, clauses, params):
+            if needle in name.lower():
+                results.append((path, bool(is_dir)))
+                if limit and len(results) >= limit:
+                    break
+        return results
+
+    def fuzzySearch(self, query, limit=100, clauses=(), params=()):
+        """ Returns the top `limit` (score, path, is_dir), best first, and the number of candidates """
+        needle = query.lower().strip()
+        if not needle:
+            return [], 0
+        conn = self.connection()
+        grams = list(self.trigrams(needle))
+        counts = {}
+        if grams:
+            placeholders = ",".join("?" * len(grams))
+            counts = dict(conn.execute(f"SELECT tri, n FROM trigram_stats WHERE tri IN ({placeholders})", grams))
+        # Rarest first, every walk below starts from the shortest posting list
+        grams.sort(key=lambda gram: (counts.get(gram, 0), gram))
+        gram_count = len(grams)
+        where = "".join(f" AND {clause}" for clause in clauses)
+        # Reading a filtered row costs about four posting steps, so when the filters leave few enough entries
+        # those are all scored and no posting list is read
+        threshold = min(counts.get(grams[0], 0), self.SCAN_BUDGET) // 4 if grams else self.SCAN_BUDGET // 4
+        if clauses and conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM entries WHERE 1{where} LIMIT ?)",
+                                    (*params, threshold + 1)).fetchone()[0] <= threshold:
+            filtered = conn.execute(f"SELECT name, path, is_dir, depth, mtime FROM entries WHERE 1{where}", params)
+            rows = self.closeEnough(needle, grams, filtered, set())
+        else:
+            # Exact and prefix matches come from the name index first, so a pile of equally good trigram
+            # candidates can't crowd them out. In index order an exact match sorts before its prefix matches
+            rows = conn.execute(f"""SELECT name, path, is_dir, depth, mtime, ? FROM (
+                                        SELECT * FROM entries INDEXED BY entries_name
+                                        WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE
+                                        ORDER BY name COLLATE NOCASE LIMIT ?)
+                                    WHERE 1{where} LIMIT ?""",
+                                (gram_count, needle, needle + "\U0010ffff", self.SCAN_BUDGET, *params,
+                                 self.PREFIX_CANDIDATES)).fetchall()
+            if grams:
+                seen = {row[1] for row in rows}
+                rows.extend(row for row in self.containingAll(needle, grams, where, params) if row[1] not in seen)
+                if len(rows) < limit:
+                    # Too few names contain the query as typed, look for ones with a typo
+                    seen.update(row[1] for row in rows)
+                    rows.extend(self.closeEnough(needle, grams, self.typoCandidates(needle, grams, where, params),
+                                                 seen))
+
+        subsequence = re.compile(".*?".join(re.escape(char) for char in needle))
+        now = time.time()
+        scored = []
+        for name, path, is_dir, depth, mtime, hits in rows:
+            score = self.fuzzyScore(needle, subsequence, name.lower(), hits, gram_count)
+            if score is None:
+                continue
+            # Shallow paths and recently modified entries win ties
+            score -= min(depth, 20) * 0.75
+            if mtime:
+                score += 10 / (1 + max(now - mtime, 0) / (7 * 86400))
+            scored.append((score, path, bool(is_dir)))
+        return heapq.nlargest(limit, scored), len(rows)
+
+    def containingAll(self, needle, grams, where, params):
+        # Walks the rarest posting list and keeps the names that contain the query. The walk stops at
+        # FUZZY_CANDIDATES matches or after SCAN_BUDGET postings, whichever comes first
+        return self.connection().execute(f"""SELECT e.name, e.path, e.is_dir, e.depth, e.mtime, ? FROM (
+                                                 SELECT entry_id FROM trigrams WHERE tri = ? LIMIT ?) AS t
+                                             CROSS JOIN entries e ON e.id = t.entry_id
+                                             WHERE instr(lower(e.name), ?) > 0{where} LIMIT ?""",
+                                          (len(grams), grams[0], self.SCAN_BUDGET, needle, *params,
+                                           self.FUZZY_CANDIDATES)).fetchall()
+
+    def typoCandidates(self, needle, grams, where, params):
+        # One typo breaks at most three trigrams, so a match keeps all but 3 per typo of them and has to contain
+        # one of the rarest grams beyond that. The first TYPO_POSTINGS postings of those are read
+        seeds = grams[:min(len(grams), 3 * self.typos(needle) + 1)]
+        seed_lists = " UNION ALL ".join(["SELECT entry_id FROM trigrams WHERE tri = ?"] * len(seeds))
+        return self.connection().execute(f"""SELECT e.name, e.path, e.is_dir, e.depth, e.mtime FROM (
+                                                 {seed_lists} LIMIT ?) AS t
+                                             CROSS JOIN entries e ON e.id = t.entry_id WHERE 1{where}""",
+                                          (*seeds, self.TYPO_POSTINGS, *params))
+
+    def closeEnough(self, needle, grams, rows, seen):
+        # Rows of the candidates that share enough trigrams with the query (or contain it), the most shared first
+        required = max(1, len(grams) - 3 * self.typos(needle))
+        close = []
+        for name, path, is_dir, depth, mtime in rows:
+            if path in seen:
+                continue
+            seen.add(path)
+            name_lower = name.lower()
+            hits = sum(gram in name_lower for gram in grams)
+            if hits >= required or needle in name_lower:
+                close.append((name, path, is_dir, depth, mtime, hits))
+        return heapq.nlargest(self.FUZZY_CANDIDATES, close, key=lambda row: row[5])
+
+    @staticmethod
+    def typos(needle):
+        return 1 + len(needle) // 8
+
+    @staticmethod
+    def fuzzyScore(needle, subsequence, name, hits, gram_count):
+        if name == needle:
+            return 100.0
+        if name.startswith(needle):
+            return 80.0
+        pos = name.find(needle)
+        if pos >= 0:
+            # Matches starting a word ("report" in "q3_report.pdf") beat ones in the middle of it
+            return 70.0 if not name[pos - 1].isalnum() else 60.0
+        match = subsequence.search(name)
+        if match:
+            return 30.0 + 20.0 * len(needle) / (match.end() - match.start())
+        if gram_count:
+            # Only the trigram overlap is left, i.e. a typo
+            return 40.0 * hits / gram_count
+        return None
+
+
+class DirSizeCache:
+    """ Persistent per-folder size totals stored in SQLite """
+    # A folder's row is used while the folder's mtime is unchanged. A file that grows in place doesn't touch
+    # that mtime, so its new size only shows once something in the folder is added, removed or renamed
+    CHUNK = 256
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(cacheDirectory(), "dirsizes.db")
+        self.local = threading.local()
+        self.createTables()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def createTables(self):
+        conn = self.connection()
+        conn.execute("""CREATE TABLE IF NOT EXISTS sizes (
+                            dev INTEGER NOT NULL,
+                            ino INTEGER NOT NULL,
+                            mtime REAL NOT NULL,
+                            files INTEGER NOT NULL,
+                            bytes INTEGER NOT NULL,
+                            links INTEGER NOT NULL,
+                            children TEXT NOT NULL,
+                            PRIMARY KEY (dev, ino))""")
+        # Hard-linked files of a folder, kept out of its bytes so they can be counted once per lookup
+        conn.execute("CREATE TABLE IF NOT EXISTS links (dev INTEGER, ino INTEGER, file_ino INTEGER, size INTEGER)")
+        conn.execute("CREATE INDEX IF NOT EXISTS links_dir ON links (dev, ino)")
+        conn.commit()
+
+    @staticmethod
+    def statDirectories(paths):
+        infos = []
+        for path in paths:
+            try:
+                infos.append(os.lstat(path))
+            except OSError:
+                infos.append(None)
+        return infos
+
+    def storedRows(self, keys):
+        # {(dev, ino): (mtime, files, bytes, links, children)} of the folders stored, in one query
+        if not keys:
+            return {}
+        values = ",".join(["(?, ?)"] * len(keys))
+        # Joined rather than (dev, ino) IN (VALUES ...), which SQLite answers with a scan of the whole table
+        rows = self.connection().execute(f"""SELECT s.dev, s.ino, s.mtime, s.files, s.bytes, s.links, s.children
+                                             FROM (VALUES {values}) AS k CROSS JOIN sizes s
+                                             ON s.dev = k.column1 AND s.ino = k.column2""",
+                                         [number for key in keys for number in key])
+        return {(row[0], row[1]): row[2:] for row in rows}
+
+    def storedLinks(self, keys):
+        # {(dev, ino): [(file inode, size)]} of the hard-linked files of the folders, in one query
+        links = collections.defaultdict(list)
+        if keys:
+            values = ",".join(["(?, ?)"] * len(keys))
+            for dev, ino, file_ino, size in self.connection().execute(
+                    f"""SELECT l.dev, l.ino, l.file_ino, l.size FROM (VALUES {values}) AS k CROSS JOIN links l
+                        ON l.dev = k.column1 AND l.ino = k.column2""", [number for key in keys for number in key]):
+                links[dev, ino].append((file_ino, size))
+        return links
+
+    @staticmethod
+    def scanDirectory(path):
+        # Returns (files, bytes, subfolder names, [(inode, size)] of hard-linked files)
+        files = 0
+        total_size = 0
+        children = []
+        links = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.name)
+                            continue
+                        info = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    files += 1
+                    if info.st_nlink > 1:
+                        links.append((info.st_ino, info.st_size))
+                    else:
+                        total_size += info.st_size
+        except OSError:
+            pass
+        return files, total_size, children, links
+
+    def lookup(self, path, progress=None, should_stop=None, linked=None):
+        """ Returns (items, bytes, folders) below path, or None when stopped """
+        # linked is the (device, inode) set of hard-linked files counted already, shared by lookups that add up
+        conn = self.connection()
+        skip = pseudoMountPoints()
+        files = total_size = folders = 0
+        linked = set() if linked is None else linked
+        level = [path]
+        workers = min(16, (os.cpu_count() or 1) * 4)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            while level:
+                next_level = []
+                for start in range(0, len(level), self.CHUNK):
+                    if should_stop and should_stop():
+                        conn.commit()
+                        return None
+                    chunk = level[start:start + self.CHUNK]
+                    # A task per stat costs more than the stat itself, each worker takes a slice of the chunk
+                    step = -(-len(chunk) // workers)
+                    infos = [info for part in pool.map(self.statDirectories,
+                                                       [chunk[i:i + step] for i in range(0, len(chunk), step)])
+                             for info in part]
+                    keys = [(info.st_dev, info.st_ino) for info in infos if info is not None]
+                    rows = self.storedRows(keys)
+                    stored_links = self.storedLinks([key for key, row in rows.items() if row[3]])
+                    stale = []
+                    for directory, info in zip(chunk, infos):
+                        if info is None:
+                            continue
+                        key = (info.st_dev, info.st_ino)
+                        row = rows.get(key)
+                        if row is None or row[0] != info.st_mtime:
+                            stale.append((directory, key, info.st_mtime))
+                            continue
+                        children = row[4].split("\0") if row[4] else []
+                        entry = (row[1], row[2], children, stored_links.get(key, []))
+                        files, total_size = self.rollUp(entry, key, linked, files, total_size)
+                        next_level.extend(self.childPaths(directory, children, skip))
+                        folders += len(children)
+
+                    # Only the folders that changed since they were stored are listed again
+                    scans = pool.map(self.scanDirectory, [directory for directory, key, mtime in stale])
+                    for (directory, key, mtime), entry in zip(stale, scans):
+                        self.store(key, mtime, entry)
+                        files, total_size = self.rollUp(entry, key, linked, files, total_size)
+                        next_level.extend(self.childPaths(directory, entry[2], skip))
+                        folders += len(entry[2])
+                    if progress:
+                        progress(files + folders, total_size, folders)
+                level = next_level
+        conn.commit()
+        return files + folders, total_size, folders
+
+    @staticmethod
+    def rollUp(entry, key, linked, files, total_size):
+        files += entry[0]
+        total_size += entry[1]
+        for file_ino, size in entry[3]:
+            if (key[0], file_ino) not in linked:
+                linked.add((key[0], file_ino))
+                total_size += size
+        return files, total_size
+
+    @staticmethod
+    def childPaths(directory, children, skip):
+        directory = directory.rstrip("/")
+        return [path for path in (directory + "/" + name for name in children) if path not in skip]
+
+    def store(self, key, mtime, entry):
+        files, total_size, children, links = entry
+        conn = self.connection()
+        conn.execute("INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (*key, mtime, files, total_size, len(links), "\0".join(children)))
+        conn.execute("DELETE FROM links WHERE dev = ? AND ino = ?", key)
+        conn.executemany("INSERT INTO links VALUES (?, ?, ?, ?)", [(*key, *link) for link in links])
+
+
+class FileTypeEngine:
+    """ File type detection by name and content, cached per inode """
+    MAX_CACHED = 100000
+    SPECIAL_TYPES = {
+        stat.S_IFDIR: "inode/directory",
+        stat.S_IFLNK: "inode/symlink",
+        stat.S_IFIFO: "inode/fifo",
+        stat.S_IFSOCK: "inode/socket",
+        stat.S_IFCHR: "inode/chardevice",
+        stat.S_IFBLK: "inode/blockdevice",
+    }
+
+    def __init__(self):
+        self.mime_db = QMimeDatabase()
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cacheKey(info):
+        return info.st_dev, info.st_ino, info.st_mtime_ns, info.st_size
+
+    def cachedType(self, path, info=None):
+        # Only answers from the cache, None for files that weren't sniffed yet
+        try:
+            info = info or os.lstat(path)
+        except OSError:
+            return None
+        with self.lock:
+            return self.cache.get(self.cacheKey(info))
+
+    def typeOf(self, path, info=None):
+        """ Returns (mime type name, description) of path, info is its lstat result if already known """
+        try:
+            info = info or os.lstat(path)
+        except OSError:
+            return "", "Unknown file type"
+        key = self.cacheKey(info)
+        with self.lock:
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache.move_to_end(key)
+                return result
+        result = self.detect(path, info)
+        with self.lock:
+            self.cache[key] = result
+            if len(self.cache) > self.MAX_CACHED:
+                self.cache.popitem(last=False)
+        return result
+
+    def detect(self, path, info):
+        name = self.SPECIAL_TYPES.get(stat.S_IFMT(info.st_mode))
+        if name is None:
+            data = b""
+            try:
+                # O_NONBLOCK like the content search, so a file that is locked or special can't hang the sniff
+                fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+                try:
+                    data = os.pread(fd, CONTENT_SNIFF_SIZE, 0)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+            mime = self.mime_db.mimeTypeForFileNameAndData(os.path.basename(path), data)
+        else:
+            mime = self.mime_db.mimeTypeForName(name)
+        return mime.name(), mime.comment() or mime.name()
+
+
+class FileTypeThread(QThread):
+    # Sniffs every entry of a directory in the background, so type lookups for it are answered from the cache
+    def __init__(self, directory, file_types, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.file_types = file_types
+
+    def run(self):
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if self.isInterruptionRequested():
+                        break
+                    try:
+                        self.file_types.typeOf(entry.path, entry.stat(follow_symlinks=False))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+
+
+class ChecksumEngine:
+    """ Single pass multi-algorithm checksums, cached per inode """
+    READ_SIZE = 4 * 1024 * 1024
+
+    def __init__(self):
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def cached(self, path):
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            return self.cache.get(FileTypeEngine.cacheKey(info))
+
+    def digest(self, path, progress=None, should_stop=None):
+        """ Returns {algorithm: hex digest} for a regular file, None for anything else or when stopped """
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            info = os.fstat(fd)
+            if not stat.S_ISREG(info.st_mode):
+                return None
+            key = FileTypeEngine.cacheKey(info)
+            with self.lock:
+                if key in self.cache:
+                    if progress:
+                        progress(info.st_size)
+                    return self.cache[key]
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            hashers = [hashlib.new(name) for name in CHECKSUM_ALGORITHMS.values()]
+            # An anonymous mapping is page-aligned, a bytearray of this size only lands on some boundary malloc picked
+            with mmap.mmap(-1, self.READ_SIZE) as buffer, memoryview(buffer) as view:
+                offset = 0
+                while True:
+                    if should_stop and should_stop():
+                        return None
+                    size = os.preadv(fd, [view], offset)
+                    if not size:
+                        break
+                    for hasher in hashers:
+                        hasher.update(view[:size])
+                    offset += size
+                    if progress:
+                        progress(size)
+        finally:
+            os.close(fd)
+        result = {label: hasher.hexdigest() for label, hasher in zip(CHECKSUM_ALGORITHMS, hashers)}
+        with self.lock:
+            self.cache[key] = result
+        return result
+
+
+class ChecksumThread(QThread):
+    """ Hashes a list of files, up to MAX_PARALLEL at a time """
+    progress = pyqtSignal("qint64", "qint64", float)
+    fileDone = pyqtSignal(str, dict)
+    fileFailed = pyqtSignal(str, str)
+    done = pyqtSignal(bool)
+
+    MAX_PARALLEL = min(4, os.cpu_count() or 1)
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, paths, checksums, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.checksums = checksums
+        self.lock = threading.Lock()
+        self.read = 0
+        self.total = 0
+        self.start_time = 0
+        self.last_emit = 0
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        files = []
+        for path in self.paths:
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(info.st_mode):
+                files.append(path)
+                self.total += info.st_size
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_PARALLEL) as pool:
+            futures = {pool.submit(self.checksums.digest, path, self.addProgress, self.isInterruptionRequested): path
+                       for path in files}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    digests = future.result()
+                except OSError as e:
+                    self.fileFailed.emit(futures[future], e.strerror)
+                    continue
+                if digests is not None:
+                    self.fileDone.emit(futures[future], digests)
+        self.emitProgress(force=True)
+        self.done.emit(self.isInterruptionRequested())
+
+    def addProgress(self, size):
+        # Called from the pool threads
+        with self.lock:
+            self.read += size
+        self.emitProgress()
+
+    def emitProgress(self, force=False):
+        now = time.perf_counter()
+        with self.lock:
+            if not force and now - self.last_emit < self.PROGRESS_INTERVAL:
+                return
+            self.last_emit = now
+            read = self.read
+        self.progress.emit(read, self.total, read / max(now - self.start_time, 1e-6))
+
+
+class ChecksumPanel(QWidget):
+    """ Checksums tab of the properties dialogs """
+    def __init__(self, paths, checksums=None, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.checksums = checksums or ChecksumEngine()
+        self.checksum_thread = None
+
+        self.checksum_table = QTableWidget(0, 3)
+        self.checksum_table.setHorizontalHeaderLabels(["File", "Algorithm", "Checksum"])
+        self.checksum_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.checksum_table.verticalHeader().setVisible(False)
+        self.checksum_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.checksum_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.checksum_table.setColumnHidden(0, len(paths) == 1)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.status_l = QLabel()
+        self.compare_le = QLineEdit()
+        self.compare_le.setPlaceholderText("Paste a checksum to compare")
+        self.compare_le.textChanged.connect(self.compareChecksum)
+        self.compare_l = QLabel()
+        self.copy_button = QPushButton("Copy")
+        self.copy_button.clicked.connect(self.copySelected)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.checksum_table)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.status_l)
+        compare_layout = QHBoxLayout()
+        compare_layout.addWidget(self.compare_le)
+        compare_layout.addWidget(self.copy_button)
+        layout.addLayout(compare_layout)
+        layout.addWidget(self.compare_l)
+        self.setLayout(layout)
+
+    def start(self):
+        if self.checksum_thread is not None:
+            return
+        self.checksum_thread = ChecksumThread(self.paths, self.checksums, self)
+        self.checksum_thread.progress.connect(self.onProgress)
+        self.checksum_thread.fileDone.connect(self.addChecksums)
+        self.checksum_thread.fileFailed.connect(self.addFailure)
+        self.checksum_thread.done.connect(self.onDone)
+        self.checksum_thread.start()
+
+    def addRow(self, path, algorithm, text):
+        row = self.checksum_table.rowCount()
+        self.checksum_table.insertRow(row)
+        for column, value in enumerate([os.path.basename(path), algorithm, text]):
+            item = QTableWidgetItem(value)
+            item.setToolTip(path if column == 0 else value)
+            self.checksum_table.setItem(row, column, item)
+
+    def addChecksums(self, path, digests):
+        for algorithm, digest in digests.items():
+            self.addRow(path, algorithm, digest)
+        self.compareChecksum()
+
+    def addFailure(self, path, error):
+        self.addRow(path, "", f"Failed: {error}")
+
+    def onProgress(self, read, total, rate):
+        self.progress_bar.setValue(int(read * 1000 / total) if total else 1000)
+        self.status_l.setText(f"{formatSize(read)} of {formatSize(total)} ({formatSize(int(rate))}/s)")
+
+    def onDone(self, cancelled):
+        if cancelled:
+            self.status_l.setText(self.status_l.text() + " - cancelled")
+
+    def compareChecksum(self):
+        wanted = self.compare_le.text().strip().lower()
+        if not wanted:
+            self.compare_l.clear()
+            return
+        for row in range(self.checksum_table.rowCount()):
+            if self.checksum_table.item(row, 2).text() == wanted:
+                self.checksum_table.selectRow(row)
+                name = self.checksum_table.item(row, 0).text()
+                self.compare_l.setText(f"Matches the {self.checksum_table.item(row, 1).text()} of {name}")
+                return
+        self.compare_l.setText("No match")
+
+    def copySelected(self):
+        rows = sorted({index.row() for index in self.checksum_table.selectedIndexes()})
+        lines = [f"{self.checksum_table.item(row, 2).text()}  {self.checksum_table.item(row, 0).text()}"
+                 for row in rows]
+        QApplication.clipboard().setText("\n".join(lines))
+
+    def stop(self):
+        if self.checksum_thread is not None and self.checksum_thread.isRunning():
+            self.checksum_thread.requestInterruption()
+            self.checksum_thread.wait()
+
+
+class TanzFileSystemModel(QFileSystemModel):
+    # QFileSystemModel with the sniffed file type in the tooltip
+    def __init__(self, file_types, parent=None):
+        super().__init__(parent)
+        self.file_types = file_types
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.ToolTipRole and index.isValid():
+            file_type = self.file_types.cachedType(self.filePath(index))
+            if file_type is not None:
+                return f"{self.fileName(index)}\n{file_type[1]}"
+        return super().data(index, role)
+
+
+class IndexBuildThread(QThread):
+    progress = pyqtSignal(int)
+    done = pyqtSignal(bool)
+
+    def __init__(self, file_index, root="/", parent=None):
+        super().__init__(parent)
+        self.file_index = file_index
+        self.root = root
+
+    def run(self):
+        # The index object hands this thread its own sqlite connection
+        ok = self.file_index.build(self.root, progress=self.progress.emit,
+                                   should_stop=self.isInterruptionRequested)
+        self.done.emit(ok)
+
+
+class Inotify:
+    """ Minimal ctypes wrapper around the Linux inotify API """
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_DONT_FOLLOW = 0x02000000
+    IN_EXCL_UNLINK = 0x04000000
+    IN_ISDIR = 0x40000000
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def addWatch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def removeWatch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def readEvents(self, timeout):
+        # Yields (wd, mask, cookie, name) for everything that arrived within timeout seconds
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            yield wd, mask, cookie, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class IndexWatcher(QThread):
+    """ Keeps the FileIndex current from inotify events """
+    indexUpdated = pyqtSignal(int)
+    reconcileProgress = pyqtSignal(int, int)  # folders checked, folders in the index
+    reconciled = pyqtSignal(int, int, float)  # folders skipped, folders rescanned, seconds taken
+
+    # CLOSE_WRITE and ATTRIB catch files changed in place (size, mtime), they go through the same coalescing
+    WATCH_MASK = (Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MOVED_FROM | Inotify.IN_MOVED_TO |
+                  Inotify.IN_CLOSE_WRITE | Inotify.IN_ATTRIB |
+                  Inotify.IN_ONLYDIR | Inotify.IN_DONT_FOLLOW | Inotify.IN_EXCL_UNLINK)
+    FLUSH_INTERVAL = 1.0
+    MAX_PENDING = 10000
+    POLL_INTERVAL = 60.0
+
+    def __init__(self, file_index, parent=None):
+        super().__init__(parent)
+        self.file_index = file_index
+        self.inotify = None
+        self.wd_paths = {}
+        self.path_wds = {}
+        self.unwatched = set()
+        self.limit_reached = False
+
+    def run(self):
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError):
+            # No inotify (not Linux or no free instances), everything gets polled
+            self.inotify = None
+        # Watches go in before reconciling, so nothing that changes meanwhile is missed
+        self.addWatches(self.file_index.directories())
+        start = time.monotonic()
+        # Folders that are new to the index get their watch before they are listed
+        skipped, rescanned, new_dirs = self.file_index.reconcile(self.reconcileProgress.emit,
+                                                                 self.isInterruptionRequested, self.addWatch)
+        self.reconciled.emit(skipped, rescanned, time.monotonic() - start)
+
+        touched = set()
+        moves = []
+        cookies = {}
+        rescan = set()
+        last_flush = last_poll = time.monotonic()
+        try:
+            while not self.isInterruptionRequested():
+                if self.inotify is not None:
+                    for wd, mask, cookie, name in self.inotify.readEvents(0.25):
+                        if mask & Inotify.IN_Q_OVERFLOW:
+                            # Events were lost, fall back to comparing mtimes of every watched folder
+                            rescan.update(self.path_wds)
+                            continue
+                        if mask & Inotify.IN_IGNORED:
+                            self.forgetWatch(wd)
+                            continue
+                        directory = self.wd_paths.get(wd)
+                        if directory is None or not name:
+                            continue
+                        path = os.path.join(directory, name)
+                        if mask & Inotify.IN_MOVED_FROM:
+                            cookies[cookie] = path
+                        elif mask & Inotify.IN_MOVED_TO and cookie in cookies:
+                            moves.append((cookies.pop(cookie), path))
+                            # Later events from watches below the moved folder must resolve to the new path
+                            self.renameWatches(*moves[-1])
+                        else:
+                            touched.add(path)
+                else:
+                    time.sleep(0.25)
+
+                now = time.monotonic()
+                pending = len(touched) + len(moves) + len(cookies) + len(rescan)
+                if pending and (now - last_flush >= self.FLUSH_INTERVAL or pending >= self.MAX_PENDING):
+                    # A move whose other half never arrived left (or entered) the indexed tree
+                    touched.update(cookies.values())
+                    rescan = set(self.file_index.changedDirectories(rescan)) if rescan else set()
+                    self.flush(moves, touched, rescan)
+                    touched, moves, cookies, rescan = set(), [], {}, set()
+                    last_flush = now
+                if self.unwatched and now - last_poll >= self.POLL_INTERVAL:
+                    changed = self.file_index.changedDirectories(self.unwatched)
+                    if changed:
+                        self.flush([], set(), changed)
+                    last_poll = time.monotonic()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+
+    def flush(self, moves, touched, rescan):
+        self.file_index.applyChanges(moves, sorted(touched), sorted(rescan), self.addWatch)
+        self.indexUpdated.emit(len(moves) + len(touched) + len(rescan))
+
+    def addWatches(self, paths):
+        for path in paths:
+            self.addWatch(path)
+
+    def addWatch(self, path):
+        # Also called from the walker threads of indexTree, the dict and set updates are atomic
+        if path in self.path_wds:
+            return
+        if self.inotify is None or self.limit_reached:
+            self.unwatched.add(path)
+            return
+        try:
+            wd = self.inotify.addWatch(path, self.WATCH_MASK)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                # Out of inotify watches (fs.inotify.max_user_watches), poll the rest by mtime
+                self.limit_reached = True
+                self.unwatched.add(path)
+            return
+        self.wd_paths[wd] = path
+        self.path_wds[path] = wd
+        self.unwatched.discard(path)
+
+    def forgetWatch(self, wd):
+        path = self.wd_paths.pop(wd, None)
+        if path is not None:
+            self.path_wds.pop(path, None)
+
+    def renameWatches(self, old_path, new_path):
+        low, high = FileIndex.subtreeRange(old_path)
+        for path in [p for p in self.path_wds if p == old_path or low <= p < high]:
+            wd = self.path_wds.pop(path)
+            moved = new_path + path[len(old_path):]
+            self.path_wds[moved] = wd
+            self.wd_paths[wd] = moved
+        for path in [p for p in self.unwatched if p == old_path or low <= p < high]:
+            self.unwatched.discard(path)
+            self.unwatched.add(new_path + path[len(old_path):])
+
 
 class TanzSideBarMenu(QFrame):
     clicked = pyqtSignal()
@@ -72,10 +1634,62 @@ class AddressBarLabel(QLabel):
             self.clicked.emit(self.text())
 
 
+def formatSize(size):
+    # Convert the size to GB, MB, KB or bytes
+    if size >= 1024 * 1024 * 1024:
+        return "{:.2f} GB".format(size / (1024 * 1024 * 1024))
+    elif size >= 1024 * 1024:
+        return "{:.2f} MB".format(size / (1024 * 1024))
+    elif size >= 1024:
+        return "{:.2f} KB".format(size / 1024)
+    return "{} bytes".format(size)
+
+
+def freeSpaceText(mounts, path):
+    space = mounts.freeSpace(path)
+    if space is None:
+        return "Unknown"
+    total, free, available = space
+    return f"{formatSize(available)} free of {formatSize(total)}"
+
+
+class FolderSizeThread(QThread):
+    """ Recursive folder size in the background """
+    progress = pyqtSignal(int, "qint64", int)
+    done = pyqtSignal(bool)
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, path, size_cache=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.size_cache = size_cache
+        self.last_emit = 0
+
+    def run(self):
+        size_cache = self.size_cache or DirSizeCache()
+        totals = size_cache.lookup(self.path, progress=self.onProgress, should_stop=self.isInterruptionRequested)
+        if totals is not None:
+            self.progress.emit(*totals)
+        self.done.emit(totals is None)
+
+    def onProgress(self, items, total_size, folders):
+        now = time.perf_counter()
+        if now - self.last_emit >= self.PROGRESS_INTERVAL:
+            self.progress.emit(items, total_size, folders)
+            self.last_emit = now
+
+
 class PropertiesWindow(QDialog):
-    def __init__(self, path):
+    def __init__(self, path, size_cache=None, file_types=None, checksums=None, mounts=None):
         super().__init__()
         self.path = path
+        self.size_cache = size_cache
+        self.file_types = file_types or FileTypeEngine()
+        self.checksums = checksums
+        self.mounts = mounts or MountTable()
+        self.size_thread = None
+        self.checksum_panel = None
         self.labels = [
             "Name",
             "Type",
@@ -89,7 +1703,7 @@ class PropertiesWindow(QDialog):
 
     def initializeUI(self):
         self.setWindowTitle("Properties")
-        self.setFixedSize(400, 450)
+        self.setFixedSize(400, 490)
         self.setupPropertiesWindow()
 
     def setupPropertiesWindow(self):
@@ -120,14 +1734,8 @@ class PropertiesWindow(QDialog):
 
         if QDir(self.path).exists():
             file_type = "Folder"
-        elif QFile(self.path).exists():
-            file_ext = file_info.suffix()
-            file_type_map = {
-                "pdf": "PDF document",
-                "txt": "Text document",
-                "docx": "Microsoft Word document",
-            }
-            file_type = file_type_map.get(file_ext, "Unknown file type")
+        else:
+            file_type = self.file_types.typeOf(self.path)[1]
         self.prop_type_data = QLabel(file_type)
 
         self.prop_type_data.setFixedSize(250, 35)
@@ -135,7 +1743,6 @@ class PropertiesWindow(QDialog):
 
         self.prop_contents_data = QLabel()
         self.direcContents()
-        self.prop_contents_data.setText(f"{self.num_files} items, totalling {self.total_size_str}")
         self.prop_contents_data.setFixedSize(250, 35)
         self.prop_contents_data.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
@@ -153,10 +1760,11 @@ class PropertiesWindow(QDialog):
         self.prop_created_data.setFixedSize(250, 35)
         self.prop_created_data.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-        storage = QStorageInfo.root()
-        data = storage.bytesAvailable() / (1000 * 1000 * 1000)
-        free_space = "{:.5f}".format(data)
-        self.prop_free_data = QLabel(free_space[:5] + " GB")
+        # Free space of the filesystem that holds the item, not of /
+        self.prop_free_data = QLabel(freeSpaceText(self.mounts, self.path))
+        mount = self.mounts.lookup(self.path)
+        if mount is not None:
+            self.prop_free_data.setToolTip(f"{mount.source} on {mount.mount_point} ({mount.fs_type})")
         self.prop_free_data.setFixedSize(250, 35)
         self.prop_free_data.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
@@ -170,9 +1778,24 @@ class PropertiesWindow(QDialog):
 
         self.prop_layout_core.addLayout(self.prop_upper_layout)
         self.prop_layout_core.addLayout(self.prop_bottom_layout)
-        self.setLayout(self.prop_layout_core)
+        prop_general_tab = QWidget()
+        prop_general_tab.setLayout(self.prop_layout_core)
+        self.prop_tabs = QTabWidget()
+        self.prop_tabs.addTab(prop_general_tab, "General")
+        if file_info.isFile():
+            self.checksum_panel = ChecksumPanel([self.path], self.checksums)
+            self.prop_tabs.addTab(self.checksum_panel, "Checksums")
+            self.prop_tabs.currentChanged.connect(self.onTabChanged)
+        prop_window_layout = QVBoxLayout()
+        prop_window_layout.addWidget(self.prop_tabs)
+        self.setLayout(prop_window_layout)
         self.prop_name_le.setText(file_info.fileName())
 
+    def onTabChanged(self, index):
+        # Hashing a big file takes a while, so it only starts when the tab is opened
+        if self.prop_tabs.widget(index) is self.checksum_panel:
+            self.checksum_panel.start()
+
     def itemCheck(self):
         if QDir(self.path).exists():
             pixmap = QPixmap("icons/folder.png")
@@ -186,36 +1809,38 @@ class PropertiesWindow(QDialog):
             self.prop_icon_btn.setIcon(prop_icon)
 
     def direcContents(self):
-        # Create a QDir object for the directory
-        direc = QDir(self.path)
-
-        # Get the list of items in the directory
-        items = direc.entryInfoList()
-
-        # Initialize counters for the number of files and the total size
-        self.num_files = 0
-        total_size = 0
-
-        # Loop over the items in the directory
-        for item in items:
-            # Check if the item is a file
-            if item.isFile():
-                # Increment the file counter
-                self.num_files += 1
-                # Add the size of the file to the total size
-                total_size += item.size()
-
-        # Convert the total size to MB, KB, or GB
-        if total_size >= 1024 * 1024 * 1024:
-            self.total_size_str = "{:.2f} GB".format(total_size / (1024 * 1024 * 1024))
-        elif total_size >= 1024 * 1024:
-            self.total_size_str = "{:.2f} MB".format(total_size / (1024 * 1024))
-        elif total_size >= 1024:
-            self.total_size_str = "{:.2f} KB".format(total_size / 1024)
-        else:
-            self.total_size_str = "{} bytes".format(total_size)
+        file_info = QFileInfo(self.path)
+        if not file_info.isDir() or file_info.isSymLink():
+            self.prop_contents_data.setText(formatSize(file_info.size()))
+            return
+        # Large trees take a while, the totals are filled in as the scan goes
+        self.prop_contents_data.setText("Calculating...")
+        self.size_thread = FolderSizeThread(self.path, self.size_cache, self)
+        self.size_thread.progress.connect(self.onContentsProgress)
+        self.size_thread.done.connect(self.onContentsDone)
+        self.size_thread.start()
+
+    def onContentsProgress(self, items, total_size, folders):
+        self.contents_str = f"{items} items ({folders} folders), totalling {formatSize(total_size)}"
+        self.prop_contents_data.setText(self.contents_str + "...")
+
+    def onContentsDone(self, cancelled):
+        if not cancelled:
+            self.prop_contents_data.setText(self.contents_str)
+
+    def stopContents(self):
+        if self.size_thread is not None and self.size_thread.isRunning():
+            self.size_thread.requestInterruption()
+            self.size_thread.wait()
+        if self.checksum_panel is not None:
+            self.checksum_panel.stop()
+
+    def reject(self):
+        self.stopContents()
+        super().reject()
 
     def closeEvent(self, event):
+        self.stopContents()
         new_name = self.prop_name_le.text()
         if new_name != QFileInfo(self.path).fileName():
             new_path = QFileInfo(self.path).dir().filePath(new_name)
@@ -226,7 +1851,498 @@ class PropertiesWindow(QDialog):
         event.accept()
 
 
+class SelectionPropertiesThread(QThread):
+    """ Aggregate properties of a selection """
+    progress = pyqtSignal(int, int, "qint64", dict, float, float)
+    done = pyqtSignal(bool)
+
+    CHUNK = 256
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, paths, size_cache=None, file_types=None, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.size_cache = size_cache
+        self.file_types = file_types or FileTypeEngine()
+        self.checked = 0
+        self.contained = 0
+        self.total_size = 0
+        self.types = {}
+        self.oldest = 0.0
+        self.newest = 0.0
+        self.last_emit = 0
+
+    def run(self):
+        linked = set()
+        folders = []
+        chunks = [self.paths[i:i + self.CHUNK] for i in range(0, len(self.paths), self.CHUNK)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1) * 4)) as pool:
+            for chunk in chunks:
+                if self.isInterruptionRequested():
+                    break
+                for path, info, kind in pool.map(self.itemInfo, chunk):
+                    self.checked += 1
+                    if info is None:
+                        continue
+                    self.oldest = min(self.oldest or info.st_mtime, info.st_mtime)
+                    self.newest = max(self.newest, info.st_mtime)
+                    if stat.S_ISDIR(info.st_mode):
+                        folders.append(path)
+                    else:
+                        if info.st_nlink > 1:
+                            if (info.st_dev, info.st_ino) in linked:
+                                continue
+                            linked.add((info.st_dev, info.st_ino))
+                        self.total_size += info.st_size
+                    self.types[kind] = self.types.get(kind, 0) + 1
+                self.emitProgress()
+
+        size_cache = self.size_cache or DirSizeCache()
+        for folder in folders:
+            if self.isInterruptionRequested():
+                break
+            contained, total_size = self.contained, self.total_size
+
+            def onFolderProgress(items, folder_size, subfolders):
+                self.contained = contained + items
+                self.total_size = total_size + folder_size
+                self.emitProgress()
+
+            # Sharing linked counts a file linked both in and outside a folder once for the whole selection
+            size_cache.lookup(folder, progress=onFolderProgress, should_stop=self.isInterruptionRequested,
+                              linked=linked)
+        self.emitProgress(force=True)
+        self.done.emit(self.isInterruptionRequested())
+
+    def itemInfo(self, path):
+        # (path, lstat or None, type description) for one selected item, run on the pool
+        try:
+            info = os.lstat(path)
+        except OSError:
+            return path, None, None
+        kind = "Folder" if stat.S_ISDIR(info.st_mode) else self.file_types.typeOf(path, info)[1]
+        return path, info, kind
+
+    def emitProgress(self, force=False):
+        now = time.perf_counter()
+        if force or now - self.last_emit >= self.PROGRESS_INTERVAL:
+            self.progress.emit(self.checked, self.contained, self.total_size, dict(self.types),
+                               self.oldest, self.newest)
+            self.last_emit = now
+
+
+class SelectionPropertiesWindow(QDialog):
+    """ Properties of several selected items: count, size, types and dates """
+    MAX_TYPES = 6
+
+    def __init__(self, paths, size_cache=None, file_types=None, checksums=None, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.setWindowTitle("Properties")
+        self.setFixedSize(400, 380)
+
+        layout = QGridLayout()
+        layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        for i, label in enumerate(["Selected", "Contents", "Types", "Modified", "Parent folder"]):
+            prop_label = QLabel(label)
+            prop_label.setAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            prop_label.setFrameShape(QFrame.Shape.Box)
+            prop_label.setStyleSheet("padding: 0,0,10px,0;")
+            prop_label.setFixedSize(125, 35 if i != 2 else 100)
+            layout.addWidget(prop_label, i, 0)
+
+        self.prop_selected_data = QLabel(f"{len(paths)} items")
+        self.prop_contents_data = QLabel("Calculating...")
+        self.prop_types_data = QLabel()
+        self.prop_types_data.setWordWrap(True)
+        self.prop_dates_data = QLabel()
+        parents = {os.path.dirname(path) for path in paths}
+        self.prop_parent_data = QLabel(parents.pop() if len(parents) == 1 else f"{len(parents)} folders")
+        for i, data_label in enumerate([self.prop_selected_data, self.prop_contents_data, self.prop_types_data,
+                                        self.prop_dates_data, self.prop_parent_data]):
+            data_label.setFixedSize(250, 35 if i != 2 else 100)
+            data_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            layout.addWidget(data_label, i, 1)
+        general_tab = QWidget()
+        general_tab.setLayout(layout)
+        self.checksum_panel = ChecksumPanel(paths, checksums)
+        self.tabs = QTabWidget()
+        self.tabs.addTab(general_tab, "General")
+        self.tabs.addTab(self.checksum_panel, "Checksums")
+        self.tabs.currentChanged.connect(self.onTabChanged)
+        window_layout = QVBoxLayout()
+        window_layout.addWidget(self.tabs)
+        self.setLayout(window_layout)
+
+        self.properties_thread = SelectionPropertiesThread(paths, size_cache, file_types, self)
+        self.properties_thread.progress.connect(self.onProgress)
+        self.properties_thread.done.connect(self.onDone)
+        self.properties_thread.start()
+
+    def onProgress(self, checked, contained, total_size, types, oldest, newest):
+        self.prop_selected_data.setText(f"{len(self.paths)} items ({checked} checked)")
+        self.prop_contents_data.setText(f"{contained} items in folders, totalling {formatSize(total_size)}...")
+        kinds = sorted(types.items(), key=lambda kind: -kind[1])
+        text = ", ".join(f"{count} {kind}" for kind, count in kinds[:self.MAX_TYPES])
+        if len(kinds) > self.MAX_TYPES:
+            text += f", {sum(count for kind, count in kinds[self.MAX_TYPES:])} other"
+        self.prop_types_data.setText(text)
+        if oldest:
+            oldest = time.strftime("%Y-%m-%d %H:%M", time.localtime(oldest))
+            newest = time.strftime("%Y-%m-%d %H:%M", time.localtime(newest))
+            self.prop_dates_data.setText(f"{oldest} - {newest}")
+
+    def onDone(self, cancelled):
+        if not cancelled:
+            self.prop_selected_data.setText(f"{len(self.paths)} items")
+            self.prop_contents_data.setText(self.prop_contents_data.text().removesuffix("..."))
+
+    def onTabChanged(self, index):
+        if self.tabs.widget(index) is self.checksum_panel:
+            self.checksum_panel.start()
+
+    def stopProperties(self):
+        if self.properties_thread.isRunning():
+            self.properties_thread.requestInterruption()
+            self.properties_thread.wait()
+        self.checksum_panel.stop()
+
+    def reject(self):
+        self.stopProperties()
+        super().reject()
+
+    def closeEvent(self, event):
+        self.stopProperties()
+        event.accept()
+
+
+class SearchWorker(QThread):
+    resultsReady = pyqtSignal(list)
+    progress = pyqtSignal(int, int, float)  # hits, entries scanned, entries scanned per second
+    done = pyqtSignal(bool)  # True when the search was cancelled
+
+    BATCH_SIZE = 256
+    FLUSH_INTERVAL = 0.1
+    FUZZY_LIMIT = 200
+
+    def __init__(self, query, file_index=None, root="/", parent=None, fuzzy=False, clauses=(), params=(),
+                 previous=None):
+        super().__init__(parent)
+        # Without an index the worker walks the disk starting at root, filters need the index.
+        # previous is the (parents, names, kinds) of an earlier result set that this query narrows down
+        self.query = query
+        self.file_index = file_index
+        self.root = root
+        self.fuzzy = fuzzy and file_index is not None
+        self.clauses = clauses
+        self.params = params
+        self.previous = previous
+        self.conn = None
+
+    def cancel(self):
+        self.requestInterruption()
+        # Aborts a long running SQLite statement in the worker thread (interrupt() is thread safe)
+        if self.conn is not None:
+            self.conn.interrupt()
+
+    def entries(self):
+        if self.previous is not None:
+            parents, names, kinds = self.previous
+            needle = self.query.lower()
+            for parent, name, kind in zip(parents, names, kinds):
+                # Paths are only put together for names that still match
+                if needle in name.lower():
+                    yield name, parent + "/" + name, kind == SearchResultsModel.FOLDER
+                else:
+                    yield name, None, False
+        elif self.file_index is None:
+            for path, name, is_dir in walkTree(self.root, self.isInterruptionRequested):
+                yield name, path, is_dir
+        else:
+            yield from self.file_index.candidates(self.query.lower(), self.clauses, self.params)
+
+    def run(self):
+        if self.file_index is not None:
+            self.conn = self.file_index.connection()
+        try:
+            self.search()
+        except sqlite3.OperationalError:
+            # Interrupted by cancel()
+            if not self.isInterruptionRequested():
+                raise
+        self.done.emit(self.isInterruptionRequested())
+
+    def search(self):
+        if self.fuzzy:
+            # Ranked results only make sense as a whole, they arrive in one batch in score order
+            start = time.perf_counter()
+            results, candidates = self.file_index.fuzzySearch(self.query, self.FUZZY_LIMIT, self.clauses, self.params)
+            self.flush([(path, is_dir) for score, path, is_dir in results], len(results), candidates, start)
+            return
+
+        needle = self.query.lower()
+        hits = 0
+        scanned = 0
+        batch = []
+        start = last_flush = time.perf_counter()
+
+        for name, path, is_dir in self.entries():
+            if self.isInterruptionRequested():
+                break
+            scanned += 1
+            if path is not None and needle in name.lower():
+                batch.append((path, bool(is_dir)))
+            # Hand results over in batches, or every FLUSH_INTERVAL when hits are rare
+            if len(batch) >= self.BATCH_SIZE or (scanned & 1023 == 0 and
+                                                 time.perf_counter() - last_flush >= self.FLUSH_INTERVAL):
+                hits += len(batch)
+                last_flush = self.flush(batch, hits, scanned, start)
+                batch = []
+
+        hits += len(batch)
+        self.flush(batch, hits, scanned, start)
+
+    def flush(self, batch, hits, scanned, start):
+        now = time.perf_counter()
+        if batch:
+            self.resultsReady.emit(batch)
+        self.progress.emit(hits, scanned, scanned / max(now - start, 1e-6))
+        return now
+
+
+def scanFileContents(paths, pattern, is_regex, max_size, max_lines=100):
+    """ Runs in a worker process: returns (path, line numbers) for the files that contain pattern """
+    needle = pattern.encode("utf-8")
+    regex = re.compile(needle, re.MULTILINE) if is_regex else None
+    results = []
+    for path in paths:
+        try:
+            # O_NONBLOCK keeps a FIFO from blocking the open, anything but a regular file is skipped anyway
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            continue
+        try:
+            info = os.fstat(fd)
+            if not stat.S_ISREG(info.st_mode) or info.st_size == 0 or info.st_size > max_size:
+                continue
+            if b"\0" in os.pread(fd, CONTENT_SNIFF_SIZE, 0):
+                continue
+            # Read, not mapped: a file cut short meanwhile gives a short read here, a mapping would SIGBUS
+            # the worker and break the whole pool
+            lines = matchingLines(os.pread(fd, info.st_size, 0), needle, regex, max_lines)
+        except OSError:
+            continue
+        finally:
+            os.close(fd)
+        if lines:
+            results.append((path, lines))
+    return results
+
+
+def matchingLines(buffer, needle, regex, max_lines):
+    lines = []
+    line = 1
+    counted = 0
+    pos = 0
+    while len(lines) < max_lines:
+        if regex is None:
+            pos = buffer.find(needle, pos)
+        else:
+            match = regex.search(buffer, pos)
+            pos = match.start() if match else -1
+        if pos < 0:
+            break
+        line += buffer[counted:pos].count(b"\n")
+        lines.append(line)
+        # Continue on the next line, one line is reported once however often it matches
+        counted = buffer.find(b"\n", pos)
+        if counted < 0:
+            break
+        line += 1
+        counted += 1
+        pos = counted
+    return lines
+
+
+class ContentSearchWorker(QThread):
+    """ Full-text search below root """
+    resultsReady = pyqtSignal(list)  # (path, [line numbers])
+    progress = pyqtSignal(int, int, float)  # matching files, files scanned, files scanned per second
+    done = pyqtSignal(bool)  # True when the search was cancelled
+
+    CHUNK_SIZE = 64
+    MAX_FILE_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, pattern, root, is_regex=False, parent=None):
+        super().__init__(parent)
+        self.pattern = pattern
+        self.root = root
+        self.is_regex = is_regex
+        self.workers = os.cpu_count() or 1
+
+    def cancel(self):
+        self.requestInterruption()
+
+    def run(self):
+        self.hits = 0
+        self.scanned = 0
+        self.start_time = time.perf_counter()
+        self.pool = None
+        pending = set()
+        chunk = []
+        try:
+            self.startPool()
+            for path, name, is_dir in walkTree(self.root, self.isInterruptionRequested):
+                if is_dir:
+                    continue
+                chunk.append(path)
+                if len(chunk) >= self.CHUNK_SIZE:
+                    pending.add(self.submit(chunk))
+                    chunk = []
+                # Only a few chunks per worker are in flight, so the walk doesn't run far ahead of the scanning
+                while len(pending) >= self.workers * 4 and not self.isInterruptionRequested():
+                    pending = self.collect(pending)
+            if chunk and not self.isInterruptionRequested():
+                pending.add(self.submit(chunk))
+            while pending and not self.isInterruptionRequested():
+                pending = self.collect(pending)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True, cancel_futures=True)
+            self.done.emit(self.isInterruptionRequested())
+
+    def startPool(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        # Forking a process that runs Qt and other threads can copy a held lock into the child, the workers
+        # come from a forkserver instead, which is why scanFileContents has to stay at module level
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                           mp_context=multiprocessing.get_context("forkserver"))
+
+    def submit(self, chunk, retry=True):
+        try:
+            future = self.pool.submit(scanFileContents, chunk, self.pattern, self.is_regex, self.MAX_FILE_SIZE)
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died (killed, out of memory) and took the pool with it, the search goes on in a new one
+            self.startPool()
+            future = self.pool.submit(scanFileContents, chunk, self.pattern, self.is_regex, self.MAX_FILE_SIZE)
+        future.chunk = chunk
+        future.retry = retry
+        return future
+
+    def collect(self, pending):
+        finished, pending = concurrent.futures.wait(pending, timeout=0.1,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in finished:
+            try:
+                results = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                if future.retry:
+                    # Lost with the pool, once more in case another chunk was what broke it
+                    pending.add(self.submit(future.chunk, retry=False))
+                    continue
+                results = None
+            except Exception:
+                results = None
+            self.scanned += len(future.chunk)
+            if results:
+                self.hits += len(results)
+                self.resultsReady.emit(results)
+        if finished:
+            elapsed = max(time.perf_counter() - self.start_time, 1e-6)
+            self.progress.emit(self.hits, self.scanned, self.scanned / elapsed)
+        return pending
+
+
+class SearchResultsModel(QAbstractListModel):
+    """ List model for search hits that stays small with hundreds of thousands of rows """
+    FILE, FOLDER = 0, 1
+    FETCH_SIZE = 500
+    ICON_FILES = {FILE: "icons/file.png", FOLDER: "icons/folder.png"}
+    icon_cache = {}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.clear()
+
+    def clear(self):
+        self.beginResetModel()
+        self.parents = []
+        self.names = []
+        self.kinds = bytearray()
+        self.details = {}
+        self.loaded = 0
+        self.endResetModel()
+
+    @classmethod
+    def icon(cls, kind):
+        if kind not in cls.icon_cache:
+            cls.icon_cache[kind] = QIcon(cls.ICON_FILES[kind])
+        return cls.icon_cache[kind]
+
+    def appendHits(self, hits, details=None):
+        # hits are (path, is_dir), details optionally maps a path to extra text such as line numbers
+        for path, is_dir in hits:
+            parent, name = path.rsplit("/", 1)
+            if details and path in details:
+                self.details[len(self.names)] = details[path]
+            self.parents.append(sys.intern(parent))
+            self.names.append(name)
+            self.kinds.append(self.FOLDER if is_dir else self.FILE)
+        # Fill the first screen right away, the rest is fetched as the view scrolls
+        if self.loaded < self.FETCH_SIZE and self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def hitCount(self):
+        return len(self.names)
+
+    def snapshot(self):
+        # The arrays are never modified in place (clear() replaces them), so a worker can read them safely
+        return self.parents, self.names, self.kinds
+
+    def path(self, row):
+        return self.parents[row] + "/" + self.names[row]
+
+    def isDir(self, row):
+        return self.kinds[row] == self.FOLDER
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < len(self.names)
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(self.FETCH_SIZE, len(self.names) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self.loaded:
+            return None
+        row = index.row()
+        if role == Qt.ItemDataRole.DisplayRole:
+            detail = self.details.get(row)
+            return f"{self.names[row]}\n{detail}" if detail else self.names[row]
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.icon(self.kinds[row])
+        if role == Qt.ItemDataRole.ToolTipRole:
+            detail = self.details.get(row)
+            return f"{self.path(row)}\n{detail}" if detail else self.path(row)
+        if role == Qt.ItemDataRole.UserRole:
+            return self.path(row)
+        return None
+
+
 class SearchWindow(QDialog):
+    NAME_MODE, FUZZY_MODE, CONTENT_MODE = range(3)
+    TYPING_DELAY = 150
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Search")
@@ -234,9 +2350,10 @@ class SearchWindow(QDialog):
 
         # Create widgets
         self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Name, with optional filters: ext:log size:>100M mtime:<7d type:dir path:/srv")
         self.search_button = QPushButton("Search")
         self.search_results_view = QListView()
-        self.search_results_model = QStandardItemModel()
+        self.search_results_model = SearchResultsModel(self)
         self.search_results_view.setModel(self.search_results_model)
         self.search_results_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.search_results_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
@@ -247,12 +2364,38 @@ class SearchWindow(QDialog):
         self.search_results_view.setSelectionRectVisible(True)
         self.search_results_view.setFrameStyle(QListView.Shape.Box)
         self.search_results_view.setSelectionMode(QListView.SelectionMode.SingleSelection)
-        self.search_results_view.setLayoutMode(QListView.LayoutMode.SinglePass)
+        self.search_results_view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.search_results_view.setBatchSize(200)
+        self.search_results_view.setUniformItemSizes(True)
         self.search_results_view.setResizeMode(QListView.ResizeMode.Adjust)
         self.search_results_view.setMovement(QListView.Movement.Snap)
         self.search_results_view.setGridSize(QSize(100, 100))
         self.search_results_view.doubleClicked.connect(self.openSelectedFile)
 
+        # The index answers queries by default, a live walk of the disk is only done when asked for
+        self.file_index = parent.file_index if parent is not None else FileIndex()
+        self.pending_query = None
+        self.search_worker = None
+        self.stale_workers = []
+        self.last_search = None
+        self.results_complete = False
+        self.live_search_cb = QCheckBox("Live search (walk the disk instead of using the index)")
+        # Content mode greps the files below "Look in" instead of matching names
+        self.search_mode_cb = QComboBox()
+        self.search_mode_cb.addItems(["File names", "File names (ranked, fuzzy)", "File contents"])
+        self.search_mode_cb.currentIndexChanged.connect(self.onSearchModeChanged)
+        self.regex_cb = QCheckBox("Regular expression")
+        self.look_in_le = QLineEdit(parent.core_sys_model.rootPath() if parent is not None else QDir.homePath())
+        self.look_in_le.setPlaceholderText("Look in")
+        self.rebuild_index_button = QPushButton("Rebuild Index")
+        self.rebuild_index_button.clicked.connect(self.rebuildIndex)
+        self.search_status_l = QLabel()
+        self.updateIndexStatus()
+        if parent is not None and parent.index_watcher is not None and parent.index_watcher.isRunning():
+            # Searching already works while the index catches up, the status line follows along
+            parent.index_watcher.reconcileProgress.connect(self.updateIndexStatus)
+            parent.index_watcher.reconciled.connect(self.updateIndexStatus)
+
         self.cancel_button = QPushButton("Cancel")
         self.open_button = QPushButton("Open")
         self.button_box = QDialogButtonBox(Qt.Orientation.Horizontal)
@@ -261,40 +2404,217 @@ class SearchWindow(QDialog):
 
         # Create layout
         layout = QVBoxLayout()
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(self.search_mode_cb)
+        options_layout.addWidget(self.live_search_cb)
+        options_layout.addWidget(self.rebuild_index_button)
+        content_layout = QHBoxLayout()
+        content_layout.addWidget(self.look_in_le)
+        content_layout.addWidget(self.regex_cb)
         layout.addWidget(self.search_edit)
+        layout.addLayout(options_layout)
+        layout.addLayout(content_layout)
         layout.addWidget(self.search_button)
+        layout.addWidget(self.search_status_l)
         layout.addWidget(self.search_results_view)
         layout.addWidget(self.button_box)
         self.setLayout(layout)
 
         # Connect signals and slots
-        self.search_button.clicked.connect(self.searchFileSystem)
-        self.cancel_button.clicked.connect(self.reject)
+        self.search_button.clicked.connect(lambda: self.searchFileSystem())
+        self.cancel_button.clicked.connect(self.cancelSearch)
+
+        # Search as you type: a keystroke only restarts this timer, the query runs once typing pauses
+        self.typing_timer = QTimer(self)
+        self.typing_timer.setSingleShot(True)
+        self.typing_timer.setInterval(self.TYPING_DELAY)
+        self.typing_timer.timeout.connect(lambda: self.searchFileSystem(typed=True))
+        self.search_edit.textChanged.connect(self.typing_timer.start)
         self.open_button.clicked.connect(self.openSelectedFile)
+        self.onSearchModeChanged()
+
+    def onSearchModeChanged(self):
+        content_mode = self.search_mode_cb.currentIndex() == self.CONTENT_MODE
+        self.live_search_cb.setVisible(self.search_mode_cb.currentIndex() == self.NAME_MODE)
+        self.rebuild_index_button.setVisible(not content_mode)
+        self.look_in_le.setVisible(content_mode)
+        self.regex_cb.setVisible(content_mode)
 
-    def searchFileSystem(self):
+    def searchFileSystem(self, typed=False):
         query = self.search_edit.text()
-        if query:
+        mode = self.search_mode_cb.currentIndex()
+        if not query.strip():
+            # Nothing to look for, an emptied search box empties the results too
+            self.stopSearch(wait=False)
+            self.typing_timer.stop()
             self.search_results_model.clear()
-            for root, dirs, files in os.walk("/"):
-                for name in dirs + files:
-                    if query.lower() in name.lower():
-                        item = QStandardItem(name)
-                        path = os.path.join(root, name)
-                        if os.path.isdir(path):
-                            item.setIcon(QIcon("icons/folder.png"))
-                        else:
-                            item.setIcon(QIcon("icons/file.png"))
-                        item.setData(path, Qt.ItemDataRole.UserRole)
-                        self.search_results_model.appendRow(item)
-            if self.search_results_model.rowCount() == 0:
-                item = QStandardItem("No results found.")
-                self.search_results_model.appendRow(item)
+            self.last_search = None
+            self.search_status_l.clear()
+            return
+        if typed and (mode == self.CONTENT_MODE or self.live_search_cb.isChecked() and mode == self.NAME_MODE
+                      or not self.file_index.isBuilt()):
+            # Walking the disk is far too slow to redo on every keystroke, those wait for the Search button
+            return
+        # While typing the old query is dropped without waiting for it, its late results are ignored
+        self.stopSearch(wait=not typed)
+        self.typing_timer.stop()
+        if mode == self.CONTENT_MODE:
+            self.search_results_model.clear()
+            self.last_search = None
+            self.searchContents(query)
+            return
+        try:
+            name_query, clauses, params = parseSearchQuery(query)
+        except ValueError as e:
+            if not typed:
+                QMessageBox.warning(self, "Warning", str(e))
+            return
+        filters = [word for word in query.split() if SEARCH_FILTER.match(word)]
+        previous = None
+        if typed and mode == self.NAME_MODE and self.canRefine(name_query, filters):
+            # Every name containing the new query also contained the previous one
+            previous = self.search_results_model.snapshot()
+        self.search_results_model.clear()
+        self.last_search = (mode, filters, name_query.lower())
+        self.results_complete = False
+        if mode == self.NAME_MODE and self.live_search_cb.isChecked():
+            if clauses:
+                QMessageBox.warning(self, "Warning", "Filters are answered from the search index, "
+                                                     "untick Live search to use them.")
+                return
+            self.search_worker = SearchWorker(query, None, "/", self)
+        elif not self.file_index.isBuilt():
+            # First search ever, build the index once and answer the query when it is ready
+            self.pending_query = query
+            self.rebuildIndex()
+            return
+        else:
+            # Filters alone have nothing to rank, they are listed like a plain name search
+            fuzzy = mode == self.FUZZY_MODE and bool(name_query)
+            self.search_worker = SearchWorker(name_query, self.file_index, "/", self, fuzzy, clauses, params,
+                                              previous)
+        self.search_worker.resultsReady.connect(self.addResults)
+        self.search_worker.progress.connect(self.onSearchProgress)
+        self.search_worker.done.connect(self.onSearchDone)
+        self.search_worker.start()
+
+    def canRefine(self, name_query, filters):
+        if self.last_search is None or not self.results_complete:
+            return False
+        mode, last_filters, last_needle = self.last_search
+        return mode == self.NAME_MODE and last_filters == filters and last_needle in name_query.lower()
+
+    def searchContents(self, pattern):
+        if self.regex_cb.isChecked():
+            try:
+                re.compile(pattern.encode("utf-8"))
+            except re.error as e:
+                QMessageBox.warning(self, "Warning", f"Invalid regular expression: {e}")
+                return
+        root = self.look_in_le.text() or "/"
+        if not os.path.isdir(root):
+            QMessageBox.warning(self, "Warning", f"'{root}' is not a folder.")
+            return
+        self.search_worker = ContentSearchWorker(pattern, root, self.regex_cb.isChecked(), self)
+        self.search_worker.resultsReady.connect(self.addContentResults)
+        self.search_worker.progress.connect(self.onSearchProgress)
+        self.search_worker.done.connect(self.onSearchDone)
+        self.search_worker.start()
+
+    def addContentResults(self, batch):
+        if self.sender() is not self.search_worker:
+            return
+        details = {}
+        for path, lines in batch:
+            shown = ", ".join(str(line) for line in lines[:5]) + (", ..." if len(lines) > 5 else "")
+            details[path] = f"line {shown}"
+        self.search_results_model.appendHits([(path, False) for path, lines in batch], details)
+
+    def addResults(self, batch):
+        # Ignore batches still queued from a search that has been replaced
+        if self.sender() is not self.search_worker:
+            return
+        self.search_results_model.appendHits(batch)
+
+    def onSearchProgress(self, hits, scanned, rate):
+        if self.sender() is not self.search_worker:
+            return
+        self.search_status_l.setText(f"{hits} results, {scanned} scanned ({rate:,.0f}/s)")
+
+    def onSearchDone(self, cancelled):
+        if self.sender() is not self.search_worker:
+            return
+        self.results_complete = not cancelled
+        if cancelled:
+            self.search_status_l.setText(self.search_status_l.text() + " - cancelled")
+        elif self.search_results_model.hitCount() == 0:
+            self.search_status_l.setText("No results found.")
+
+    def stopSearch(self, wait=True):
+        # Returns True if a running search had to be stopped
+        self.stale_workers = [worker for worker in self.stale_workers if worker.isRunning()]
+        if wait:
+            for worker in self.stale_workers:
+                worker.wait()
+        if self.search_worker is not None and self.search_worker.isRunning():
+            self.search_worker.cancel()
+            if wait:
+                self.search_worker.wait()
+            else:
+                self.stale_workers.append(self.search_worker)
+            return True
+        return False
+
+    def cancelSearch(self):
+        # Cancel stops a running search first and only closes the dialog when nothing is running
+        if not self.stopSearch():
+            self.reject()
+
+    def reject(self):
+        self.stopSearch()
+        super().reject()
+
+    def accept(self):
+        self.stopSearch()
+        super().accept()
+
+    def rebuildIndex(self):
+        builder = self.parent().startIndexBuild()
+        builder.progress.connect(self.onIndexProgress)
+        builder.done.connect(self.onIndexBuilt)
+        self.rebuild_index_button.setEnabled(False)
+        self.search_status_l.setText("Building the search index...")
+
+    def onIndexProgress(self, count):
+        self.search_status_l.setText(f"Building the search index... {count} entries")
+
+    def onIndexBuilt(self, ok):
+        self.rebuild_index_button.setEnabled(True)
+        self.updateIndexStatus()
+        if ok and self.pending_query:
+            self.search_edit.setText(self.pending_query)
+            self.pending_query = None
+            self.searchFileSystem()
+
+    def updateIndexStatus(self, *args):
+        if self.search_worker is not None and self.search_worker.isRunning():
+            return
+        built_at = self.file_index.builtAt()
+        if built_at is None:
+            self.search_status_l.setText("The search index has not been built yet")
+        else:
+            built_on = time.strftime("%Y-%m-%d %H:%M", time.localtime(built_at))
+            status = f"Search index built on {built_on}"
+            if self.parent() is not None and self.parent().reconcileStatus():
+                status += f", {self.parent().reconcileStatus()}"
+            self.search_status_l.setText(status)
 
     def openSelectedFile(self):
         index = self.search_results_view.currentIndex()
         if index.isValid():
             path = index.data(Qt.ItemDataRole.UserRole)
+            if path is None:
+                return
             if os.path.isfile(path):
                 QDesktopServices.openUrl(QUrl.fromLocalFile(path))
             elif os.path.isdir(path):
@@ -302,6 +2622,1738 @@ class SearchWindow(QDialog):
             self.accept()
 
 
+def squarify(sizes, x, y, width, height):
+    """ Squarified treemap layout, one (x, y, width, height) per size (sorted largest first) """
+    total = sum(sizes)
+    if not sizes or total <= 0 or width <= 0 or height <= 0:
+        return [(x, y, 0, 0)] * len(sizes)
+    areas = [size * width * height / total for size in sizes]
+    rects = []
+    i = 0
+    while i < len(areas):
+        side = min(width, height)
+        row = [areas[i]]
+        i += 1
+        worst = worstAspectRatio(row, side)
+        while i < len(areas):
+            ratio = worstAspectRatio(row + [areas[i]], side)
+            if ratio > worst:
+                break
+            row.append(areas[i])
+            worst = ratio
+            i += 1
+        row_area = sum(row)
+        if width >= height:
+            # The row becomes a column along the left edge
+            column_width = row_area / height
+            offset = y
+            for area in row:
+                rects.append((x, offset, column_width, area / column_width))
+                offset += area / column_width
+            x += column_width
+            width -= column_width
+        else:
+            row_height = row_area / width
+            offset = x
+            for area in row:
+                rects.append((offset, y, area / row_height, row_height))
+                offset += area / row_height
+            y += row_height
+            height -= row_height
+    return rects
+
+
+def worstAspectRatio(row, side):
+    total = sum(row)
+    return max(side * side * max(row) / (total * total), total * total / (side * side * min(row)))
+
+
+class DiskUsageThread(QThread):
+    """ Parallel size scan for the disk usage view """
+    progress = pyqtSignal(list, list, list, int, "qint64")
+    done = pyqtSignal(bool)
+
+    TOP_N = 100
+    # Folder levels below the root the treemap can show, deeper folders are forgotten once their size is known
+    TREEMAP_DEPTH = 4
+    PROGRESS_INTERVAL = 0.25
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root.rstrip("/") or "/"
+        self.root_depth = 0 if self.root == "/" else self.root.count("/")
+        # Totals, own file bytes and subfolders of the folders the treemap can show
+        self.totals = {}
+        self.own = {}
+        self.children = collections.defaultdict(list)
+        # Bytes so far and subfolders left of the folders still being scanned
+        self.sizes = {}
+        self.pending = {}
+        # The TOP_N largest finished folders as a min-heap
+        self.folders = []
+
+    def depth(self, path):
+        return path.count("/") - self.root_depth
+
+    def run(self):
+        files = []
+        linked = set()
+        scanned = 0
+        total_size = 0
+        last_emit = time.perf_counter()
+        # With stat_dirs even empty and unreadable folders come back from the walker, so each of them finishes
+        walker = ParallelWalker(self.root, should_stop=self.isInterruptionRequested, stat_dirs=True,
+                                stat_entries=True)
+        for directory, mtime, entries in walker:
+            own = 0
+            subdirs = 0
+            shown = self.depth(directory) < self.TREEMAP_DEPTH
+            for path, name, is_dir, info in entries:
+                scanned += 1
+                if is_dir:
+                    if path not in walker.skip:
+                        subdirs += 1
+                    if shown:
+                        self.children[directory].append(path)
+                    continue
+                if info is None:
+                    continue
+                if info.st_nlink > 1:
+                    key = (info.st_dev, info.st_ino)
+                    if key in linked:
+                        continue
+                    linked.add(key)
+                own += info.st_size
+                if len(files) < self.TOP_N:
+                    heapq.heappush(files, (info.st_size, path))
+                elif info.st_size > files[0][0]:
+                    heapq.heapreplace(files, (info.st_size, path))
+            if shown:
+                self.own[directory] = own
+            total_size += own
+            # The treemap folders above get the bytes right away, so it fills in while the scan runs
+            folder = directory
+            while True:
+                if self.depth(folder) <= self.TREEMAP_DEPTH:
+                    self.totals[folder] = self.totals.get(folder, 0) + own
+                parent = os.path.dirname(folder)
+                if folder == self.root or parent == folder:
+                    break
+                folder = parent
+            self.sizes[directory] = self.sizes.get(directory, 0) + own
+            # Subfolders listed before their parent have already counted themselves off
+            self.pending[directory] = self.pending.get(directory, 0) + subdirs
+            if not self.pending[directory]:
+                self.finishFolder(directory)
+            now = time.perf_counter()
+            if now - last_emit >= self.PROGRESS_INTERVAL:
+                self.emitProgress(files, scanned, total_size)
+                last_emit = now
+        # Folders that vanished during the scan, or an interrupted one, leave their parents waiting
+        for folder in sorted(self.pending, key=self.depth, reverse=True):
+            if folder in self.pending:
+                self.finishFolder(folder)
+        self.emitProgress(files, scanned, total_size)
+        self.done.emit(self.isInterruptionRequested())
+
+    def finishFolder(self, folder):
+        # Rolls a folder whose subfolders are all done into its parent, and its parent too once it's complete
+        while True:
+            size = self.sizes.pop(folder)
+            del self.pending[folder]
+            if folder == self.root:
+                return
+            if len(self.folders) < self.TOP_N:
+                heapq.heappush(self.folders, (size, folder))
+            elif size > self.folders[0][0]:
+                heapq.heapreplace(self.folders, (size, folder))
+            folder = os.path.dirname(folder)
+            self.sizes[folder] = self.sizes.get(folder, 0) + size
+            self.pending[folder] = self.pending.get(folder, 0) - 1
+            if self.pending[folder]:
+                return
+
+    def emitProgress(self, files, scanned, total_size):
+        self.progress.emit(sorted(files, reverse=True), sorted(self.folders, reverse=True),
+                           self.treemapItems(self.root), scanned, total_size)
+
+    def treemapItems(self, folder):
+        # (size, path, is_dir) of the subfolders of folder, plus the files directly in it as one block
+        items = [(self.totals.get(path, 0), path, True) for path in self.children.get(folder, ())]
+        if self.own.get(folder):
+            items.append((self.own[folder], folder, False))
+        return sorted((item for item in items if item[0] > 0), reverse=True)
+
+
+class TreemapWidget(QWidget):
+    """ Draws (size, path, is_dir) items as a squarified treemap """
+    activated = pyqtSignal(str)
+
+    MAX_ITEMS = 200
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = []
+        self.rects = []
+        self.setMouseTracking(True)
+        self.setMinimumSize(300, 200)
+
+    def setItems(self, items):
+        # The smallest items would only be slivers, past MAX_ITEMS they are drawn as one block
+        if len(items) > self.MAX_ITEMS:
+            rest = sum(item[0] for item in items[self.MAX_ITEMS - 1:])
+            items = items[:self.MAX_ITEMS - 1] + [(rest, "", False)]
+        self.items = items
+        self.layoutItems()
+        self.update()
+
+    def layoutItems(self):
+        sizes = [item[0] for item in self.items]
+        self.rects = [QRectF(*rect) for rect in squarify(sizes, 0, 0, self.width(), self.height())]
+
+    def itemAt(self, pos):
+        for item, rect in zip(self.items, self.rects):
+            if rect.contains(pos.toPointF()):
+                return item
+        return None
+
+    def resizeEvent(self, event):
+        self.layoutItems()
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        metrics = QFontMetrics(self.font())
+        for i, ((size, path, is_dir), rect) in enumerate(zip(self.items, self.rects)):
+            color = QColor.fromHsv((i * 37) % 360, 80, 235) if is_dir else QColor("#d0d0d0")
+            painter.fillRect(rect, color)
+            painter.setPen(QColor("#808080"))
+            painter.drawRect(rect)
+            if rect.width() > 40 and rect.height() > metrics.height() + 4:
+                label = os.path.basename(path) if is_dir else "(files)" if path else "(other)"
+                label = metrics.elidedText(f"{label} {formatSize(size)}", Qt.TextElideMode.ElideRight,
+                                           int(rect.width()) - 6)
+                painter.setPen(QColor("black"))
+                painter.drawText(rect.adjusted(3, 2, -3, -2),
+                                 Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, label)
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        item = self.itemAt(event.position().toPoint())
+        if item is not None:
+            size, path, is_dir = item
+            text = path if is_dir else f"Files in {path}" if path else "Smaller items"
+            QToolTip.showText(event.globalPosition().toPoint(), f"{text}\n{formatSize(size)}", self)
+
+    def mouseDoubleClickEvent(self, event):
+        item = self.itemAt(event.position().toPoint())
+        if item is not None and item[2]:
+            self.activated.emit(item[1])
+
+
+class SizeTableItem(QTableWidgetItem):
+    # Sorts by the byte count stored in UserRole instead of the formatted text
+    def __init__(self, size):
+        super().__init__(formatSize(size))
+        self.setData(Qt.ItemDataRole.UserRole, size)
+
+    def __lt__(self, other):
+        return self.data(Qt.ItemDataRole.UserRole) < other.data(Qt.ItemDataRole.UserRole)
+
+
+class DiskUsageWindow(QDialog):
+    """ What filled the disk, as a treemap and a list of the largest files and folders """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Disk Usage")
+        self.resize(900, 600)
+        self.scan_thread = None
+        self.treemap_root = None
+
+        self.root_le = QLineEdit(parent.core_sys_model.rootPath() if parent is not None else QDir.homePath())
+        self.root_le.setPlaceholderText("Folder to scan")
+        self.root_le.returnPressed.connect(self.startScan)
+        self.scan_button = QPushButton("Scan")
+        self.scan_button.clicked.connect(self.startScan)
+        self.up_button = QPushButton("Up")
+        self.up_button.setEnabled(False)
+        self.up_button.clicked.connect(self.showParentFolder)
+        self.status_l = QLabel()
+        self.treemap_l = QLabel()
+
+        self.treemap = TreemapWidget()
+        self.treemap.activated.connect(self.showFolder)
+
+        self.top_table = QTableWidget(0, 3)
+        self.top_table.setHorizontalHeaderLabels(["Size", "Type", "Path"])
+        self.top_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.top_table.verticalHeader().setVisible(False)
+        self.top_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.top_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.top_table.setSortingEnabled(True)
+        self.top_table.doubleClicked.connect(self.openTopItem)
+
+        self.cancel_button = QPushButton("Close")
+        self.cancel_button.clicked.connect(self.reject)
+
+        layout = QVBoxLayout()
+        root_layout = QHBoxLayout()
+        root_layout.addWidget(self.root_le)
+        root_layout.addWidget(self.scan_button)
+        treemap_layout = QHBoxLayout()
+        treemap_layout.addWidget(self.treemap_l)
+        treemap_layout.addWidget(self.up_button)
+        results_layout = QHBoxLayout()
+        results_layout.addWidget(self.treemap, 3)
+        results_layout.addWidget(self.top_table, 2)
+        layout.addLayout(root_layout)
+        layout.addWidget(self.status_l)
+        layout.addLayout(treemap_layout)
+        layout.addLayout(results_layout)
+        layout.addWidget(self.cancel_button, alignment=Qt.AlignmentFlag.AlignRight)
+        self.setLayout(layout)
+
+    def startScan(self):
+        root = self.root_le.text()
+        if not os.path.isdir(root):
+            QMessageBox.warning(self, "Warning", f"'{root}' is not a folder.")
+            return
+        self.stopScan()
+        self.scan_thread = DiskUsageThread(root, self)
+        self.scan_thread.progress.connect(self.onScanProgress)
+        self.scan_thread.done.connect(self.onScanDone)
+        self.treemap_root = self.scan_thread.root
+        self.treemap_l.setText(self.treemap_root)
+        self.up_button.setEnabled(False)
+        self.status_l.setText("Scanning...")
+        self.scan_thread.start()
+
+    def onScanProgress(self, files, folders, treemap_items, scanned, total_size):
+        if self.sender() is not self.scan_thread:
+            return
+        self.status_l.setText(f"{scanned} items scanned, {formatSize(total_size)}")
+        if self.treemap_root == self.scan_thread.root:
+            self.treemap.setItems(treemap_items)
+        self.top_table.setSortingEnabled(False)
+        self.top_table.setRowCount(len(files) + len(folders))
+        rows = [(size, path, "File") for size, path in files] + [(size, path, "Folder") for size, path in folders]
+        rows.sort(reverse=True)
+        for row, (size, path, kind) in enumerate(rows):
+            self.top_table.setItem(row, 0, SizeTableItem(size))
+            self.top_table.setItem(row, 1, QTableWidgetItem(kind))
+            self.top_table.setItem(row, 2, QTableWidgetItem(path))
+        self.top_table.setSortingEnabled(True)
+
+    def onScanDone(self, cancelled):
+        if self.sender() is not self.scan_thread:
+            return
+        if cancelled:
+            self.status_l.setText(self.status_l.text() + " - cancelled")
+
+    def scanFinished(self):
+        return self.scan_thread is not None and self.scan_thread.isFinished()
+
+    def showFolder(self, path):
+        # Subfolders are only complete once the whole scan is done, and only kept down to TREEMAP_DEPTH
+        if not self.scanFinished() or path not in self.scan_thread.own:
+            return
+        self.treemap_root = path
+        self.treemap_l.setText(path)
+        self.treemap.setItems(self.scan_thread.treemapItems(path))
+        self.up_button.setEnabled(path != self.scan_thread.root)
+
+    def showParentFolder(self):
+        if self.treemap_root is not None:
+            self.showFolder(os.path.dirname(self.treemap_root))
+
+    def openTopItem(self, index):
+        path = self.top_table.item(index.row(), 2).text()
+        if (self.top_table.item(index.row(), 1).text() == "Folder" and self.scanFinished()
+                and path in self.scan_thread.own):
+            self.showFolder(path)
+        else:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def stopScan(self):
+        if self.scan_thread is not None and self.scan_thread.isRunning():
+            self.scan_thread.requestInterruption()
+            self.scan_thread.wait()
+
+    def reject(self):
+        self.stopScan()
+        super().reject()
+
+
+class CopyEngine:
+    """ Copies one file through the fastest path the filesystems allow """
+    FICLONE = 0x40049409
+    CHUNK_SIZE = 64 * 1024 * 1024
+    BUFFER_SIZE = 8 * 1024 * 1024
+    # SHA-256 runs in hardware (SHA-NI, ARMv8 crypto) on most CPUs, well ahead of BLAKE2b there
+    VERIFY_HASH = "sha256"
+    STRATEGIES = ("reflink", "copy_file_range", "sendfile", "read/write")
+    # errno values that mean "not possible here" rather than a real failure
+    UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                   errno.ETXTBSY, errno.EPERM}
+
+    def __init__(self, strategies=None, verify=False):
+        self.strategies = strategies or self.STRATEGIES
+        self.verify = verify
+        self.verify_time = 0.0
+        self.lock = threading.Lock()
+        # (strategy, source device, destination device) that failed as unsupported, so they aren't tried per file
+        self.unsupported = set()
+        self.methods = {
+            "reflink": self.reflink,
+            "copy_file_range": self.copyFileRange,
+            "sendfile": self.sendFile,
+            "read/write": self.readWrite,
+        }
+
+    def copyFile(self, src, dst, progress=None, should_stop=None, journal=None):
+        """ Copies src to a new file dst, returns the strategy that did it or None when stopped """
+        # progress gets the byte count of every piece, with a second argument of 0 for bytes that weren't
+        # written (holes, or what an earlier run already copied), and negative counts for a strategy that gave up
+        src_fd = os.open(src, os.O_RDONLY)
+        try:
+            info = os.fstat(src_fd)
+            size = info.st_size
+            offset = journal.resumeOffset(src_fd, info, dst) if journal is not None else None
+            if offset is None:
+                dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                offset = 0
+            elif offset == size:
+                if progress:
+                    progress(size, 0)
+                return "resumed"
+            else:
+                dst_fd = os.open(dst, os.O_WRONLY)
+                os.ftruncate(dst_fd, offset)
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                if progress and offset:
+                    progress(offset, 0)
+            journaled = journal is not None and size >= journal.MIN_SIZE
+            if journaled:
+                progress = journal.tracker(src_fd, dst_fd, info, dst, offset, progress)
+            devices = (info.st_dev, os.fstat(dst_fd).st_dev)
+            sparse = info.st_blocks * 512 < size
+            extents = list(self.dataExtents(src_fd, offset, size)) if sparse else [(offset, size)]
+            strategies = ("read/write",) if self.verify else self.strategies
+            hasher = hashlib.new(self.VERIFY_HASH) if self.verify else None
+            strategy = None
+            # (bytes, bytes written) reported by the current strategy, taken back when it has to give up
+            reported = [0, 0]
+
+            def track(piece, written=None):
+                reported[0] += piece
+                reported[1] += piece if written is None else written
+                progress(piece, written)
+            try:
+                for name in strategies:
+                    if (name, *devices) in self.unsupported and name != strategies[-1]:
+                        continue
+                    if offset and name == "reflink":
+                        # A clone is all or nothing, it can't carry on from a checkpoint
+                        continue
+                    reported[:] = [0, 0]
+                    try:
+                        if self.copyData(name, src_fd, dst_fd, extents, offset, size, progress and track, should_stop,
+                                         hasher):
+                            strategy = name
+                        break
+                    except OSError as e:
+                        if e.errno not in self.UNSUPPORTED or name == strategies[-1]:
+                            raise
+                        self.unsupported.add((name, *devices))
+                        # Start the next strategy from scratch, progress included
+                        os.ftruncate(dst_fd, offset)
+                        os.lseek(dst_fd, offset, os.SEEK_SET)
+                        if progress and reported[0]:
+                            progress(-reported[0], -reported[1])
+                if strategy is not None and hasher is not None:
+                    started = time.perf_counter()
+                    os.fdatasync(dst_fd)
+                    self.checkCopy(dst, extents, hasher.digest())
+                    with self.lock:
+                        self.verify_time += time.perf_counter() - started
+            except BaseException:
+                os.close(dst_fd)
+                os.unlink(dst)
+                if journaled:
+                    journal.finishFile(dst)
+                raise
+            os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+        if strategy is None:
+            # A half written file is worse than none, unless the journal is kept to resume it later
+            if not (journaled and journal.keep):
+                os.unlink(dst)
+                if journaled:
+                    journal.finishFile(dst)
+            return None
+        shutil.copystat(src, dst)
+        if journaled:
+            journal.finishFile(dst)
+        return strategy
+
+    def copyData(self, name, src_fd, dst_fd, extents, offset, size, progress, should_stop, hasher=None):
+        method = self.methods[name]
+        if name == "reflink":
+            return method(src_fd, dst_fd, offset, size, progress, should_stop)
+        for start, end in extents:
+            if progress and start > offset:
+                progress(start - offset, 0)
+            if hasher is not None:
+                # Where the data sits is part of what is checked
+                hasher.update(struct.pack("<QQ", start, end))
+                done = self.readWrite(src_fd, dst_fd, start, end, progress, should_stop, hasher)
+            else:
+                done = method(src_fd, dst_fd, start, end, progress, should_stop)
+            if not done:
+                return False
+            offset = end
+        if progress and size > offset:
+            progress(size - offset, 0)
+        # A hole at the end isn't written either, the size makes it
+        os.ftruncate(dst_fd, size)
+        return True
+
+    def checkCopy(self, dst, extents, digest):
+        """ Reads the extents of dst back, raises OSError when they don't hash to digest """
+        hasher = hashlib.new(self.VERIFY_HASH)
+        buffer = bytearray(self.BUFFER_SIZE)
+        view = memoryview(buffer)
+        fd = os.open(dst, os.O_RDONLY)
+        try:
+            # Read from the disk, not the pages just written. Where the kernel keeps them anyway
+            # (tmpfs) or can't drop them this is a second hash of the same data
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+            for start, end in extents:
+                hasher.update(struct.pack("<QQ", start, end))
+                offset = start
+                while offset < end:
+                    read = os.preadv(fd, [view[:min(len(buffer), end - offset)]], offset)
+                    if not read:
+                        break
+                    hasher.update(view[:read])
+                    offset += read
+        finally:
+            os.close(fd)
+        if hasher.digest() != digest:
+            raise OSError(errno.EIO, "Copy differs from the source", dst)
+
+    @staticmethod
+    def dataExtents(fd, offset, size):
+        """ Yields (start, end) of the data between offset and size, the gaps between them are holes """
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    # Only a hole is left
+                    return
+                if e.errno != errno.EINVAL:
+                    raise
+                # No SEEK_DATA here, all of it counts as data
+                yield offset, size
+                return
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            if start >= end:
+                return
+            yield start, end
+            offset = end
+
+    def reflink(self, src_fd, dst_fd, offset, size, progress, should_stop):
+        fcntl.ioctl(dst_fd, self.FICLONE, src_fd)
+        if progress:
+            progress(size)
+        return True
+
+    def copyFileRange(self, src_fd, dst_fd, offset, size, progress, should_stop):
+        while offset < size:
+            if should_stop and should_stop():
+                return False
+            copied = os.copy_file_range(src_fd, dst_fd, min(self.CHUNK_SIZE, size - offset), offset, offset)
+            if not copied:
+                break
+            offset += copied
+            if progress:
+                progress(copied)
+        return True
+
+    def sendFile(self, src_fd, dst_fd, offset, size, progress, should_stop):
+        # sendfile writes at the file position of dst_fd
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while offset < size:
+            if should_stop and should_stop():
+                return False
+            copied = os.sendfile(dst_fd, src_fd, offset, min(self.CHUNK_SIZE, size - offset))
+            if not copied:
+                break
+            offset += copied
+            if progress:
+                progress(copied)
+        return True
+
+    def readWrite(self, src_fd, dst_fd, offset, size, progress, should_stop, hasher=None):
+        buffer = bytearray(self.BUFFER_SIZE)
+        view = memoryview(buffer)
+        while offset < size:
+            if should_stop and should_stop():
+                return False
+            copied = os.preadv(src_fd, [view[:min(len(buffer), size - offset)]], offset)
+            if not copied:
+                break
+            if hasher is not None:
+                hasher.update(view[:copied])
+            written = 0
+            while written < copied:
+                written += os.pwrite(dst_fd, view[written:copied], offset + written)
+            offset += copied
+            if progress:
+                progress(copied)
+        return True
+
+
+class TreeCopier:
+    """ Parallel copy of a folder tree, built for trees of many small files """
+    IN_FLIGHT = 4
+    BATCH_SIZE = 32
+
+    def __init__(self, engine=None, workers=None, progress=None, should_stop=None, on_error=None, on_copied=None,
+                 journal=None):
+        self.engine = engine or CopyEngine()
+        self.journal = journal
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.progress = progress
+        self.should_stop = should_stop
+        self.on_error = on_error
+        self.on_copied = on_copied
+
+    def copy(self, src, dst):
+        dirs = [""]
+        files = []
+        links = []
+        for folder, (directory, mtime, entries) in enumerate(
+                ParallelWalker(src, should_stop=self.should_stop, skip=set(), stat_entries=True, on_error=self.error)):
+            relative = os.path.relpath(directory, src)
+            position = 0
+            for path, name, is_dir, info in entries:
+                name = name if relative == "." else os.path.join(relative, name)
+                if is_dir:
+                    dirs.append(name)
+                elif info is None:
+                    self.error(path, OSError(errno.EIO, "Can't read its metadata"))
+                elif stat.S_ISLNK(info.st_mode):
+                    links.append(name)
+                elif stat.S_ISREG(info.st_mode):
+                    files.append((position, folder, name))
+                    position += 1
+                else:
+                    self.error(path, OSError(errno.EOPNOTSUPP, "Special file (FIFO, socket or device) skipped"))
+        if self.stopped():
+            return
+        # Creating files in one folder serialises on its directory lock, so the workers are handed
+        # the first file of every folder, then the second of every folder and so on
+        files.sort()
+
+        # Skeleton first: sorted, so every parent exists before its children
+        dirs.sort()
+        made = set()
+        for name in dirs:
+            try:
+                os.mkdir(os.path.join(dst, name) if name else dst, 0o700)
+                made.add(name)
+            except OSError as e:
+                if e.errno == errno.EEXIST and self.resuming():
+                    made.add(name)
+                else:
+                    self.error(os.path.join(dst, name), e)
+        for name in links:
+            try:
+                os.symlink(os.readlink(os.path.join(src, name)), os.path.join(dst, name))
+            except OSError as e:
+                if e.errno != errno.EEXIST or not self.resuming():
+                    self.error(os.path.join(dst, name), e)
+
+        # Files go to the pool in batches, one future per small file would cost more than the copy
+        batches = [[name for position, folder, name in files[i:i + self.BATCH_SIZE]]
+                   for i in range(0, len(files), self.BATCH_SIZE)]
+        if self.workers == 1:
+            for batch in batches:
+                self.copyFiles(src, dst, batch)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = collections.deque()
+                for batch in batches:
+                    if self.stopped():
+                        break
+                    if len(pending) >= self.workers * self.IN_FLIGHT:
+                        pending.popleft().result()
+                    pending.append(pool.submit(self.copyFiles, src, dst, batch))
+                for future in pending:
+                    future.result()
+
+        # Deepest folders first, so fixing a child doesn't touch the parent's mtime after it was set
+        for name in sorted(made, reverse=True):
+            try:
+                shutil.copystat(os.path.join(src, name) if name else src, os.path.join(dst, name) if name else dst,
+                                follow_symlinks=False)
+            except OSError:
+                pass
+
+    def copyFiles(self, src, dst, names):
+        for name in names:
+            if self.stopped():
+                return
+            try:
+                strategy = self.engine.copyFile(os.path.join(src, name), os.path.join(dst, name),
+                                                progress=self.progress, should_stop=self.should_stop,
+                                                journal=self.journal)
+            except OSError as e:
+                self.error(os.path.join(src, name), e)
+                continue
+            if strategy is not None and self.on_copied:
+                self.on_copied(strategy)
+
+    def stopped(self):
+        return self.should_stop is not None and self.should_stop()
+
+    def resuming(self):
+        return self.journal is not None and self.journal.resuming
+
+    def error(self, path, e):
+        if self.on_error:
+            self.on_error(path, e.strerror or str(e))
+
+
+class MoveEngine:
+    """ Moves files so that none is ever missing from both sides """
+    PART_SUFFIX = ".tanz-part"
+
+    def __init__(self, engine=None):
+        # The source is deleted afterwards, so by default every copy is hashed and read back first
+        self.engine = engine or CopyEngine(verify=True)
+
+    @classmethod
+    def partPath(cls, dst):
+        return os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}{cls.PART_SUFFIX}")
+
+    def moveFile(self, src, dst, progress=None, should_stop=None, journal=None):
+        """ Moves the file src to dst, returns "rename", the copy strategy, or None when stopped """
+        strategy = self.placeFile(src, dst, progress, should_stop, journal)
+        if strategy not in (None, "rename"):
+            self.removeSources([(src, dst)])
+        return strategy
+
+    def moveFiles(self, pairs, progress=None, should_stop=None, on_error=None, on_moved=None, journal=None):
+        """ Moves a batch of files, failures go to on_error(path, message) and leave the source alone """
+        placed = []
+        for src, dst in pairs:
+            if should_stop and should_stop():
+                break
+            try:
+                strategy = self.placeFile(src, dst, progress, should_stop, journal)
+            except OSError as e:
+                self.error(on_error, src, e)
+                continue
+            if strategy is None:
+                break
+            if strategy != "rename":
+                placed.append((src, dst))
+            if on_moved:
+                on_moved(strategy)
+        self.removeSources(placed, on_error)
+
+    def placeFile(self, src, dst, progress=None, should_stop=None, journal=None):
+        # Puts a complete, synced copy of src at dst, the source stays until removeSources
+        resuming = journal is not None and journal.resuming
+        before = os.stat(src)
+        if os.path.lexists(dst):
+            if resuming and TransferJournal.sameFile(before, dst):
+                # Renamed into place by the run that died, only the source was left
+                if progress:
+                    progress(before.st_size, 0)
+                return "resumed"
+            raise FileExistsError(errno.EEXIST, "Destination already exists", dst)
+        try:
+            os.rename(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        else:
+            if progress:
+                progress(before.st_size, 0)
+            return "rename"
+
+        # Across filesystems the copy goes to a hidden part file, which only gets the real name once it is
+        # synced and checked against the source, so a crash never leaves a half file under that name
+        part = self.partPath(dst)
+        if os.path.lexists(part) and not resuming:
+            # Left behind by a move that died, the source it came from is still there
+            os.unlink(part)
+        strategy = self.engine.copyFile(src, part, progress=progress, should_stop=should_stop, journal=journal)
+        if strategy is None:
+            return None
+        try:
+            fd = os.open(part, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                copied = os.fstat(fd)
+            finally:
+                os.close(fd)
+            after = os.stat(src)
+            if copied.st_size != before.st_size or \
+                    (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+                raise OSError(errno.EIO, "Source changed while it was moved", src)
+            if os.path.lexists(dst):
+                raise FileExistsError(errno.EEXIST, "Destination already exists", dst)
+            os.rename(part, dst)
+        except BaseException:
+            os.unlink(part)
+            raise
+        return strategy
+
+    def removeSources(self, pairs, on_error=None):
+        # The renames into place have to be on disk before the sources go
+        synced = {}
+        for src, dst in pairs:
+            folder = os.path.dirname(dst)
+            if folder not in synced:
+                try:
+                    self.syncDirectory(folder)
+                    synced[folder] = True
+                except OSError as e:
+                    synced[folder] = False
+                    self.error(on_error, folder, e)
+            if not synced[folder]:
+                continue
+            try:
+                os.unlink(src)
+            except OSError as e:
+                self.error(on_error, src, e)
+
+    @staticmethod
+    def syncDirectory(path):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            # Some filesystems (FUSE, some network ones) can't sync folders, there is nothing more to do there
+            if e.errno != errno.EINVAL:
+                raise
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def error(on_error, path, e):
+        if on_error is None:
+            raise e
+        on_error(path, e.strerror or str(e))
+
+
+class TreeMover(TreeCopier):
+    """ A TreeCopier whose files go through the MoveEngine """
+    def __init__(self, engine=None, workers=None, progress=None, should_stop=None, on_error=None, on_copied=None,
+                 journal=None):
+        super().__init__(engine, workers, progress, should_stop, on_error, on_copied, journal)
+        self.mover = MoveEngine(self.engine)
+
+    def move(self, src, dst):
+        self.copy(src, dst)
+        if not self.stopped():
+            self.removeSource(src, dst)
+
+    def copyFiles(self, src, dst, names):
+        self.mover.moveFiles([(os.path.join(src, name), os.path.join(dst, name)) for name in names],
+                             self.progress, self.should_stop, self.on_error, self.on_copied, self.journal)
+
+    def removeSource(self, src, dst):
+        for directory, dirnames, filenames in os.walk(src, topdown=False,
+                                                      onerror=lambda e: self.error(e.filename, e)):
+            relative = os.path.relpath(directory, src)
+            target = dst if relative == "." else os.path.join(dst, relative)
+            # os.walk lists links to folders with the folders
+            links = [name for name in dirnames + filenames
+                     if os.path.islink(os.path.join(directory, name)) and os.path.islink(os.path.join(target, name))]
+            if links:
+                try:
+                    MoveEngine.syncDirectory(target)
+                except OSError as e:
+                    self.error(target, e)
+                    continue
+                for name in links:
+                    try:
+                        os.unlink(os.path.join(directory, name))
+                    except OSError as e:
+                        self.error(os.path.join(directory, name), e)
+            try:
+                os.rmdir(directory)
+            except OSError as e:
+                if e.errno == errno.ENOTEMPTY:
+                    # Whatever is left wasn't moved, the folder has to stay and say so
+                    e = OSError(errno.ENOTEMPTY, "Not everything in it was moved, the rest is still here")
+                self.error(directory, e)
+
+
+class TransferJournal:
+    """ Unfinished transfers, kept in SQLite so they survive a crash or logout """
+    # Files of MIN_SIZE and more are checkpointed every CHECKPOINT_SIZE (or CHECKPOINT_PARTS times for smaller
+    # files) with a digest of the TAIL_SIZE bytes before the offset, a resume only carries on when that tail
+    # still matches on both sides
+    MIN_SIZE = 256 * 1024 * 1024
+    CHECKPOINT_SIZE = 1024 * 1024 * 1024
+    CHECKPOINT_PARTS = 4
+    TAIL_SIZE = 1024 * 1024
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(cacheDirectory(), "transfers.db")
+        self.local = threading.local()
+        self.createTables()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def createTables(self):
+        conn = self.connection()
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                            id INTEGER PRIMARY KEY,
+                            kind TEXT NOT NULL,
+                            verify INTEGER NOT NULL DEFAULT 0,
+                            pid INTEGER,
+                            boot_id TEXT,
+                            started INTEGER)""")
+        # Journals from before boot id and start time were kept get the columns, their jobs keep pid only
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("boot_id", "TEXT"), ("started", "INTEGER")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.execute("CREATE TABLE IF NOT EXISTS pairs (job INTEGER, position INTEGER, src TEXT, dst TEXT)")
+        # Destinations a job made, written down before they exist so a discard can find them after a crash
+        conn.execute("CREATE TABLE IF NOT EXISTS created (job INTEGER NOT NULL, path TEXT NOT NULL, PRIMARY KEY (job, path))")
+        conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                            job INTEGER NOT NULL,
+                            dst TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            mtime INTEGER NOT NULL,
+                            offset INTEGER NOT NULL,
+                            tail BLOB NOT NULL,
+                            PRIMARY KEY (job, dst))""")
+        conn.commit()
+
+    def addJob(self, kind, pairs, verify=False):
+        conn = self.connection()
+        job_id = conn.execute("INSERT INTO jobs (kind, verify, pid, boot_id, started) VALUES (?, ?, ?, ?, ?)",
+                              (kind, int(verify), os.getpid(), *self.processIdentity(os.getpid()))).lastrowid
+        conn.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?)",
+                         [(job_id, position, src, dst) for position, (src, dst) in enumerate(pairs)])
+        conn.commit()
+        return job_id
+
+    def claimJob(self, job_id):
+        """ Takes over the job of a process that is gone, False when a running one has it """
+        conn = self.connection()
+        # Two file managers started together see the same unfinished jobs, only one may get each
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT pid, boot_id, started FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or self.isRunning(*row):
+                return False
+            conn.execute("UPDATE jobs SET pid = ?, boot_id = ?, started = ? WHERE id = ?",
+                         (os.getpid(), *self.processIdentity(os.getpid()), job_id))
+        finally:
+            conn.commit()
+        return True
+
+    def removeJob(self, job_id):
+        conn = self.connection()
+        for table, column in (("files", "job"), ("created", "job"), ("pairs", "job"), ("jobs", "id")):
+            conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (job_id,))
+        conn.commit()
+
+    def addCreated(self, job_id, path):
+        conn = self.connection()
+        conn.execute("INSERT OR IGNORE INTO created VALUES (?, ?)", (job_id, path))
+        conn.commit()
+
+    def discardJob(self, job_id):
+        # Partial files only make sense to the job that wrote them
+        conn = self.connection()
+        row = conn.execute("SELECT kind FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        for (dst,) in conn.execute("SELECT dst FROM files WHERE job = ?", (job_id,)).fetchall():
+            try:
+                os.unlink(dst)
+            except OSError:
+                pass
+        for (path,) in conn.execute("SELECT path FROM created WHERE job = ?", (job_id,)).fetchall():
+            if row is not None and row[0] == TransferJob.MOVE:
+                # The sources of whatever was moved are gone, only part files and empty folders go
+                self.removeLeftovers(path)
+            elif os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        self.removeJob(job_id)
+
+    @staticmethod
+    def removeLeftovers(path):
+        try:
+            os.unlink(MoveEngine.partPath(path))
+        except OSError:
+            pass
+        if not os.path.isdir(path) or os.path.islink(path):
+            return
+        for directory, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                if name.endswith(MoveEngine.PART_SUFFIX):
+                    try:
+                        os.unlink(os.path.join(directory, name))
+                    except OSError:
+                        pass
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+    def unfinishedJobs(self):
+        """ Returns [(job id, kind, pairs, verify)] of jobs no running file manager is working on """
+        conn = self.connection()
+        jobs = []
+        for job_id, kind, verify, pid, boot_id, started in conn.execute(
+                "SELECT id, kind, verify, pid, boot_id, started FROM jobs ORDER BY id").fetchall():
+            # This process included, the jobs it runs are claimed by it
+            if self.isRunning(pid, boot_id, started):
+                continue
+            pairs = conn.execute("SELECT src, dst FROM pairs WHERE job = ? ORDER BY position", (job_id,)).fetchall()
+            jobs.append((job_id, kind, pairs, bool(verify)))
+        return jobs
+
+    @classmethod
+    def isRunning(cls, pid, boot_id=None, started=None):
+        # After a reboot (or enough processes) the pid can belong to something else entirely
+        current_boot, current_start = cls.processIdentity(pid)
+        if boot_id is not None and current_boot is not None and boot_id != current_boot:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return started is None or current_start is None or started == current_start
+
+    @staticmethod
+    def processIdentity(pid):
+        # (boot id, start time in clock ticks since boot) of a process, None where /proc doesn't say
+        try:
+            with open("/proc/sys/kernel/random/boot_id") as f:
+                boot_id = f.read().strip()
+        except OSError:
+            boot_id = None
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name in parentheses may contain spaces, the fields after it don't
+                started = int(f.read().rsplit(")", 1)[1].split()[19])
+        except (OSError, IndexError, ValueError):
+            started = None
+        return boot_id, started
+
+    def fileEntry(self, job_id, dst):
+        return self.connection().execute("SELECT size, mtime, offset, tail FROM files WHERE job = ? AND dst = ?",
+                                         (job_id, dst)).fetchone()
+
+    def checkpoint(self, job_id, dst, info, offset, tail):
+        conn = self.connection()
+        conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                     (job_id, dst, info.st_size, info.st_mtime_ns, offset, tail))
+        conn.commit()
+
+    def finishFile(self, job_id, dst):
+        conn = self.connection()
+        conn.execute("DELETE FROM files WHERE job = ? AND dst = ?", (job_id, dst))
+        conn.commit()
+
+    @classmethod
+    def tailDigest(cls, fd, offset):
+        start = max(0, offset - cls.TAIL_SIZE)
+        return hashlib.blake2b(os.pread(fd, offset - start, start)).digest()
+
+    @staticmethod
+    def sameFile(info, path):
+        # A finished copy has the size and, through copystat, the mtime of its source
+        try:
+            copied = os.lstat(path)
+        except OSError:
+            return False
+        return copied.st_size == info.st_size and copied.st_mtime_ns == info.st_mtime_ns
+
+
+class FileJournal:
+    """ The TransferJournal as seen by one job, handed down to the CopyEngine """
+    MIN_SIZE = TransferJournal.MIN_SIZE
+
+    def __init__(self, journal, job_id, resuming=False):
+        self.journal = journal
+        self.job_id = job_id
+        self.resuming = resuming
+        # Set when the job stops to be resumed later, its partial files and checkpoints then stay
+        self.keep = False
+
+    def resumeOffset(self, src_fd, info, dst):
+        """ None for a fresh copy, else the offset of dst to carry on from (info.st_size when it is done) """
+        if not self.resuming or not os.path.lexists(dst):
+            return None
+        entry = self.journal.fileEntry(self.job_id, dst)
+        if entry is None:
+            # Never checkpointed: either finished by the earlier run, or small enough to copy again
+            return info.st_size if TransferJournal.sameFile(info, dst) else 0
+        size, mtime, offset, tail = entry
+        if (size, mtime) != (info.st_size, info.st_mtime_ns) or os.lstat(dst).st_size < offset:
+            return 0
+        dst_fd = os.open(dst, os.O_RDONLY)
+        try:
+            dst_tail = TransferJournal.tailDigest(dst_fd, offset)
+        finally:
+            os.close(dst_fd)
+        if dst_tail != tail or TransferJournal.tailDigest(src_fd, offset) != tail:
+            return 0
+        return offset
+
+    def tracker(self, src_fd, dst_fd, info, dst, offset, progress=None):
+        """ Wraps progress to write a checkpoint every CHECKPOINT_SIZE copied """
+        checkpointed = offset
+        interval = min(TransferJournal.CHECKPOINT_SIZE, info.st_size // TransferJournal.CHECKPOINT_PARTS)
+
+        def track(size, written=None):
+            nonlocal offset, checkpointed
+            offset += size
+            if offset - checkpointed >= interval and offset < info.st_size:
+                # The data has to be on disk before the journal says it is
+                os.fdatasync(dst_fd)
+                self.journal.checkpoint(self.job_id, dst, info, offset, TransferJournal.tailDigest(src_fd, offset))
+                checkpointed = offset
+            if progress:
+                progress(size, written)
+        return track
+
+    def finishFile(self, dst):
+        self.journal.finishFile(self.job_id, dst)
+
+    def created(self, path):
+        self.journal.addCreated(self.job_id, path)
+
+
+class TransferJob(QThread):
+    """ One copy or move of a list of (source, destination) pairs """
+    progress = pyqtSignal("qint64", "qint64", float, float)
+    fileStarted = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    done = pyqtSignal(bool)
+
+    COPY, MOVE = "Copying", "Moving"
+    PROGRESS_INTERVAL = 0.2
+
+    def __init__(self, kind, pairs, parent=None, journal=None, verify=False, sizes=None):
+        super().__init__(parent)
+        self.kind = kind
+        self.pairs = pairs
+        # Bytes of each pair when the paste plan sized them already
+        self.sizes = sizes
+        self.journal = journal
+        self.running = threading.Event()
+        self.running.set()
+        # Interruption requests only reach a started thread, this also covers a job still in the queue
+        self.cancelled = False
+        # A move deletes the source, its copies are always verified against it
+        self.engine = CopyEngine(verify=verify or kind == self.MOVE)
+        self.mover = MoveEngine(self.engine)
+        self.lock = threading.Lock()
+        self.strategies = collections.Counter()
+        self.copied = 0
+        # Bytes that really went to disk, less than copied for sparse files and resumed jobs
+        self.written = 0
+        self.total = 0
+        self.rate = 0.0
+        self.errors = []
+        self.last_emit = 0
+        self.last_copied = 0
+
+    def description(self):
+        return self.describe(self.kind, self.pairs)
+
+    @staticmethod
+    def describe(kind, pairs):
+        names = ", ".join(os.path.basename(src) for src, dst in pairs[:3])
+        more = f" and {len(pairs) - 3} more" if len(pairs) > 3 else ""
+        return f"{kind} {names}{more} to {os.path.dirname(pairs[0][1])}"
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def isPaused(self):
+        return not self.running.is_set()
+
+    def cancel(self):
+        started = self.isRunning() or self.isFinished()
+        self.cancelled = True
+        self.requestInterruption()
+        self.running.set()
+        if not started:
+            # Never runs, so nothing else would report it done
+            self.done.emit(True)
+
+    def isDone(self):
+        return self.isFinished() or (self.cancelled and not self.isRunning())
+
+    def interrupt(self):
+        # Stops like cancel, but leaves the journal so the job is offered again on the next start
+        if self.journal is not None:
+            self.journal.keep = True
+        self.cancel()
+
+    def resuming(self):
+        return self.journal is not None and self.journal.resuming
+
+    def checkpoint(self):
+        # Blocks while paused, True once the job should stop
+        self.running.wait()
+        return self.isInterruptionRequested()
+
+    def run(self):
+        sized = list(zip(self.pairs, self.sizes or [None] * len(self.pairs)))
+        if self.kind == self.MOVE:
+            # Renames first, only what crosses a filesystem has to be sized and copied
+            sized = [(pair, size) for pair, size in sized if not self.moveItem(*pair)]
+        # The plan gives 0 for a move it expected to be a rename, that one is walked after all
+        self.total = sum(size or self.treeSize(src) for (src, dst), size in sized)
+        pairs = [pair for pair, size in sized]
+        self.last_emit = time.perf_counter()
+        for src, dst in pairs:
+            if self.checkpoint():
+                break
+            if self.journal is not None and not os.path.lexists(dst):
+                self.journal.created(dst)
+            if self.kind == self.MOVE:
+                self.moveAcross(src, dst)
+            else:
+                self.copyItem(src, dst)
+        self.emitProgress(force=True)
+        self.done.emit(self.isInterruptionRequested())
+
+    @staticmethod
+    def treeSize(path):
+        try:
+            info = os.lstat(path)
+        except OSError:
+            return 0
+        if not stat.S_ISDIR(info.st_mode):
+            return info.st_size
+        total = 0
+        for directory, mtime, entries in ParallelWalker(path, stat_entries=True, skip=set()):
+            total += sum(entry[3].st_size for entry in entries if entry[3] is not None and not entry[2])
+        return total
+
+    def moveItem(self, src, dst):
+        # A rename is all a move needs on the same filesystem, False means it has to be copied
+        if os.path.lexists(dst):
+            if self.resuming():
+                # Either renamed by the earlier run already, or half way across filesystems
+                return not os.path.lexists(src)
+            self.fail(dst, "Destination already exists")
+            return True
+        try:
+            os.rename(src, dst)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                return False
+            self.fail(src, e.strerror)
+        return True
+
+    def moveAcross(self, src, dst):
+        try:
+            info = os.lstat(src)
+        except OSError as e:
+            self.fail(src, e.strerror)
+            return
+        self.fileStarted.emit(src)
+        if stat.S_ISDIR(info.st_mode):
+            mover = TreeMover(self.engine, progress=self.addProgress, should_stop=self.checkpoint,
+                              on_error=self.fail, on_copied=self.countStrategy, journal=self.journal)
+            mover.move(src, dst)
+        elif stat.S_ISLNK(info.st_mode):
+            try:
+                if not (self.resuming() and os.path.islink(dst)):
+                    os.symlink(os.readlink(src), dst)
+                MoveEngine.syncDirectory(os.path.dirname(dst))
+                os.unlink(src)
+            except OSError as e:
+                self.fail(src, e.strerror)
+        elif stat.S_ISREG(info.st_mode):
+            try:
+                strategy = self.mover.moveFile(src, dst, progress=self.addProgress, should_stop=self.checkpoint,
+                                               journal=self.journal)
+            except OSError as e:
+                self.fail(src, e.strerror or str(e))
+                return
+            if strategy is not None:
+                self.countStrategy(strategy)
+        else:
+            self.fail(src, "Special file (FIFO, socket or device) skipped")
+
+    def copyItem(self, src, dst):
+        try:
+            info = os.lstat(src)
+        except OSError as e:
+            self.fail(src, e.strerror)
+            return
+        if stat.S_ISDIR(info.st_mode):
+            self.copyTree(src, dst)
+        elif stat.S_ISLNK(info.st_mode):
+            try:
+                os.symlink(os.readlink(src), dst)
+            except OSError as e:
+                if e.errno != errno.EEXIST or not self.resuming():
+                    self.fail(dst, e.strerror)
+        elif stat.S_ISREG(info.st_mode):
+            self.copyFile(src, dst)
+        else:
+            self.fail(src, "Special file (FIFO, socket or device) skipped")
+
+    def copyTree(self, src, dst):
+        self.fileStarted.emit(src)
+        copier = TreeCopier(self.engine, progress=self.addProgress, should_stop=self.checkpoint,
+                            on_error=self.fail, on_copied=self.countStrategy, journal=self.journal)
+        copier.copy(src, dst)
+
+    def copyFile(self, src, dst):
+        self.fileStarted.emit(src)
+        try:
+            strategy = self.engine.copyFile(src, dst, progress=self.addProgress, should_stop=self.checkpoint,
+                                            journal=self.journal)
+        except OSError as e:
+            self.fail(src, e.strerror or str(e))
+            return
+        if strategy is not None:
+            self.countStrategy(strategy)
+
+    def countStrategy(self, strategy):
+        with self.lock:
+            self.strategies[strategy] += 1
+
+    def fail(self, path, error):
+        # Like addProgress, also called from the tree copy pool
+        with self.lock:
+            self.errors.append((path, error))
+        self.failed.emit(path, error)
+
+    def addProgress(self, size, written=None):
+        with self.lock:
+            self.copied += size
+            self.written += size if written is None else written
+        self.emitProgress()
+
+    def emitProgress(self, force=False):
+        now = time.perf_counter()
+        with self.lock:
+            elapsed = now - self.last_emit
+            if not force and elapsed < self.PROGRESS_INTERVAL:
+                return
+            # Smoothed over the last few intervals, so the ETA doesn't jump around with every block
+            rate = (self.copied - self.last_copied) / max(elapsed, 1e-6)
+            self.rate = rate if not self.rate else 0.7 * self.rate + 0.3 * rate
+            self.last_emit = now
+            self.last_copied = self.copied
+            copied = self.copied
+            eta = (self.total - copied) / self.rate if self.rate > 0 else -1.0
+        self.progress.emit(copied, self.total, self.rate, eta)
+
+
+class TransferManager(QObject):
+    """ Queue of TransferJobs, at most MAX_ACTIVE of them run at the same time """
+    jobAdded = pyqtSignal(object)
+    jobFinished = pyqtSignal(object)
+
+    MAX_ACTIVE = 2
+
+    def __init__(self, parent=None, journal=None):
+        super().__init__(parent)
+        self.journal = journal or TransferJournal()
+        self.jobs = []
+        self.queued = collections.deque()
+
+    def submit(self, kind, pairs, job_id=None, verify=False, sizes=None):
+        # A job to resume has to be claimed from the journal first
+        resuming = job_id is not None
+        if not resuming:
+            job_id = self.journal.addJob(kind, pairs, verify)
+        job = TransferJob(kind, pairs, self, FileJournal(self.journal, job_id, resuming), verify, sizes)
+        job.done.connect(lambda cancelled, job=job: self.onJobDone(job))
+        self.jobs.append(job)
+        self.queued.append(job)
+        self.jobAdded.emit(job)
+        self.startQueued()
+        return job
+
+    def activeJobs(self):
+        return [job for job in self.jobs if job.isRunning()]
+
+    def reservedNames(self, directory):
+        # Destinations of unfinished jobs may not exist yet, but are taken all the same
+        return {os.path.basename(dst) for job in self.jobs if not job.isDone()
+                for src, dst in job.pairs if os.path.dirname(dst) == directory}
+
+    def startQueued(self):
+        while self.queued and len(self.activeJobs()) < self.MAX_ACTIVE:
+            job = self.queued.popleft()
+            if not job.cancelled:
+                job.start()
+
+    def onJobDone(self, job):
+        job.wait()
+        if not job.journal.keep:
+            self.journal.removeJob(job.journal.job_id)
+        self.jobFinished.emit(job)
+        self.startQueued()
+
+    def cancelAll(self):
+        # Used when quitting: whatever didn't finish stays in the journal to be resumed
+        self.queued.clear()
+        for job in self.jobs:
+            job.interrupt()
+        for job in self.jobs:
+            job.wait()
+
+
+def formatDuration(seconds):
+    if seconds < 0:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes:02}:{seconds:02}"
+
+
+class TransferRow(QFrame):
+    # Progress, throughput and controls of one transfer job
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.job = job
+        self.setFrameShape(QFrame.Shape.Box)
+        self.title_l = QLabel(job.description())
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.status_l = QLabel("Waiting")
+        self.pause_button = QPushButton("Pause")
+        self.pause_button.clicked.connect(self.togglePause)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(job.cancel)
+
+        layout = QGridLayout()
+        layout.addWidget(self.title_l, 0, 0, 1, 3)
+        layout.addWidget(self.progress_bar, 1, 0)
+        layout.addWidget(self.pause_button, 1, 1)
+        layout.addWidget(self.cancel_button, 1, 2)
+        layout.addWidget(self.status_l, 2, 0, 1, 3)
+        self.setLayout(layout)
+
+        job.progress.connect(self.onProgress)
+        job.fileStarted.connect(self.onFileStarted)
+        job.done.connect(self.onDone)
+
+    def togglePause(self):
+        if self.job.isPaused():
+            self.job.resume()
+            self.pause_button.setText("Pause")
+        else:
+            self.job.pause()
+            self.pause_button.setText("Resume")
+            self.status_l.setText("Paused")
+
+    def onFileStarted(self, path):
+        self.title_l.setToolTip(path)
+
+    def onProgress(self, copied, total, rate, eta):
+        self.progress_bar.setValue(int(copied * 1000 / total) if total else 0)
+        if not self.job.isPaused():
+            self.status_l.setText(f"{formatSize(copied)} of {formatSize(total)}, {formatSize(int(rate))}/s, "
+                                  f"{formatDuration(eta)} left")
+
+    def onDone(self, cancelled):
+        self.pause_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        if cancelled:
+            self.status_l.setText("Cancelled")
+        elif self.job.errors:
+            self.status_l.setText(f"Finished with {len(self.job.errors)} errors")
+            self.status_l.setToolTip("\n".join(f"{path}: {error}" for path, error in self.job.errors[:20]))
+        else:
+            self.progress_bar.setValue(1000)
+            # Which copy paths the kernel allowed, e.g. "reflink" on btrfs
+            strategies = ", ".join(f"{name} x{count}" for name, count in self.job.strategies.most_common())
+            text = f"Done, {formatSize(self.job.copied)}"
+            if self.job.written < self.job.copied:
+                # Holes of sparse files and what a resumed job found done aren't written
+                text += f", {formatSize(self.job.written)} written"
+            text += f" ({strategies})" if strategies else ""
+            if self.job.engine.verify:
+                text += f", verified in {self.job.engine.verify_time:.1f} s"
+            self.status_l.setText(text)
+
+
+class TransferWindow(QDialog):
+    """ Running and finished transfers with their totals, the main window stays usable meanwhile """
+    def __init__(self, transfers, parent=None):
+        super().__init__(parent)
+        self.transfers = transfers
+        self.setWindowTitle("Transfers")
+        self.resize(520, 400)
+
+        self.total_progress_bar = QProgressBar()
+        self.total_progress_bar.setRange(0, 1000)
+        self.total_status_l = QLabel()
+        self.clear_button = QPushButton("Clear Finished")
+        self.clear_button.clicked.connect(self.clearFinished)
+
+        self.rows_layout = QVBoxLayout()
+        self.rows_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
+        rows_widget = QWidget()
+        rows_widget.setLayout(self.rows_layout)
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(rows_widget)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.total_progress_bar)
+        layout.addWidget(self.total_status_l)
+        layout.addWidget(scroll_area)
+        layout.addWidget(self.clear_button, alignment=Qt.AlignmentFlag.AlignRight)
+        self.setLayout(layout)
+
+        self.rows = []
+        for job in transfers.jobs:
+            self.addJob(job)
+        transfers.jobAdded.connect(self.addJob)
+
+    def addJob(self, job):
+        row = TransferRow(job)
+        job.progress.connect(self.updateTotals)
+        self.rows.append(row)
+        self.rows_layout.addWidget(row)
+
+    def clearFinished(self):
+        for row in [row for row in self.rows if row.job.isDone()]:
+            self.rows.remove(row)
+            self.transfers.jobs.remove(row.job)
+            row.deleteLater()
+        self.updateTotals()
+
+    def updateTotals(self, *args):
+        active = [row.job for row in self.rows if row.job.isRunning()]
+        copied = sum(job.copied for job in active)
+        total = sum(job.total for job in active)
+        rate = sum(job.rate for job in active if not job.isPaused())
+        self.total_progress_bar.setValue(int(copied * 1000 / total) if total else 0)
+        eta = (total - copied) / rate if rate > 0 else -1.0
+        self.total_status_l.setText(f"{len(active)} running, {formatSize(copied)} of {formatSize(total)}, "
+                                    f"{formatSize(int(rate))}/s, {formatDuration(eta)} left")
+
+
+PasteItem = collections.namedtuple("PasteItem", "action src dst size note")
+
+
+class PastePlan:
+    # What a paste will do, item by item, and whether it fits on the destination
+    def __init__(self, kind, dst_dir, items, space):
+        self.kind = kind
+        self.dst_dir = dst_dir
+        self.items = items
+        self.space = space
+
+    def pairs(self):
+        return [(item.src, item.dst) for item in self.items if item.action != PastePlanner.SKIP]
+
+    def sizes(self):
+        return [item.size for item in self.items if item.action != PastePlanner.SKIP]
+
+    def count(self, action):
+        return sum(1 for item in self.items if item.action == action)
+
+    def needed(self):
+        return sum(item.size for item in self.items if item.action != PastePlanner.SKIP)
+
+    def available(self):
+        return self.space[2] if self.space is not None else None
+
+    def fits(self):
+        available = self.available()
+        return available is None or self.needed() <= available
+
+
+class PastePlanner:
+    """ Works out a whole paste before anything is written """
+    COPY, RENAME, SKIP = "Copy", "Rename", "Skip"
+
+    def __init__(self, transfers, mounts=None, size_cache=None):
+        self.transfers = transfers
+        self.mounts = mounts or MountTable()
+        self.size_cache = size_cache or DirSizeCache()
+
+    def plan(self, kind, sources, dst_dir, progress=None, should_stop=None):
+        """ Returns the PastePlan, or None when stopped. progress gets (sources done, sources, bytes so far) """
+        try:
+            taken = set(os.listdir(dst_dir))
+            dst_dev = os.stat(dst_dir).st_dev
+        except OSError as e:
+            return PastePlan(kind, dst_dir, [PasteItem(self.SKIP, src, None, 0, e.strerror) for src in sources], None)
+        taken |= self.transfers.reservedNames(dst_dir)
+
+        items = []
+        sized = 0
+        for done, src in enumerate(sources):
+            if should_stop and should_stop():
+                return None
+            if progress:
+                progress(done, len(sources), sized)
+            try:
+                info = os.lstat(src)
+            except OSError as e:
+                items.append(PasteItem(self.SKIP, src, None, 0, e.strerror))
+                continue
+            if dst_dir == src or dst_dir.startswith(src.rstrip(os.sep) + os.sep):
+                items.append(PasteItem(self.SKIP, src, None, 0, "Folder can't go inside itself"))
+                continue
+            if kind == TransferJob.MOVE and os.path.dirname(src) == dst_dir:
+                items.append(PasteItem(self.SKIP, src, None, 0, "Already in this folder"))
+                continue
+
+            name = os.path.basename(src)
+            action = self.COPY
+            if name in taken:
+                name = self.freeName(name, stat.S_ISDIR(info.st_mode), taken)
+                action = self.RENAME
+            taken.add(name)
+            if kind == TransferJob.MOVE and info.st_dev == dst_dev:
+                size = 0
+            else:
+                def folderProgress(items, total_size, folders):
+                    if progress:
+                        progress(done, len(sources), sized + total_size)
+                size = self.itemSize(src, info, should_stop, folderProgress)
+                if size is None:
+                    return None
+            sized += size
+            items.append(PasteItem(action, src, os.path.join(dst_dir, name), size, ""))
+        return PastePlan(kind, dst_dir, items, self.mounts.freeSpace(dst_dir))
+
+    def itemSize(self, path, info, should_stop=None, progress=None):
+        # None when stopped while a folder was being sized
+        if not stat.S_ISDIR(info.st_mode):
+            return info.st_size
+        result = self.size_cache.lookup(path, progress=progress, should_stop=should_stop)
+        return result[1] if result is not None else None
+
+    @staticmethod
+    def freeName(name, is_dir, taken):
+        # Folders keep dots in their names, files keep their extension at the end
+        stem, ext = (name, "") if is_dir else os.path.splitext(name)
+        i = 1
+        while f"{stem} (copy {i}){ext}" in taken:
+            i += 1
+        return f"{stem} (copy {i}){ext}"
+
+
+class PastePlanThread(QThread):
+    # Plans a paste in the background, sizing big folders can take a while
+    progress = pyqtSignal(int, int, "qint64")
+    done = pyqtSignal(object)  # The PastePlan, None when cancelled
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, planner, kind, sources, dst_dir, parent=None):
+        super().__init__(parent)
+        self.planner = planner
+        self.kind = kind
+        self.sources = sources
+        self.dst_dir = dst_dir
+        self.last_emit = 0
+
+    def run(self):
+        plan = self.planner.plan(self.kind, self.sources, self.dst_dir, self.onProgress, self.isInterruptionRequested)
+        self.done.emit(None if self.isInterruptionRequested() else plan)
+
+    def onProgress(self, done, total, size):
+        now = time.perf_counter()
+        if now - self.last_emit >= self.PROGRESS_INTERVAL:
+            self.progress.emit(done, total, size)
+            self.last_emit = now
+
+
+class PastePlanWindow(QDialog):
+    """ The plan of a paste, nothing is copied or moved until it is accepted """
+    def __init__(self, plan, verify=False, parent=None):
+        super().__init__(parent)
+        self.plan = plan
+        self.setWindowTitle("Paste")
+        self.resize(560, 340)
+
+        verb = "move" if plan.kind == TransferJob.MOVE else "copy"
+        renamed = plan.count(PastePlanner.RENAME)
+        self.summary_l = QLabel(f"{plan.count(PastePlanner.COPY) + renamed} to {verb} into {plan.dst_dir}, "
+                                f"{renamed} renamed, {plan.count(PastePlanner.SKIP)} skipped")
+        self.summary_l.setWordWrap(True)
+
+        self.items_table = QTableWidget(len(plan.items), 4)
+        self.items_table.setHorizontalHeaderLabels(["Action", "Name", "Destination", "Size"])
+        self.items_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.items_table.verticalHeader().setVisible(False)
+        self.items_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        for row, item in enumerate(plan.items):
+            self.items_table.setItem(row, 0, QTableWidgetItem(item.action))
+            self.items_table.setItem(row, 1, QTableWidgetItem(os.path.basename(item.src)))
+            self.items_table.setItem(row, 2, QTableWidgetItem(os.path.basename(item.dst) if item.dst else item.note))
+            self.items_table.setItem(row, 3, SizeTableItem(item.size))
+
+        available = plan.available()
+        needed = f"Needs {formatSize(plan.needed())}"
+        self.space_l = QLabel(needed if available is None else f"{needed}, {formatSize(available)} available")
+        self.verify_cb = QCheckBox("Verify copied data (reads every copy back)")
+        self.verify_cb.setChecked(verify)
+        self.paste_button = QPushButton("Paste" if plan.fits() else "Paste Anyway")
+        self.paste_button.setEnabled(bool(plan.pairs()))
+        self.cancel_button = QPushButton("Cancel")
+        if not plan.fits():
+            self.space_l.setText(self.space_l.text() + ", not enough free space")
+            self.space_l.setStyleSheet("color: red")
+            self.cancel_button.setDefault(True)
+        self.button_box = QDialogButtonBox(Qt.Orientation.Horizontal)
+        self.button_box.addButton(self.cancel_button, QDialogButtonBox.ButtonRole.RejectRole)
+        self.button_box.addButton(self.paste_button, QDialogButtonBox.ButtonRole.AcceptRole)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_l)
+        layout.addWidget(self.items_table)
+        layout.addWidget(self.space_l)
+        layout.addWidget(self.verify_cb)
+        layout.addWidget(self.button_box)
+        self.setLayout(layout)
+
+
 class AddressBar(QFrame):
     directoryClicked = pyqtSignal(str)  # New signal
 
@@ -472,7 +4524,27 @@ class TanzFileManger(QMainWindow):
         self.visited_directory_list = [self.homePath]
         self.forward_directory_list = []
 
+        self.file_index = FileIndex()
+        self.size_cache = DirSizeCache()
+        self.file_types = FileTypeEngine()
+        self.checksums = ChecksumEngine()
+        self.mounts = MountTable()
+        self.transfers = TransferManager(self)
+        self.transfers.jobFinished.connect(self.onTransferFinished)
+        self.paste_planner = PastePlanner(self.transfers, self.mounts, self.size_cache)
+        self.plan_thread = None
+        self.plan_progress = None
+        self.transfer_window = None
+        self.verify_copies = False
+        self.type_sniffer = None
+        self.index_builder = None
+        self.index_watcher = None
+        self.reconcile_state = None
+
         self.initUI()
+        if self.file_index.isBuilt():
+            self.startIndexWatcher()
+        QTimer.singleShot(0, self.offerResume)
 
     def initUI(self):
         self.setWindowTitle("Tanz")
@@ -600,8 +4672,24 @@ class TanzFileManger(QMainWindow):
         self.tab_trash_l = TanzSideBarMenu("Trash", trash_tab_icon)
         self.tab_trash_l.clicked.connect(self.loadTrashDir)
 
+        disk_usage_tab_icon = QPixmap("icons/list-menu.png")
+        self.tab_disk_usage_l = TanzSideBarMenu("Disk Usage", disk_usage_tab_icon)
+        self.tab_disk_usage_l.clicked.connect(self.showDiskUsage)
+
+        # Free space of the filesystem of the folder on show, kept current while files are written
+        self.sidebar_free_l = QLabel()
+        self.sidebar_free_l.setFixedWidth(145)
+        self.sidebar_free_l.setWordWrap(True)
+        self.sidebar_free_l.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.free_space_timer = QTimer(self)
+        self.free_space_timer.setInterval(10000)
+        self.free_space_timer.timeout.connect(self.updateFreeSpace)
+        self.free_space_timer.start()
+
         self.core_list_view = QListView()
-        self.core_sys_model = QFileSystemModel()
+        self.core_sys_model = TanzFileSystemModel(self.file_types)
+        self.core_sys_model.rootPathChanged.connect(self.sniffDirectory)
+        self.core_sys_model.rootPathChanged.connect(self.updateFreeSpace)
 
         self.core_sys_model.setFilter(QDir.Filter.NoDotAndDotDot | QDir.Filter.AllEntries | QDir.Filter.Hidden)
         self.core_sys_model.sort(0, Qt.SortOrder.AscendingOrder)
@@ -618,7 +4706,7 @@ class TanzFileManger(QMainWindow):
         self.core_list_view.setWordWrap(True)
         self.core_list_view.setSelectionRectVisible(True)
         self.core_list_view.setFrameStyle(QListView.Shape.NoFrame)
-        self.core_list_view.setSelectionMode(QListView.SelectionMode.SingleSelection)
+        self.core_list_view.setSelectionMode(QListView.SelectionMode.ExtendedSelection)
         self.core_list_view.setLayoutMode(QListView.LayoutMode.SinglePass)
         self.core_list_view.setResizeMode(QListView.ResizeMode.Adjust)
         self.core_list_view.setMovement(QListView.Movement.Snap)
@@ -641,6 +4729,9 @@ class TanzFileManger(QMainWindow):
         sideBar_v_box.addWidget(self.tab_picture_l)
         sideBar_v_box.addWidget(self.tab_video_l)
         sideBar_v_box.addWidget(self.tab_trash_l)
+        sideBar_v_box.addWidget(self.tab_disk_usage_l)
+        sideBar_v_box.addStretch()
+        sideBar_v_box.addWidget(self.sidebar_free_l)
 
         sideBar_frame = QFrame()
         sideBar_frame.setObjectName("sbFrame")
@@ -689,6 +4780,12 @@ class TanzFileManger(QMainWindow):
         self.compress_dir_act = QAction("Compress")
         self.compress_dir_act.triggered.connect(self.compressDir)
 
+        self.disk_usage_act = QAction("Disk Usage")
+        self.disk_usage_act.triggered.connect(self.showDiskUsage)
+
+        self.transfers_act = QAction("Transfers")
+        self.transfers_act.triggered.connect(self.showTransfers)
+
     def setupToolBarMenu(self):
         self.toolbar_menu = QMenu()
         self.toolbar_menu.setStyleSheet("""
@@ -702,6 +4799,8 @@ class TanzFileManger(QMainWindow):
         self.toolbar_menu.addAction(self.sel_all_dir_act)
         self.toolbar_menu.addSeparator()
         # can add open in terminal
+        self.toolbar_menu.addAction(self.disk_usage_act)
+        self.toolbar_menu.addAction(self.transfers_act)
         self.toolbar_menu.addAction(self.prop_dir_act)
 
         self.toolbar_menu_btn.setMenu(self.toolbar_menu)
@@ -929,6 +5028,8 @@ class TanzFileManger(QMainWindow):
 
     def copy(self):
         path = self.core_sys_model.filePath(self.core_list_view.currentIndex())
+        selected = self.core_list_view.selectionModel().selectedIndexes()
+        self.file_paths = [self.core_sys_model.filePath(index) for index in selected] or [path]
 
         self.clipboard.clear()
         data = QMimeData()
@@ -940,92 +5041,92 @@ class TanzFileManger(QMainWindow):
     def paste(self):
         data_path = self.core_sys_model.filePath(self.core_list_view.rootIndex())
 
-        clip_data = self.clipboard.mimeData().text()
-        data_name = os.path.basename(clip_data)
-
         if self.cut_path:
-            self.moveFile(self.cut_path, data_path, data_name)
-            self.cut_path = None
-        elif os.path.isdir(clip_data):
-            # self.copyDirs(clip_data, data_path)
-            self.copyFileDir(data_path)
+            self.moveFile(self.cut_path, data_path)
         else:
-            # self.copyFiles(clip_data, data_path)
             self.copyFileDir(data_path)
 
-    def moveFile(self, src, dst_dir, dst_name):
-        dst_path = os.path.join(dst_dir, dst_name)
-        if os.path.exists(dst_path):
-            dst_name = self.renameFile(dst_dir, dst_name)
-            dst_path = os.path.join(dst_dir, dst_name)
-        try:
-            shutil.move(src, dst_path)
-        except Exception as e:
-            QMessageBox.critical(None, "Error", f"Failed to move file: {e}")
+    def moveFile(self, src, dst_dir):
+        self.pasteItems(TransferJob.MOVE, [src], dst_dir)
 
     def copyFileDir(self, dst_dir):
-        for path in self.file_paths:
-            if QDir(path).exists():
-                dst_name = self.cpRenameDir(dst_dir, os.path.basename(path))
-                dst_path = os.path.join(dst_dir, dst_name)
-                try:
-                    shutil.copytree(path, dst_path)
-                except FileExistsError:
-                    self.pasteDir(path, dst_dir, os.path.basename(path))
-                except Exception as e:
-                    QMessageBox.critical(None, "Error", f"Failed to copy directory: {e}")
-
-            elif QFile(path).exists():
-                dst_name = self.renameFile(dst_dir, os.path.basename(path))
-                dst_path = os.path.join(dst_dir, dst_name)
-                try:
-                    shutil.copy2(path, dst_path)
-                except Exception as e:
-                    QMessageBox.critical(None, "Error", f"Failed to copy file: {e}")
-
-    def renameFile(self, dst_dir, dst_name):
-        name, ext = os.path.splitext(dst_name)
-        i = 1
-        while True:
-            new_name = f"{name} (copy {i}){ext}"
-            new_path = os.path.join(dst_dir, new_name)
-            if not os.path.exists(new_path):
-                return new_name
-            i += 1
-
-    def cpRenameDir(self, dst_dir, dst_name):
-        name = dst_name
-        i = 1
-        while True:
-            new_name = f"{name} (copy {i})"
-            new_path = os.path.join(dst_dir, new_name)
-            if not os.path.exists(new_path):
-                return new_name
-            i += 1
+        self.pasteItems(TransferJob.COPY, self.file_paths, dst_dir)
+
+    def pasteItems(self, kind, sources, dst_dir):
+        # Names and space are planned for the whole batch, nothing is written before the plan is accepted
+        self.stopPastePlan()
+        self.plan_progress = QProgressDialog(f"Checking what to paste into {dst_dir}", "Cancel", 0, len(sources), self)
+        self.plan_progress.setWindowTitle("Paste")
+        self.plan_progress.setMinimumDuration(500)
+        self.plan_thread = PastePlanThread(self.paste_planner, kind, sources, dst_dir, self)
+        self.plan_thread.progress.connect(self.onPastePlanProgress)
+        self.plan_thread.done.connect(self.onPastePlanned)
+        self.plan_progress.canceled.connect(self.plan_thread.requestInterruption)
+        self.plan_thread.start()
+
+    def onPastePlanProgress(self, done, total, size):
+        if self.plan_progress is not None:
+            self.plan_progress.setValue(done)
+            self.plan_progress.setLabelText(f"Checking {done + 1} of {total}, {formatSize(size)} so far")
+
+    def onPastePlanned(self, plan):
+        if self.sender() is not self.plan_thread:
+            return
+        self.plan_thread.wait()
+        self.plan_thread = None
+        self.plan_progress.close()
+        self.plan_progress = None
+        if plan is None:
+            return
+        plan_window = PastePlanWindow(plan, self.verify_copies, self)
+        if plan_window.exec() != QDialog.DialogCode.Accepted or not plan.pairs():
+            return
+        self.verify_copies = plan_window.verify_cb.isChecked()
+        self.startTransfer(plan.kind, plan.pairs(), self.verify_copies, plan.sizes())
+        if plan.kind == TransferJob.MOVE:
+            self.cut_path = None
 
-    def pasteDir(self, src, dst_dir, dst_name):
-        dst_path = os.path.join(dst_dir, dst_name)
-        if os.path.exists(dst_path):
-            dst_name = self.cpRenameDir(dst_dir, dst_name)
-            dst_path = os.path.join(dst_dir, dst_name)
-        try:
-            shutil.copytree(src, dst_path)
-        except FileExistsError:
-            self.pasteDir(src, dst_dir, dst_name)
-        except Exception as e:
-            QMessageBox.critical(None, "Error", f"Failed to paste directory: {e}")
+    def stopPastePlan(self):
+        if self.plan_thread is not None:
+            self.plan_thread.requestInterruption()
+            self.plan_thread.wait()
+            self.plan_thread = None
+        if self.plan_progress is not None:
+            self.plan_progress.close()
+            self.plan_progress = None
+
+    def startTransfer(self, kind, pairs, verify=False, sizes=None):
+        self.transfers.submit(kind, pairs, verify=verify, sizes=sizes)
+        self.showTransfers()
+
+    def showTransfers(self):
+        # Not modal, browsing goes on while the copies run
+        if self.transfer_window is None:
+            self.transfer_window = TransferWindow(self.transfers, self)
+        self.transfer_window.show()
+        self.transfer_window.raise_()
+
+    def offerResume(self):
+        # Transfers a crash or logout cut short are still in the journal
+        resumed = False
+        for job_id, kind, pairs, verify in self.transfers.journal.unfinishedJobs():
+            # Another file manager started at the same time may have taken it meanwhile
+            if not self.transfers.journal.claimJob(job_id):
+                continue
+            answer = QMessageBox.question(self, "Transfers", f"{TransferJob.describe(kind, pairs)} did not finish. "
+                                                             f"Resume it where it stopped?")
+            if answer == QMessageBox.StandardButton.Yes:
+                self.transfers.submit(kind, pairs, job_id, verify)
+                resumed = True
+            else:
+                self.transfers.journal.discardJob(job_id)
+        if resumed:
+            self.showTransfers()
 
-    def pasteFile(self, src, dst_dir, dst_name):
-        dst_path = os.path.join(dst_dir, dst_name)
-        if os.path.exists(dst_path):
-            dst_name = self.renameFile(dst_dir, dst_name)
-            dst_path = os.path.join(dst_dir, dst_name)
-        try:
-            shutil.copy2(src, dst_path)
-        except FileExistsError:
-            self.pasteFile(src, dst_dir, dst_name)
-        except Exception as e:
-            QMessageBox.critical(None, "Error", f"Failed to paste file: {e}")
+    def onTransferFinished(self, job):
+        if job.errors:
+            errors = "\n".join(f"{path}: {error}" for path, error in job.errors[:10])
+            QMessageBox.critical(self, "Error", f"{job.description()} failed for {len(job.errors)} items:\n{errors}")
 
     def renameDir(self):
         # Get the path of the directory to rename
@@ -1062,6 +5163,79 @@ class TanzFileManger(QMainWindow):
         search_window = SearchWindow(self)
         search_window.exec()
 
+    def showDiskUsage(self):
+        disk_usage_window = DiskUsageWindow(self)
+        disk_usage_window.exec()
+
+    def startIndexBuild(self):
+        # Only one build runs at a time, later callers just attach to the running one
+        if self.index_builder is None or not self.index_builder.isRunning():
+            # The watcher would fight the rebuild for the database, it is restarted once the build is done
+            self.stopIndexWatcher()
+            self.index_builder = IndexBuildThread(self.file_index, "/", self)
+            self.index_builder.done.connect(self.startIndexWatcher)
+            self.index_builder.start()
+        return self.index_builder
+
+    def startIndexWatcher(self):
+        if self.file_index.isBuilt() and (self.index_watcher is None or not self.index_watcher.isRunning()):
+            self.index_watcher = IndexWatcher(self.file_index, self)
+            self.index_watcher.reconcileProgress.connect(self.onReconcileProgress)
+            self.index_watcher.reconciled.connect(self.onReconciled)
+            self.index_watcher.start()
+
+    def onReconcileProgress(self, checked, total):
+        self.reconcile_state = ("checking", checked, total)
+
+    def onReconciled(self, skipped, rescanned, seconds):
+        self.reconcile_state = ("done", skipped, rescanned, seconds)
+
+    def reconcileStatus(self):
+        if self.reconcile_state is None:
+            return ""
+        if self.reconcile_state[0] == "checking":
+            return "checking for changes ({1}/{2} folders)".format(*self.reconcile_state)
+        return "up to date ({1} folders unchanged, {2} rescanned in {3:.1f} s)".format(*self.reconcile_state)
+
+    def stopIndexWatcher(self):
+        if self.index_watcher is not None and self.index_watcher.isRunning():
+            self.index_watcher.requestInterruption()
+            self.index_watcher.wait()
+
+    def closeEvent(self, event):
+        if self.transfers.activeJobs():
+            answer = QMessageBox.question(self, "Transfers", "Copies are still running. Stop them and quit? "
+                                                             "They can be resumed on the next start.")
+            if answer != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+        if self.index_builder is not None and self.index_builder.isRunning():
+            self.index_builder.requestInterruption()
+            self.index_builder.wait()
+        self.stopPastePlan()
+        self.stopIndexWatcher()
+        self.stopTypeSniffer()
+        self.transfers.cancelAll()
+        event.accept()
+
+    def updateFreeSpace(self):
+        directory = self.core_sys_model.rootPath()
+        mount = self.mounts.lookup(directory)
+        self.sidebar_free_l.setText(freeSpaceText(self.mounts, directory))
+        if mount is not None:
+            self.sidebar_free_l.setToolTip(f"{mount.source} on {mount.mount_point} ({mount.fs_type})")
+
+    def sniffDirectory(self, directory):
+        # File types of the folder on show are worked out in the background, one folder at a time
+        self.stopTypeSniffer()
+        self.type_sniffer = FileTypeThread(directory, self.file_types, self)
+        self.type_sniffer.start()
+
+    def stopTypeSniffer(self):
+        if self.type_sniffer is not None and self.type_sniffer.isRunning():
+            self.type_sniffer.requestInterruption()
+            self.type_sniffer.wait()
+
     def selectAllData(self):
         curr = self.core_sys_model.filePath(self.core_list_view.rootIndex())
         direc = QDir(curr)
@@ -1080,15 +5254,186 @@ class TanzFileManger(QMainWindow):
         # print(f"[LOG]: selectAllData\n    -{i_name}\n    -{i_path}\n    -{i_info}\n")
 
     def showProperties(self):
+        selected = self.core_list_view.selectionModel().selectedIndexes()
+        if len(selected) > 1:
+            # Totals for the whole selection are worked out in the background
+            paths = [self.core_sys_model.filePath(index) for index in selected]
+            properties_window = SelectionPropertiesWindow(paths, self.size_cache, self.file_types, self.checksums,
+                                                          self)
+            properties_window.setModal(True)
+            properties_window.exec()
+            return
         index = self.core_list_view.currentIndex()
         if index.isValid():
             path = self.core_sys_model.filePath(index)
-            properties_window = PropertiesWindow(path)
+            properties_window = PropertiesWindow(path, self.size_cache, self.file_types, self.checksums, self.mounts)
             properties_window.setModal(True)
             properties_window.exec()
 
 
+def benchmarkWalk(root="/"):
+    # python main-0.0.4.py --bench-walk [root]
+    # Compares the old os.walk + isdir search loop with the ParallelWalker at growing worker counts
+    def oldWalk():
+        count = 0
+        skip = pseudoMountPoints()
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if os.path.join(directory, d) not in skip]
+            for name in dirs + files:
+                os.path.isdir(os.path.join(directory, name))
+                count += 1
+        return count
+
+    def parallelWalk(workers):
+        return sum(len(entries) for directory, mtime, entries in ParallelWalker(root, workers))
+
+    print(f"Walking {root} on {os.cpu_count()} CPUs (warm cache, first pass discarded)")
+    oldWalk()
+    runs = [("os.walk + isdir", oldWalk)]
+    workers = 1
+    while workers <= max(ParallelWalker(root).workers, 1):
+        runs.append((f"ParallelWalker x{workers}", lambda w=workers: parallelWalk(w)))
+        workers *= 2
+
+    baseline = None
+    for label, run in runs:
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{label:<22} {count:>10} entries {elapsed:8.2f} s {count / elapsed:>12,.0f}/s "
+              f"{baseline / elapsed:6.2f}x")
+
+
+def benchmarkCopy(directory=".", size_mb="512"):
+    # python main-0.0.4.py --bench-copy [directory] [size in MB]
+    # Copies one file within directory with shutil.copy2 and with every CopyEngine strategy on its own
+    src = os.path.join(directory, f".tanzanite-bench-{os.getpid()}")
+    dst = src + ".copy"
+    size = int(size_mb) * 1024 * 1024
+    with open(src, "wb") as f:
+        for offset in range(0, size, CopyEngine.BUFFER_SIZE):
+            f.write(os.urandom(min(CopyEngine.BUFFER_SIZE, size - offset)))
+    print(f"Copying {size_mb} MB within {os.path.abspath(directory)} (warm cache, best of 3)")
+    runs = [("shutil.copy2", lambda: shutil.copy2(src, dst) and "shutil")]
+    for strategy in CopyEngine.STRATEGIES:
+        runs.append((strategy, lambda strategy=strategy: CopyEngine((strategy,)).copyFile(src, dst)))
+    try:
+        baseline = None
+        for label, run in runs:
+            best = None
+            used = None
+            for i in range(3):
+                start = time.perf_counter()
+                try:
+                    used = run()
+                except OSError as e:
+                    used = f"unsupported ({e.strerror})"
+                    break
+                finally:
+                    if os.path.exists(dst):
+                        os.unlink(dst)
+                elapsed = time.perf_counter() - start
+                best = min(best or elapsed, elapsed)
+            if best is None:
+                print(f"{label:<16} {used}")
+                continue
+            baseline = baseline or best
+            print(f"{label:<16} {best:8.3f} s {size / best / 1024 / 1024:10.1f} MB/s {baseline / best:6.2f}x")
+    finally:
+        os.unlink(src)
+
+
+def benchmarkVerify(directory=".", size_mb="512"):
+    # python main-0.0.4.py --bench-verify [directory] [size in MB]
+    # What verifying costs: the fastest plain copy, the read/write loop it has to fall back to, and read/write
+    # with the hash and the read back
+    src = os.path.join(directory, f".tanzanite-bench-{os.getpid()}")
+    dst = src + ".copy"
+    size = int(size_mb) * 1024 * 1024
+    with open(src, "wb") as f:
+        for offset in range(0, size, CopyEngine.BUFFER_SIZE):
+            f.write(os.urandom(min(CopyEngine.BUFFER_SIZE, size - offset)))
+    os.sync()
+    print(f"Copying {size_mb} MB within {os.path.abspath(directory)} (warm source cache, best of 3)")
+    runs = [("plain", CopyEngine), ("read/write", lambda: CopyEngine(("read/write",))),
+            ("verified", lambda: CopyEngine(verify=True))]
+    try:
+        best = {}
+        checking = {}
+        for i in range(3):
+            for label, engine_class in runs:
+                engine = engine_class()
+                start = time.perf_counter()
+                engine.copyFile(src, dst)
+                elapsed = time.perf_counter() - start
+                os.unlink(dst)
+                os.sync()
+                if elapsed < best.get(label, elapsed + 1):
+                    best[label] = elapsed
+                    checking[label] = engine.verify_time
+        baseline = best["plain"]
+        for label, engine_class in runs:
+            elapsed = best[label]
+            check = f"  {checking[label]:.3f} s of it reading back" if checking[label] else ""
+            print(f"{label:<12} {elapsed:8.3f} s {size / elapsed / 1024 / 1024:10.1f} MB/s "
+                  f"{(elapsed / baseline - 1) * 100:+7.1f}%{check}")
+    finally:
+        os.unlink(src)
+
+
+def benchmarkTreeCopy(directory=".", files="20000"):
+    # python main-0.0.4.py --bench-tree [directory] [number of files]
+    # Copies a generated tree of small files (like node_modules) with shutil.copytree and with the TreeCopier,
+    # run it once on an SSD folder and once on tmpfs (/dev/shm)
+    src = os.path.join(directory, f".tanzanite-bench-{os.getpid()}")
+    count = int(files)
+    for i in range(count):
+        folder = os.path.join(src, f"pkg{i // 1000}", f"lib{i // 50}")
+        if i % 50 == 0:
+            os.makedirs(folder)
+        with open(os.path.join(folder, f"file{i}.js"), "wb") as f:
+            f.write(os.urandom(1024 + i % 7 * 512))
+    # Dirty pages from the setup (and from earlier runs) would otherwise be written back during the next run
+    os.sync()
+    print(f"Copying {count} small files within {os.path.abspath(directory)} on {os.cpu_count()} CPUs "
+          f"(warm cache, best of 3)")
+    runs = [("shutil.copytree", lambda dst: shutil.copytree(src, dst))]
+    workers = 1
+    while workers <= min(32, (os.cpu_count() or 1) * 4):
+        runs.append((f"TreeCopier x{workers}", lambda dst, w=workers: TreeCopier(workers=w).copy(src, dst)))
+        workers *= 2
+    try:
+        # Rounds go over all the variants in turn, so a slow spell of the disk doesn't hit just one of them
+        best = {}
+        for i in range(3):
+            for label, run in runs:
+                dst = src + ".copy"
+                start = time.perf_counter()
+                run(dst)
+                elapsed = time.perf_counter() - start
+                shutil.rmtree(dst)
+                os.sync()
+                best[label] = min(best.get(label, elapsed), elapsed)
+        baseline = best[runs[0][0]]
+        for label, run in runs:
+            elapsed = best[label]
+            print(f"{label:<18} {elapsed:8.2f} s {count / elapsed:>10,.0f} files/s {baseline / elapsed:6.2f}x")
+    finally:
+        shutil.rmtree(src)
+
+
+BENCHMARKS = {
+    "--bench-walk": benchmarkWalk,
+    "--bench-copy": benchmarkCopy,
+    "--bench-tree": benchmarkTreeCopy,
+    "--bench-verify": benchmarkVerify,
+}
+
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in BENCHMARKS:
+        sys.exit(BENCHMARKS[sys.argv[1]](*sys.argv[2:]))
     app = QApplication(sys.argv)
     app.setStyleSheet(style_sheet)
     window = TanzFileManger()
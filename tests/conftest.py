@@ -0,0 +1,38 @@
+import errno
+import importlib.util
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main-0.0.4.py")
+
+
+@pytest.fixture(scope="session")
+def tanz(tmp_path_factory):
+    # The caches (index, folder sizes, transfer journal) go to a throwaway folder
+    os.environ["XDG_CACHE_HOME"] = str(tmp_path_factory.mktemp("cache"))
+    spec = importlib.util.spec_from_file_location("tanz", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["tanz"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def app(tanz):
+    return tanz.QApplication.instance() or tanz.QApplication([])
+
+
+@pytest.fixture
+def crossDevice(tanz, monkeypatch):
+    # Renames fail like they would between two filesystems, except the part file getting its real name
+    rename = os.rename
+
+    def fake(src, dst):
+        if not os.fspath(src).endswith(tanz.MoveEngine.PART_SUFFIX):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(src, dst)
+    monkeypatch.setattr(os, "rename", fake)
@@ -0,0 +1,67 @@
+import concurrent.futures
+import os
+import sys
+
+import pytest
+
+from conftest import MODULE_PATH
+
+
+@pytest.fixture
+def importable(tmp_path, monkeypatch):
+    # The pool's workers import the module again by name, it needs one they can import
+    (tmp_path / "modules").mkdir()
+    os.symlink(MODULE_PATH, tmp_path / "modules" / "tanz.py")
+    monkeypatch.setattr(sys, "path", [str(tmp_path / "modules"), *sys.path])
+
+
+def search(tanz, root):
+    worker = tanz.ContentSearchWorker("needle", str(root))
+    results, done = [], []
+    worker.resultsReady.connect(results.extend, tanz.Qt.ConnectionType.DirectConnection)
+    worker.done.connect(done.append, tanz.Qt.ConnectionType.DirectConnection)
+    worker.start()
+    worker.wait()
+    assert done == [False]
+    return results
+
+
+def test_content_search(tanz, app, tmp_path, importable):
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    (root / "notes.txt").write_text("nothing here\n")
+    (root / "sub" / "todo.txt").write_text("first\nfind the needle\nlast needle\n")
+    (root / "sub" / "binary.bin").write_bytes(b"\0needle")
+    assert search(tanz, root) == [(str(root / "sub" / "todo.txt"), [2, 3])]
+
+
+class BrokenPool:
+    # A pool whose worker died: the chunk in flight fails, the next submit raises
+    def __init__(self):
+        self.broken = False
+
+    def submit(self, *args):
+        if self.broken:
+            raise concurrent.futures.process.BrokenProcessPool("A worker died")
+        self.broken = True
+        future = concurrent.futures.Future()
+        future.set_exception(concurrent.futures.process.BrokenProcessPool("A worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_search_goes_on_after_the_pool_broke(tanz, app, tmp_path, importable, monkeypatch):
+    root = tmp_path / "tree"
+    root.mkdir()
+    (root / "todo.txt").write_text("find the needle\n")
+    start_pool = tanz.ContentSearchWorker.startPool
+
+    def startPool(worker):
+        if worker.pool is None:
+            worker.pool = BrokenPool()
+        else:
+            start_pool(worker)
+    monkeypatch.setattr(tanz.ContentSearchWorker, "startPool", startPool)
+    assert search(tanz, root) == [(str(root / "todo.txt"), [1])]
@@ -0,0 +1,74 @@
+import errno
+import os
+
+import pytest
+
+
+@pytest.mark.parametrize("strategy", ["copy_file_range", "sendfile", "read/write"])
+def test_copy_file(tanz, tmp_path, strategy):
+    data = os.urandom(300_000)
+    (tmp_path / "src").write_bytes(data)
+    engine = tanz.CopyEngine(strategies=(strategy,))
+    copied = []
+    strategy_used = engine.copyFile(str(tmp_path / "src"), str(tmp_path / "dst"),
+                                    progress=lambda size, written=None: copied.append(size))
+    assert strategy_used == strategy
+    assert (tmp_path / "dst").read_bytes() == data
+    assert sum(copied) == len(data)
+    assert (tmp_path / "dst").stat().st_mtime_ns == (tmp_path / "src").stat().st_mtime_ns
+
+
+def test_fallback_takes_back_its_progress(tanz, tmp_path):
+    data = os.urandom(300_000)
+    (tmp_path / "src").write_bytes(data)
+    engine = tanz.CopyEngine(strategies=("copy_file_range", "read/write"))
+
+    def halfway(src_fd, dst_fd, start, end, progress, should_stop):
+        # Gets half way before the filesystem turns out not to support it
+        os.write(dst_fd, os.pread(src_fd, (end - start) // 2, start))
+        progress((end - start) // 2)
+        raise OSError(errno.EOPNOTSUPP, "Not supported")
+    engine.methods["copy_file_range"] = halfway
+    copied, written = [], []
+
+    def progress(size, bytes_written=None):
+        copied.append(size)
+        written.append(size if bytes_written is None else bytes_written)
+    assert engine.copyFile(str(tmp_path / "src"), str(tmp_path / "dst"), progress=progress) == "read/write"
+    assert (tmp_path / "dst").read_bytes() == data
+    assert sum(copied) == sum(written) == len(data)
+
+
+def test_sparse_file_stays_sparse(tanz, tmp_path):
+    with open(tmp_path / "src", "wb") as f:
+        f.write(b"head")
+        f.seek(64 * 1024 * 1024)
+        f.write(b"tail")
+    if os.stat(tmp_path / "src").st_blocks * 512 >= 64 * 1024 * 1024:
+        pytest.skip("The filesystem doesn't keep holes")
+    tanz.CopyEngine().copyFile(str(tmp_path / "src"), str(tmp_path / "dst"))
+    assert os.stat(tmp_path / "dst").st_blocks * 512 < 1024 * 1024
+    with open(tmp_path / "dst", "rb") as f:
+        assert f.read(4) == b"head"
+        f.seek(64 * 1024 * 1024)
+        assert f.read() == b"tail"
+
+
+def test_verify_removes_a_bad_copy(tanz, tmp_path, monkeypatch):
+    (tmp_path / "src").write_bytes(b"x" * 1000)
+    engine = tanz.CopyEngine(verify=True)
+    check = engine.checkCopy
+    monkeypatch.setattr(engine, "checkCopy", lambda dst, extents, digest: check(dst, extents, b"not the digest"))
+    with pytest.raises(OSError):
+        engine.copyFile(str(tmp_path / "src"), str(tmp_path / "dst"))
+    assert not (tmp_path / "dst").exists()
+
+
+def test_walker_lists_everything(tanz, tmp_path):
+    for i in range(20):
+        (tmp_path / f"d{i}" / "sub").mkdir(parents=True)
+        (tmp_path / f"d{i}" / "sub" / "f").touch()
+    found = {path for directory, mtime, entries in tanz.ParallelWalker(str(tmp_path), workers=4, skip=set())
+             for path, name, is_dir in entries}
+    assert len(found) == 60
+    assert str(tmp_path / "d7" / "sub" / "f") in found
@@ -0,0 +1,42 @@
+import os
+import shutil
+
+import pytest
+
+
+def test_selection_counts_hard_links_once(tanz, app, tmp_path):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+    (tmp_path / "a" / "big.bin").write_bytes(b"x" * 1000)
+    os.link(tmp_path / "a" / "big.bin", tmp_path / "b" / "big.bin")
+    (tmp_path / "small.bin").write_bytes(b"x" * 10)
+    os.link(tmp_path / "small.bin", tmp_path / "a" / "small.bin")
+    paths = [str(tmp_path / name) for name in ("small.bin", "a", "b")]
+    thread = tanz.SelectionPropertiesThread(paths, tanz.DirSizeCache(str(tmp_path / "sizes.db")))
+    thread.start()
+    thread.wait()
+    assert thread.total_size == 1010
+
+
+def lookup(tanz, tmp_path, root):
+    items, total_size, folders = tanz.DirSizeCache(str(tmp_path / "sizes.db")).lookup(str(root))
+    return total_size
+
+
+def test_stored_sizes_are_reused(tanz, tmp_path, monkeypatch):
+    (tmp_path / "root" / "sub").mkdir(parents=True)
+    (tmp_path / "root" / "sub" / "a.bin").write_bytes(b"x" * 100)
+    os.link(tmp_path / "root" / "sub" / "a.bin", tmp_path / "root" / "a.bin")
+    assert lookup(tanz, tmp_path, tmp_path / "root") == 100
+    monkeypatch.setattr(tanz.DirSizeCache, "scanDirectory", staticmethod(lambda path: pytest.fail(path)))
+    assert lookup(tanz, tmp_path, tmp_path / "root") == 100
+
+
+def test_changed_folders_are_listed_again(tanz, tmp_path):
+    (tmp_path / "root" / "sub" / "deep").mkdir(parents=True)
+    (tmp_path / "root" / "sub" / "deep" / "a.bin").write_bytes(b"x" * 100)
+    assert lookup(tanz, tmp_path, tmp_path / "root") == 100
+    (tmp_path / "root" / "sub" / "deep" / "b.bin").write_bytes(b"x" * 10)
+    assert lookup(tanz, tmp_path, tmp_path / "root") == 110
+    shutil.rmtree(tmp_path / "root" / "sub" / "deep")
+    assert lookup(tanz, tmp_path, tmp_path / "root") == 0
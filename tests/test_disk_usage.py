@@ -0,0 +1,47 @@
+import os
+
+
+def scan(tanz, root):
+    thread = tanz.DiskUsageThread(str(root))
+    thread.start()
+    thread.wait()
+    return thread
+
+
+def makeFile(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+
+
+def test_folder_totals(tanz, app, tmp_path):
+    makeFile(tmp_path / "a" / "one.bin", 100)
+    makeFile(tmp_path / "a" / "b" / "two.bin", 200)
+    makeFile(tmp_path / "a" / "b" / "c" / "d" / "e" / "f" / "three.bin", 400)
+    (tmp_path / "empty").mkdir()
+    makeFile(tmp_path / "top.bin", 50)
+    # A hard link takes its space once
+    os.link(tmp_path / "a" / "one.bin", tmp_path / "a" / "b" / "link.bin")
+    thread = scan(tanz, tmp_path)
+    folders = {path: size for size, path in thread.folders}
+    assert folders[str(tmp_path / "a")] == 700
+    assert folders[str(tmp_path / "a" / "b")] == 600
+    assert folders[str(tmp_path / "a" / "b" / "c" / "d" / "e" / "f")] == 400
+    assert folders[str(tmp_path / "empty")] == 0
+    assert str(tmp_path) not in folders
+    assert thread.treemapItems(str(tmp_path)) == [(700, str(tmp_path / "a"), True), (50, str(tmp_path), False)]
+    assert thread.treemapItems(str(tmp_path / "a")) == [(600, str(tmp_path / "a" / "b"), True),
+                                                        (100, str(tmp_path / "a"), False)]
+
+
+def test_only_treemap_folders_are_kept(tanz, app, tmp_path, monkeypatch):
+    monkeypatch.setattr(tanz.DiskUsageThread, "TREEMAP_DEPTH", 2)
+    monkeypatch.setattr(tanz.DiskUsageThread, "TOP_N", 3)
+    for i in range(10):
+        makeFile(tmp_path / "a" / "b" / f"c{i}" / "file.bin", i + 1)
+    thread = scan(tanz, tmp_path)
+    assert set(thread.totals) == {str(tmp_path), str(tmp_path / "a"), str(tmp_path / "a" / "b")}
+    assert set(thread.own) == {str(tmp_path), str(tmp_path / "a")}
+    # Finished folders were rolled into their parents and dropped
+    assert thread.sizes == {} and thread.pending == {}
+    assert sorted(thread.folders, reverse=True) == [(55, str(tmp_path / "a" / "b")), (55, str(tmp_path / "a")),
+                                                    (10, str(tmp_path / "a" / "b" / "c9"))]
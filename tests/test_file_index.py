@@ -0,0 +1,201 @@
+import contextlib
+import errno
+import os
+import shutil
+import time
+
+import pytest
+
+from test_tree_copy import failListing
+
+
+@pytest.fixture
+def index(tanz, tmp_path):
+    root = tmp_path / "tree"
+    (root / "logs").mkdir(parents=True)
+    (root / "logs" / "app.log").write_bytes(b"x" * 1000)
+    file_index = tanz.FileIndex(str(tmp_path / "index.db"))
+    file_index.build(str(root))
+    return file_index, root
+
+
+def search(tanz, file_index, text):
+    query, clauses, params = tanz.parseSearchQuery(text)
+    return [path for path, is_dir in file_index.search(query, clauses=clauses, params=params)]
+
+
+def test_file_grown_in_place(tanz, index):
+    file_index, root = index
+    log = root / "logs" / "app.log"
+    log.write_bytes(b"x" * 2_000_000)
+    assert search(tanz, file_index, "app size:>1M") == []
+    file_index.applyChanges(paths=[str(log)])
+    assert search(tanz, file_index, "app size:>1M") == [str(log)]
+
+
+def test_rescan_refreshes_changed_files(tanz, index):
+    file_index, root = index
+    log = root / "logs" / "app.log"
+    log.write_bytes(b"x" * 2_000_000)
+    file_index.applyChanges(rescan=[str(root / "logs")])
+    assert search(tanz, file_index, "app size:>1M") == [str(log)]
+
+
+def test_watcher_sees_writes(tanz, app, index, monkeypatch):
+    file_index, root = index
+    monkeypatch.setattr(tanz.IndexWatcher, "FLUSH_INTERVAL", 0.1)
+    watcher = tanz.IndexWatcher(file_index)
+    watcher.start()
+    try:
+        deadline = time.monotonic() + 10
+        while str(root / "logs") not in watcher.path_wds and time.monotonic() < deadline:
+            time.sleep(0.05)
+        (root / "logs" / "app.log").write_bytes(b"x" * 2_000_000)
+        while not search(tanz, file_index, "app size:>1M") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert search(tanz, file_index, "app size:>1M") == [str(root / "logs" / "app.log")]
+    finally:
+        watcher.requestInterruption()
+        watcher.wait()
+
+
+def test_new_folders_are_entered_before_they_are_listed(tanz, index):
+    file_index, root = index
+    (root / "new" / "sub").mkdir(parents=True)
+
+    def enter(path):
+        # What the watch on a new folder has to catch: a file that shows up right after it was added
+        open(os.path.join(path, "late.txt"), "w").close()
+    file_index.applyChanges(paths=[str(root / "new")], on_enter=enter)
+    assert sorted(search(tanz, file_index, "late")) == [str(root / "new" / "late.txt"),
+                                                       str(root / "new" / "sub" / "late.txt")]
+
+
+def test_watcher_sees_files_in_new_folders(tanz, app, index, monkeypatch):
+    file_index, root = index
+    monkeypatch.setattr(tanz.IndexWatcher, "FLUSH_INTERVAL", 0.1)
+    watcher = tanz.IndexWatcher(file_index)
+    watcher.start()
+    try:
+        deadline = time.monotonic() + 10
+        while str(root / "logs") not in watcher.path_wds and time.monotonic() < deadline:
+            time.sleep(0.05)
+        (root / "logs" / "new" / "sub").mkdir(parents=True)
+        while str(root / "logs" / "new" / "sub") not in watcher.path_wds and time.monotonic() < deadline:
+            time.sleep(0.05)
+        (root / "logs" / "new" / "sub" / "trace.log").touch()
+        while not search(tanz, file_index, "trace") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert search(tanz, file_index, "trace") == [str(root / "logs" / "new" / "sub" / "trace.log")]
+    finally:
+        watcher.requestInterruption()
+        watcher.wait()
+
+
+def test_unreadable_folder_keeps_its_entries(tanz, index, monkeypatch):
+    file_index, root = index
+    failListing(monkeypatch, root / "logs")
+    file_index.applyChanges(rescan=[str(root / "logs")])
+    assert search(tanz, file_index, "app") == [str(root / "logs" / "app.log")]
+
+
+class BrokenEntry:
+    # A directory entry whose type can't be read, like one on a failing network mount
+    def __init__(self, entry):
+        self.path = entry.path
+        self.name = entry.name
+
+    def is_dir(self, follow_symlinks=True):
+        raise OSError(errno.EIO, "Input/output error", self.path)
+
+    def stat(self, follow_symlinks=True):
+        raise OSError(errno.EIO, "Input/output error", self.path)
+
+
+def test_unreadable_entry_is_skipped(tanz, index, monkeypatch):
+    file_index, root = index
+    (root / "logs" / "new.log").touch()
+    scandir = os.scandir
+
+    @contextlib.contextmanager
+    def fake(path):
+        with scandir(path) as it:
+            yield (BrokenEntry(entry) if entry.name == "app.log" else entry for entry in it)
+    monkeypatch.setattr(os, "scandir", fake)
+    file_index.applyChanges(rescan=[str(root / "logs")])
+    assert sorted(search(tanz, file_index, "log")) == [str(root / "logs"), str(root / "logs" / "app.log"),
+                                                      str(root / "logs" / "new.log")]
+
+
+def test_removed_folder_drops_its_entries(tanz, index):
+    file_index, root = index
+    shutil.rmtree(root / "logs")
+    file_index.applyChanges(rescan=[str(root / "logs")])
+    assert search(tanz, file_index, "app") == []
+
+
+@pytest.fixture
+def reports(tanz, tmp_path):
+    # More near matches than the fuzzy search takes as candidates
+    root = tmp_path / "reports"
+    root.mkdir()
+    for i in range(tanz.FileIndex.FUZZY_CANDIDATES + 3000):
+        (root / f"report_{i}.txt").touch()
+    file_index = tanz.FileIndex(str(tmp_path / "reports.db"))
+    return file_index, root
+
+
+def fuzzy(tanz, file_index, text, limit=100):
+    query, clauses, params = tanz.parseSearchQuery(text)
+    results, scored = file_index.fuzzySearch(query, limit, clauses, params)
+    return [path for score, path, is_dir in results]
+
+
+def test_fuzzy_filters_before_candidate_limit(tanz, reports):
+    file_index, root = reports
+    (root / "report.pdf").touch()
+    file_index.build(str(root))
+    assert search(tanz, file_index, "report ext:pdf") == [str(root / "report.pdf")]
+    assert fuzzy(tanz, file_index, "report ext:pdf") == [str(root / "report.pdf")]
+
+
+def test_rename_changes_extension(tanz, index):
+    file_index, root = index
+    old, new = root / "logs" / "out.txt", root / "logs" / "out.log"
+    old.touch()
+    file_index.applyChanges(paths=[str(old)])
+    old.rename(new)
+    file_index.applyChanges(moves=[(str(old), str(new))])
+    assert search(tanz, file_index, "out ext:log") == [str(new)]
+    assert search(tanz, file_index, "out ext:txt") == []
+
+
+def test_move_updates_depth(tanz, index):
+    file_index, root = index
+    deep = root / "logs" / "old" / "deep"
+    deep.mkdir(parents=True)
+    (deep / "trace.log").touch()
+    file_index.applyChanges(rescan=[str(root / "logs")])
+    (root / "logs" / "old").rename(root / "old")
+    file_index.applyChanges(moves=[(str(root / "logs" / "old"), str(root / "old"))])
+    depths = dict(file_index.connection().execute("SELECT path, depth FROM entries"))
+    for path in (root / "old", root / "old" / "deep", root / "old" / "deep" / "trace.log"):
+        assert depths[str(path)] == str(path).count("/")
+
+
+def test_fuzzy_exact_name_ranks_first(tanz, reports):
+    file_index, root = reports
+    (root / "report").touch()
+    file_index.build(str(root))
+    assert fuzzy(tanz, file_index, "report", limit=3)[0] == str(root / "report")
+    assert fuzzy(tanz, file_index, "REPORT", limit=3)[0] == str(root / "report")
+
+
+def test_fuzzy_finds_typos(tanz, reports):
+    file_index, root = reports
+    (root / "report.pdf").touch()
+    (root / "summary.pdf").touch()
+    file_index.build(str(root))
+    assert str(root / "report_7.txt") in fuzzy(tanz, file_index, "reprot", limit=tanz.FileIndex.FUZZY_CANDIDATES)
+    # Few enough rows pass the filter that they are all scored, with the same hits as the posting walk
+    assert fuzzy(tanz, file_index, "reprot ext:pdf") == [str(root / "report.pdf")]
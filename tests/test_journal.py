@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import types
+
+import pytest
+
+from test_tree_copy import makeTree
+
+
+@pytest.fixture
+def journal(tanz, tmp_path):
+    return tanz.TransferJournal(str(tmp_path / "transfers.db"))
+
+
+def runJob(tanz, journal, kind, pairs):
+    job_id = journal.addJob(kind, pairs)
+    job = tanz.TransferJob(kind, pairs, journal=tanz.FileJournal(journal, job_id))
+    job.start()
+    job.wait()
+    return job_id
+
+
+def test_discard_removes_what_the_copy_created(tanz, app, journal, tmp_path):
+    makeTree(tmp_path / "src")
+    (tmp_path / "file.txt").write_text("file")
+    pairs = [(str(tmp_path / "src"), str(tmp_path / "dst")), (str(tmp_path / "file.txt"), str(tmp_path / "copy.txt"))]
+    job_id = runJob(tanz, journal, tanz.TransferJob.COPY, pairs)
+    # What a crash leaves: a file cut short before its first checkpoint, never recorded on its own
+    (tmp_path / "dst" / "secret" / "cut.bin").write_bytes(b"half")
+    journal.discardJob(job_id)
+    assert not (tmp_path / "dst").exists()
+    assert not (tmp_path / "copy.txt").exists()
+    assert (tmp_path / "src" / "public" / "a.txt").exists()
+    assert journal.unfinishedJobs() == []
+
+
+def test_discard_keeps_moved_files(tanz, app, journal, tmp_path, crossDevice):
+    makeTree(tmp_path / "src")
+    job_id = runJob(tanz, journal, tanz.TransferJob.MOVE, [(str(tmp_path / "src"), str(tmp_path / "dst"))])
+    (tmp_path / "dst" / "empty").mkdir()
+    part = tanz.MoveEngine.partPath(str(tmp_path / "dst" / "public" / "b.txt"))
+    open(part, "w").close()
+    journal.discardJob(job_id)
+    assert (tmp_path / "dst" / "public" / "a.txt").exists()
+    assert not os.path.lexists(part)
+    assert not (tmp_path / "dst" / "empty").exists()
+
+
+def test_reused_pid_is_not_running(tanz, journal):
+    boot_id, started = tanz.TransferJournal.processIdentity(os.getpid())
+    assert tanz.TransferJournal.isRunning(os.getpid(), boot_id, started)
+    assert not tanz.TransferJournal.isRunning(os.getpid(), boot_id, started + 1)
+    assert not tanz.TransferJournal.isRunning(os.getpid(), "another boot", started)
+
+
+def test_job_of_a_process_that_is_gone_is_offered(tanz, journal):
+    job_id = journal.addJob("Copying", [("/a", "/b")])
+    journal.connection().execute("UPDATE jobs SET pid = 1, started = -1 WHERE id = ?", (job_id,))
+    journal.connection().commit()
+    assert [job[0] for job in journal.unfinishedJobs()] == [job_id]
+
+
+def test_journal_without_process_identity(tanz, tmp_path):
+    db = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, verify INTEGER NOT NULL DEFAULT 0, "
+                 "pid INTEGER)")
+    conn.execute("INSERT INTO jobs VALUES (1, 'Copying', 0, ?)", (2 ** 31 - 1,))
+    conn.commit()
+    conn.close()
+    assert [job[0] for job in tanz.TransferJournal(db).unfinishedJobs()] == [1]
+
+
+def test_claimed_job_is_not_offered(tanz, journal):
+    job_id = journal.addJob("Copying", [("/a", "/b")])
+    # This process has it
+    assert journal.unfinishedJobs() == []
+    assert not journal.claimJob(job_id)
+    journal.connection().execute("UPDATE jobs SET pid = 1, started = -1 WHERE id = ?", (job_id,))
+    journal.connection().commit()
+    assert journal.claimJob(job_id)
+    assert journal.unfinishedJobs() == []
+    assert not journal.claimJob(job_id)
+
+
+def test_smallest_journaled_file_is_checkpointed(tanz, journal, tmp_path):
+    (tmp_path / "src").write_bytes(b"s" * 1000)
+    (tmp_path / "dst").write_bytes(b"")
+    info = types.SimpleNamespace(st_size=tanz.TransferJournal.MIN_SIZE, st_mtime_ns=1)
+    job_id = journal.addJob("Copying", [(str(tmp_path / "src"), str(tmp_path / "dst"))])
+    src_fd, dst_fd = os.open(tmp_path / "src", os.O_RDONLY), os.open(tmp_path / "dst", os.O_WRONLY)
+    try:
+        track = tanz.FileJournal(journal, job_id).tracker(src_fd, dst_fd, info, str(tmp_path / "dst"), 0)
+        for _ in range(tanz.TransferJournal.CHECKPOINT_PARTS - 1):
+            track(info.st_size // tanz.TransferJournal.CHECKPOINT_PARTS)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+    entry = journal.fileEntry(job_id, str(tmp_path / "dst"))
+    assert entry[2] == info.st_size // tanz.TransferJournal.CHECKPOINT_PARTS * 3
@@ -0,0 +1,41 @@
+import os
+
+from test_tree_copy import failListing, makeTree
+
+
+def runMove(tanz, src, dst):
+    job = tanz.TransferJob(tanz.TransferJob.MOVE, [(str(src), str(dst))])
+    job.start()
+    job.wait()
+    return job
+
+
+def test_move_across(tanz, app, tmp_path, crossDevice):
+    makeTree(tmp_path / "src")
+    job = runMove(tanz, tmp_path / "src", tmp_path / "dst")
+    assert job.errors == []
+    assert not (tmp_path / "src").exists()
+    assert (tmp_path / "dst" / "secret" / "data.bin").read_bytes() == b"s" * 100
+    assert not [name for name in os.listdir(tmp_path / "dst" / "secret") if name.endswith(".tanz-part")]
+
+
+def test_unreadable_folder_stays_and_is_reported(tanz, app, tmp_path, crossDevice, monkeypatch):
+    makeTree(tmp_path / "src")
+    failListing(monkeypatch, tmp_path / "src" / "secret")
+    job = runMove(tanz, tmp_path / "src", tmp_path / "dst")
+    failed = [path for path, error in job.errors]
+    assert str(tmp_path / "src" / "secret") in failed
+    assert str(tmp_path / "src") in failed
+    assert (tmp_path / "src" / "secret" / "data.bin").exists()
+    assert not (tmp_path / "src" / "public").exists()
+
+
+def test_bad_copy_keeps_the_source(tanz, app, tmp_path, crossDevice, monkeypatch):
+    (tmp_path / "file.bin").write_bytes(b"x" * 1000)
+    check = tanz.CopyEngine.checkCopy
+    # What a copy corrupted on the way looks like
+    monkeypatch.setattr(tanz.CopyEngine, "checkCopy", lambda self, dst, extents, digest: check(self, dst, extents, b""))
+    job = runMove(tanz, tmp_path / "file.bin", tmp_path / "moved.bin")
+    assert [path for path, error in job.errors] == [str(tmp_path / "file.bin")]
+    assert (tmp_path / "file.bin").read_bytes() == b"x" * 1000
+    assert os.listdir(tmp_path) == ["file.bin"]
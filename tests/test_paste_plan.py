@@ -0,0 +1,42 @@
+from test_tree_copy import makeTree
+
+
+def makePlanner(tanz, tmp_path):
+    return tanz.PastePlanner(tanz.TransferManager(journal=tanz.TransferJournal(str(tmp_path / "transfers.db"))),
+                             size_cache=tanz.DirSizeCache(str(tmp_path / "sizes.db")))
+
+
+def test_plan_thread(tanz, app, tmp_path):
+    makeTree(tmp_path / "src")
+    (tmp_path / "dst" / "src").mkdir(parents=True)
+    thread = tanz.PastePlanThread(makePlanner(tanz, tmp_path), tanz.TransferJob.COPY,
+                                  [str(tmp_path / "src")], str(tmp_path / "dst"))
+    plans = []
+    thread.done.connect(plans.append, tanz.Qt.ConnectionType.DirectConnection)
+    thread.start()
+    thread.wait()
+    [item] = plans[0].items
+    assert item.action == tanz.PastePlanner.RENAME
+    assert item.dst == str(tmp_path / "dst" / "src (copy 1)")
+    assert item.size == sum(path.stat().st_size for path in (tmp_path / "src").rglob("*") if path.is_file())
+
+
+def test_stopped_plan(tanz, app, tmp_path):
+    makeTree(tmp_path / "src")
+    (tmp_path / "dst").mkdir()
+    planner = makePlanner(tanz, tmp_path)
+    assert planner.plan(tanz.TransferJob.COPY, [str(tmp_path / "src")], str(tmp_path / "dst"),
+                        should_stop=lambda: True) is None
+
+
+def test_job_takes_sizes_from_the_plan(tanz, app, tmp_path, monkeypatch):
+    makeTree(tmp_path / "src")
+    (tmp_path / "dst").mkdir()
+    plan = makePlanner(tanz, tmp_path).plan(tanz.TransferJob.COPY, [str(tmp_path / "src")], str(tmp_path / "dst"))
+    walked = []
+    monkeypatch.setattr(tanz.TransferJob, "treeSize", staticmethod(walked.append))
+    job = tanz.TransferJob(plan.kind, plan.pairs(), sizes=plan.sizes())
+    job.start()
+    job.wait()
+    assert walked == []
+    assert job.total == job.copied == plan.needed()
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+
+NOW = 1_700_000_000
+
+
+def test_name_and_filters(tanz):
+    query, clauses, params = tanz.parseSearchQuery("q3 report ext:pdf,.DOCX size:>10M type:dir depth:<4", NOW)
+    assert query == "q3 report"
+    assert clauses == ["ext IN (?,?)", "size > ?", "is_dir = 1", "depth < ?"]
+    assert params == ["pdf", "docx", 10 * 1024 ** 2, 4]
+
+
+def test_size_defaults_to_at_least(tanz):
+    assert tanz.parseSearchQuery("size:1.5k", NOW)[1:] == (["size >= ?"], [1536])
+
+
+def test_ages_and_dates(tanz):
+    assert tanz.parseSearchQuery("mtime:<7d", NOW)[1:] == (["mtime > ?"], [NOW - 7 * 86400])
+    assert tanz.parseSearchQuery("mtime:>2h", NOW)[1:] == (["mtime < ?"], [NOW - 2 * 3600])
+    day = time.mktime(time.strptime("2024-01-31", "%Y-%m-%d"))
+    assert tanz.parseSearchQuery("mtime:=2024-01-31", NOW)[1:] == (["mtime >= ? AND mtime < ?"], [day, day + 86400])
+
+
+def test_paths(tanz):
+    assert tanz.parseSearchQuery("path:/srv", NOW)[1:] == (["path >= ? AND path < ?"],
+                                                           list(tanz.FileIndex.subtreeRange("/srv")))
+    assert tanz.parseSearchQuery("path:logs", NOW)[1:] == (["instr(path, ?) > 0"], ["logs"])
+
+
+def test_whitespace_is_an_empty_query(tanz):
+    assert tanz.parseSearchQuery(" \t ", NOW) == ("", [], [])
+
+
+@pytest.mark.parametrize("text", ["size:>lots", "size:10Q", "type:pipe", "depth:<x", "mtime:=7d", "mtime:<yesterday"])
+def test_malformed_filters(tanz, text):
+    with pytest.raises(ValueError):
+        tanz.parseSearchQuery(text, NOW)
+
+
+@pytest.fixture
+def window(tanz, app, tmp_path):
+    (tmp_path / "tree").mkdir()
+    (tmp_path / "tree" / "report.txt").touch()
+    window = tanz.SearchWindow()
+    window.file_index = tanz.FileIndex(str(tmp_path / "index.db"))
+    window.file_index.build(str(tmp_path / "tree"))
+    yield window
+    window.stopSearch()
+
+
+def searchFor(app, window, text, typed=False):
+    window.search_edit.setText(text)
+    window.searchFileSystem(typed)
+    if window.search_worker is not None:
+        window.search_worker.wait()
+    # Results come in through queued signals
+    app.processEvents()
+    return window.search_results_model.names
+
+
+def test_emptied_search_clears_results(tanz, app, window):
+    assert searchFor(app, window, "report") == ["report.txt"]
+    assert searchFor(app, window, "  ", typed=True) == []
+    assert window.last_search is None
+
+
+def test_whitespace_search_finds_nothing(tanz, app, window):
+    assert searchFor(app, window, " \t") == []
+    assert window.search_worker is None
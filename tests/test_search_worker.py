@@ -0,0 +1,45 @@
+import itertools
+
+
+def connect(tanz, signal, slot):
+    # Collected on the worker thread as they are emitted
+    signal.connect(slot, tanz.Qt.ConnectionType.DirectConnection)
+
+
+def test_results_arrive_in_batches(tanz, app, tmp_path, monkeypatch):
+    monkeypatch.setattr(tanz.SearchWorker, "BATCH_SIZE", 8)
+    for i in range(50):
+        (tmp_path / f"match_{i}.txt").touch()
+        (tmp_path / f"other_{i}.txt").touch()
+    worker = tanz.SearchWorker("MATCH", root=str(tmp_path))
+    batches, progress, done = [], [], []
+    connect(tanz, worker.resultsReady, batches.append)
+    connect(tanz, worker.progress, lambda hits, scanned, rate: progress.append((hits, scanned)))
+    connect(tanz, worker.done, done.append)
+    worker.start()
+    worker.wait()
+    assert len(batches) > 1 and all(len(batch) <= 8 for batch in batches)
+    assert sorted(path for batch in batches for path, is_dir in batch) == \
+        sorted(str(tmp_path / f"match_{i}.txt") for i in range(50))
+    assert progress[-1] == (50, 100)
+    assert done == [False]
+
+
+def test_cancel_stops_the_walk(tanz, app, monkeypatch):
+    monkeypatch.setattr(tanz.SearchWorker, "BATCH_SIZE", 8)
+    walked = []
+
+    def endless(self):
+        # A disk too big to walk before the user gives up
+        for i in itertools.count():
+            walked.append(i)
+            yield f"match_{i}", f"/match_{i}", False
+    monkeypatch.setattr(tanz.SearchWorker, "entries", endless)
+    worker = tanz.SearchWorker("match")
+    done = []
+    connect(tanz, worker.resultsReady, lambda batch: worker.cancel())
+    connect(tanz, worker.done, done.append)
+    worker.start()
+    assert worker.wait(10000)
+    assert done == [True]
+    assert len(walked) <= 9
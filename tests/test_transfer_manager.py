@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def manager(tanz, app, tmp_path):
+    manager = tanz.TransferManager(journal=tanz.TransferJournal(str(tmp_path / "transfers.db")))
+    # Nothing starts until a test lets it
+    manager.MAX_ACTIVE = 0
+    yield manager
+    manager.cancelAll()
+
+
+def copyJob(tanz, manager, tmp_path, name):
+    (tmp_path / f"{name}.txt").write_text(name)
+    return manager.submit(tanz.TransferJob.COPY, [(str(tmp_path / f"{name}.txt"), str(tmp_path / f"{name}.copy"))])
+
+
+def journalJobs(manager):
+    return manager.journal.connection().execute("SELECT id FROM jobs").fetchall()
+
+
+def processUntil(app, condition, timeout=10):
+    # Job done signals reach the manager through the event loop
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_queue_runs_one_job_after_the_other(tanz, app, manager, tmp_path):
+    first, second = copyJob(tanz, manager, tmp_path, "first"), copyJob(tanz, manager, tmp_path, "second")
+    first.pause()
+    manager.MAX_ACTIVE = 1
+    manager.startQueued()
+    assert first.isRunning()
+    assert not first.wait(200)
+    assert not second.isRunning() and list(manager.queued) == [second]
+    first.resume()
+    # Finished jobs leave the journal
+    processUntil(app, lambda: not journalJobs(manager))
+    assert second.isDone()
+    assert (tmp_path / "first.copy").read_text() == "first"
+    assert (tmp_path / "second.copy").read_text() == "second"
+
+
+def test_paused_job_waits_before_the_first_file(tanz, app, manager, tmp_path):
+    job = copyJob(tanz, manager, tmp_path, "paused")
+    job.pause()
+    manager.MAX_ACTIVE = 1
+    manager.startQueued()
+    assert not job.wait(200)
+    assert not (tmp_path / "paused.copy").exists()
+    job.resume()
+    processUntil(app, job.isDone)
+    assert (tmp_path / "paused.copy").exists()
+
+
+def test_cancel_queued_job(tanz, app, manager, tmp_path):
+    job = copyJob(tanz, manager, tmp_path, "queued")
+    finished, cancelled = [], []
+    manager.jobFinished.connect(finished.append)
+    job.done.connect(cancelled.append)
+    job.cancel()
+    assert cancelled == [True] and finished == [job]
+    assert job.isDone()
+    assert journalJobs(manager) == []
+    assert manager.reservedNames(str(tmp_path)) == set()
+    manager.MAX_ACTIVE = 1
+    manager.startQueued()
+    assert not job.isRunning() and not manager.queued
+    assert not (tmp_path / "queued.copy").exists()
@@ -0,0 +1,56 @@
+import os
+
+
+def makeTree(root):
+    os.makedirs(root / "public")
+    os.makedirs(root / "secret")
+    (root / "public" / "a.txt").write_bytes(b"a" * 100)
+    (root / "secret" / "data.bin").write_bytes(b"s" * 100)
+
+
+def failListing(monkeypatch, path):
+    scandir = os.scandir
+
+    def fake(directory):
+        if os.fspath(directory) == os.fspath(path):
+            raise PermissionError(13, "Permission denied", os.fspath(directory))
+        return scandir(directory)
+    monkeypatch.setattr(os, "scandir", fake)
+
+
+def test_copy_tree(tanz, tmp_path):
+    makeTree(tmp_path / "src")
+    errors = []
+    tanz.TreeCopier(on_error=lambda path, error: errors.append(path)).copy(str(tmp_path / "src"),
+                                                                            str(tmp_path / "dst"))
+    assert errors == []
+    assert (tmp_path / "dst" / "secret" / "data.bin").read_bytes() == b"s" * 100
+
+
+def test_unreadable_folder_is_reported(tanz, tmp_path, monkeypatch):
+    makeTree(tmp_path / "src")
+    failListing(monkeypatch, tmp_path / "src" / "secret")
+    errors = []
+    tanz.TreeCopier(on_error=lambda path, error: errors.append((path, error))).copy(str(tmp_path / "src"),
+                                                                                     str(tmp_path / "dst"))
+    assert errors == [(str(tmp_path / "src" / "secret"), "Permission denied")]
+    assert (tmp_path / "dst" / "public" / "a.txt").exists()
+
+
+def test_special_files_are_reported(tanz, tmp_path):
+    makeTree(tmp_path / "src")
+    os.mkfifo(tmp_path / "src" / "pipe")
+    errors = []
+    tanz.TreeCopier(on_error=lambda path, error: errors.append(path)).copy(str(tmp_path / "src"),
+                                                                            str(tmp_path / "dst"))
+    assert errors == [str(tmp_path / "src" / "pipe")]
+    assert not (tmp_path / "dst" / "pipe").exists()
+
+
+def test_transfer_job_reports_unreadable_folder(tanz, app, tmp_path, monkeypatch):
+    makeTree(tmp_path / "src")
+    failListing(monkeypatch, tmp_path / "src" / "secret")
+    job = tanz.TransferJob(tanz.TransferJob.COPY, [(str(tmp_path / "src"), str(tmp_path / "dst"))])
+    job.start()
+    job.wait()
+    assert [path for path, error in job.errors] == [str(tmp_path / "src" / "secret")]
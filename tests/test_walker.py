@@ -0,0 +1,8 @@
+def test_walker_lists_everything(tanz, tmp_path):
+    for i in range(20):
+        (tmp_path / f"d{i}" / "sub").mkdir(parents=True)
+        (tmp_path / f"d{i}" / "sub" / "f").touch()
+    found = {path for directory, mtime, entries in tanz.ParallelWalker(str(tmp_path), workers=4, skip=set())
+             for path, name, is_dir in entries}
+    assert len(found) == 60
+    assert str(tmp_path / "d7" / "sub" / "f") in found